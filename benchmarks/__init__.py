@@ -0,0 +1,4 @@
+# -*- coding: utf-8 -*-
+__version__ = "0.1.0"
+__license__ = "GPLv3"
+__docformat__ = "reStructuredText"
@@ -0,0 +1,269 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmarks of the hot paths on synthetic sqlite fleets.
+
+    python3 -m benchmarks.suite --sizes 1000,10000 --output before.json
+    python3 -m benchmarks.suite --sizes 1000,10000 --compare before.json
+
+Results are seconds per metric and fleet size, as JSON.
+"""
+__version__ = "0.1.0"
+__license__ = "GPLv3"
+__docformat__ = "reStructuredText"
+
+import argparse
+import base64
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from ipaddress import ip_address, ip_network
+from pathlib import Path
+
+import peewee
+from wireguard_db.models.database import DBConnect
+from wireguard_db.models.export import WGExport
+from wireguard_db.models.importer import WGImport
+from wireguard_db.models.render import WGRender
+from wireguard_db.models.tables import WGData, WGRelation
+
+SIZES = (1000, 10000, 100000, 1000000)
+PEERS_PER_SERVER = 1000
+# the carrier-grade NAT range, room for 4M peers
+PEER_NETWORK = ip_network("100.64.0.0/10")
+# single row operations are timed over this many samples
+SAMPLES = 1000
+# a metric slower than the baseline by this factor is a regression
+THRESHOLD = 1.25
+
+STARTUP_PROBE = """
+import sys, time
+start = time.perf_counter()
+from wireguard_db.models.database import DBConnect
+DBConnect(("sqlite3", {"database": sys.argv[1], "connect": {}}))
+print(time.perf_counter() - start)
+"""
+
+
+def _key() -> str:
+    return base64.b64encode(os.urandom(32)).decode("ascii")
+
+
+def write_fleet(path: Path, peers: int, peers_per_server: int = PEERS_PER_SERVER) -> int:
+    """
+    Writes wg-quick configs of a synthetic fleet, one file per server
+    :param path: Path: directory to write to
+    :param peers: int: number of peers in total
+    :param peers_per_server: int: peers of each server
+    :returns: number of servers
+    :rtype: int
+    """
+    # peers take unique addresses of 100.64.0.0/10, servers a /24 each
+    if peers >= PEER_NETWORK.num_addresses - 1:
+        raise ValueError(f"{PEER_NETWORK} has no room for {peers} peers")
+
+    servers = max(1, -(-peers // peers_per_server))
+    first = int(PEER_NETWORK.network_address) + 1
+    for server in range(servers):
+        count = min(peers_per_server, peers - server * peers_per_server)
+        lines = [
+            "[Interface]",
+            f"# Name = server {server}",
+            f"Address = 10.{server // 256}.{server % 256}.1/24",
+            f"ListenPort = {51820 + server % 1000}",
+            f"PrivateKey = {_key()}",
+            "",
+        ]
+        for peer in range(count):
+            lines += [
+                "[Peer]",
+                f"# Name = peer {server}-{peer}",
+                f"PublicKey = {_key()}",
+                f"AllowedIPs = {ip_address(first + server * peers_per_server + peer)}/32",
+                "PersistentKeepalive = 25",
+                "",
+            ]
+        (path / f"wg{server}.conf").write_text("\n".join(lines), encoding="utf8")
+
+    return servers
+
+
+def _per_call(func, args: list) -> float:
+    """
+    Median seconds of func(arg) over the arguments
+    """
+    times = []
+    for arg in args:
+        start = time.perf_counter()
+        func(arg)
+        times.append(time.perf_counter() - start)
+
+    return statistics.median(times)
+
+
+def _timed(func) -> float:
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+
+def startup(database: str, repeat: int = 3) -> float:
+    """
+    Median seconds of importing and connecting DBConnect in a fresh interpreter
+    """
+    root = str(Path(__file__).resolve().parent.parent)
+    times = []
+    for _ in range(repeat):
+        result = subprocess.run(
+            [sys.executable, "-c", STARTUP_PROBE, database],
+            cwd=root, check=True, capture_output=True, text=True,
+        )
+        times.append(float(result.stdout))
+
+    return statistics.median(times)
+
+
+def run_size(peers: int, workdir: Path, peers_per_server: int = PEERS_PER_SERVER) -> dict:
+    """
+    Builds a fleet of a size and measures all metrics on it
+    :param peers: int: fleet size
+    :param workdir: Path: empty directory for the database and files
+    :param peers_per_server: int: peers of each server
+    :returns: metric -> seconds
+    :rtype: dict
+    """
+    configs = workdir / "configs"
+    configs.mkdir()
+    write_fleet(configs, peers, peers_per_server)
+
+    database = str(workdir / "wireguard.db")
+    connect = DBConnect(("sqlite3", {"database": database, "connect": {"journal_mode": "wal"}}))
+    results = {}
+    try:
+        results["import"] = _timed(lambda: WGImport().run(str(configs)))
+
+        servers = [row[0] for row in WGData.select(WGData.id).where(WGData.wg_listenport.is_null(False)).tuples()]
+        rows = list(WGData.select(WGData.id, WGData.wg_address).tuples())
+        rng = random.Random(peers)
+        sample = rng.sample(rows, min(SAMPLES, len(rows)))
+        server_sample = rng.sample(servers, min(10, len(servers)))
+
+        results["lookup_id"] = _per_call(WGData.get_by_id, [row_id for row_id, _ in sample])
+        results["lookup_address"] = _per_call(
+            lambda address: WGData.get(WGData.wg_address == address), [address for _, address in sample]
+        )
+        results["fanout_peers"] = _per_call(
+            lambda server: list(WGRelation.select(WGRelation.WGPeer).where(WGRelation.WGParent == server).tuples()),
+            server_sample,
+        )
+        results["fanout_parents"] = _per_call(
+            lambda peer: list(WGRelation.select(WGRelation.WGParent).where(WGRelation.WGPeer == peer).tuples()),
+            [row_id for row_id, _ in sample],
+        )
+        results["render_server"] = _per_call(lambda server: "".join(WGRender(server).server()), server_sample)
+        results["render_peers"] = _per_call(lambda server: list(WGRender(server).peers()), server_sample)
+
+        export = workdir / "export"
+        results["export_full"] = _timed(lambda: WGExport(export).run(servers))
+        results["export_unchanged"] = _timed(lambda: WGExport(export).run(servers))
+    finally:
+        connect.close()
+
+    results["startup"] = startup(database)
+    return results
+
+
+def _commit() -> str:
+    try:
+        result = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=str(Path(__file__).resolve().parent), check=True, capture_output=True, text=True,
+        )
+        return result.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(sizes=SIZES, peers_per_server: int = PEERS_PER_SERVER) -> dict:
+    """
+    Runs the suite for all fleet sizes
+    :param sizes: iterable of int: fleet sizes in peers
+    :param peers_per_server: int: peers of each server
+    :returns: dict with environment and results (size -> metric -> seconds)
+    :rtype: dict
+    """
+    report = {
+        "commit": _commit(),
+        "python": platform.python_version(),
+        "peewee": peewee.__version__,
+        "sqlite": sqlite3.sqlite_version,
+        "machine": platform.machine(),
+        "results": {},
+    }
+    for size in sizes:
+        with tempfile.TemporaryDirectory(prefix="wireguard_db-bench-") as workdir:
+            report["results"][str(size)] = run_size(size, Path(workdir), peers_per_server)
+
+    return report
+
+
+def compare(report: dict, baseline: dict, threshold: float = THRESHOLD) -> list:
+    """
+    Compares two reports metric by metric
+    :param report: dict: current results, as from run()
+    :param baseline: dict: earlier results
+    :param threshold: float: ratio from which a metric is a regression
+    :returns: list of (size, metric, baseline seconds, seconds, ratio, regression)
+    :rtype: list
+    """
+    rows = []
+    for size, metrics in report["results"].items():
+        for metric, seconds in metrics.items():
+            before = baseline.get("results", {}).get(size, {}).get(metric)
+            if not before:
+                continue
+            ratio = seconds / before
+            rows.append((size, metric, before, seconds, ratio, ratio > threshold))
+
+    return rows
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default=",".join(map(str, SIZES)), help="fleet sizes in peers, comma separated")
+    parser.add_argument("--peers-per-server", type=int, default=PEERS_PER_SERVER)
+    parser.add_argument("--output", help="write the JSON results to a file instead of stdout")
+    parser.add_argument("--compare", help="JSON results of a baseline, exits 1 on regressions")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD)
+    args = parser.parse_args(argv)
+
+    report = run([int(size) for size in args.sizes.split(",")], args.peers_per_server)
+
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2), encoding="utf8")
+    else:
+        print(json.dumps(report, indent=2))
+
+    if not args.compare:
+        return 0
+
+    baseline = json.loads(Path(args.compare).read_text(encoding="utf8"))
+    regressions = 0
+    for size, metric, before, seconds, ratio, regression in compare(report, baseline, args.threshold):
+        regressions += regression
+        print(
+            f"{size:>8} {metric:<18} {before:12.6f} {seconds:12.6f} {ratio:6.2f}{'  REGRESSION' if regression else ''}",
+            file=sys.stderr,
+        )
+
+    return 1 if regressions else 0
+
+
+if "__main__" == __name__:
+    sys.exit(main())
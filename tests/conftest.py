@@ -0,0 +1,17 @@
+import pytest
+
+# noinspection PyUnresolvedReferences
+from wireguard_db.models.database import DBConnect
+
+
+@pytest.fixture
+def db(tmp_path):
+
+    # a fresh sqlite file per test, bound to the models
+    connect = DBConnect(
+        ("sqlite3", {"database": str(tmp_path / "wireguard.db"), "connect": {}})
+    )
+
+    yield connect.get()
+
+    connect.close()
@@ -0,0 +1,104 @@
+import asyncio
+import threading
+import time
+
+# noinspection PyUnresolvedReferences
+from wireguard_db.models import aio
+
+# noinspection PyUnresolvedReferences
+from wireguard_db.models.aio import AsyncDBConnect
+
+# noinspection PyUnresolvedReferences
+from wireguard_db.models.tables import WGData, WGRelation
+
+
+def sqlite_setup(tmp_path) -> tuple:
+
+    pool = {"max_connections": 2, "wait_timeout": 10}
+    return "sqlite3", {"database": str(tmp_path / "wireguard.db"), "connect": {}, "pool": pool}
+
+
+def test_async_operations(tmp_path):
+
+    async def scenario():
+        async with AsyncDBConnect(sqlite_setup(tmp_path)) as db:
+            server = WGData(description="hub", wg_interface="wg0", wg_address="10.0.0.1/24")
+            await db.save(server)
+            inserted = await db.insert_many(
+                [
+                    {"description": f"peer {number}", "wg_address": f"10.0.0.{number + 2}/32",
+                     "wg_publickey": f"public-{number}"}
+                    for number in range(9)
+                ] + [{"description": "peer 9", "wg_address": "10.0.0.11/32"}]
+            )
+            await db.run(
+                lambda: WGRelation.insert_many(
+                    [{"WGParent": server.id, "WGPeer": server.id + number + 1} for number in range(10)]
+                ).execute()
+            )
+
+            peer = await db.get_peer("public-3")
+            peers = await db.list_peers(server.id)
+            server_config, peer_configs = await db.render("wg0")
+
+            return inserted, peer, peers, server_config, peer_configs
+
+    inserted, peer, peers, server_config, peer_configs = asyncio.run(scenario())
+
+    assert inserted == 10
+    assert peer.wg_address == "10.0.0.5/32"
+    assert WGData.get(WGData.description == "peer 9").is_enabled is True
+    assert len(peers) == 10
+    assert server_config.count("[Peer]") == 10
+    assert len(peer_configs) == 10
+
+
+def test_async_backpressure(tmp_path):
+
+    running = []
+    lock = threading.Lock()
+    state = {"now": 0, "max": 0}
+
+    def slow():
+        with lock:
+            state["now"] += 1
+            state["max"] = max(state["max"], state["now"])
+        time.sleep(0.01)
+        with lock:
+            state["now"] -= 1
+        running.append(threading.current_thread().name)
+
+    async def scenario():
+        db = AsyncDBConnect(sqlite_setup(tmp_path), max_pending=3)
+        await asyncio.gather(*(db.run(slow) for _ in range(50)))
+        await db.close()
+
+    asyncio.run(scenario())
+
+    assert len(running) == 50
+    assert state["max"] <= 2
+    assert len(set(running)) <= 2
+
+
+def test_async_start_runs_on_the_pool(tmp_path, monkeypatch):
+
+    threads = []
+    db_connect = aio.DBConnect
+
+    def connect(setup):
+        threads.append(threading.current_thread().name)
+        return db_connect(setup)
+
+    monkeypatch.setattr(aio, "DBConnect", connect)
+
+    async def scenario():
+        db = AsyncDBConnect(sqlite_setup(tmp_path))
+        assert db.connector is None
+        await asyncio.gather(db.start(), db.run(lambda: None), db.start())
+        connector = db.connector
+        await db.close()
+        return connector
+
+    assert asyncio.run(scenario()) is not None
+    assert len(threads) == 1
+    assert threads[0].startswith("wireguard_db")
@@ -0,0 +1,130 @@
+import random
+import threading
+from ipaddress import ip_address, ip_interface
+
+import pytest
+
+# noinspection PyUnresolvedReferences
+from wireguard_db.models.allocator import WGAllocator
+
+# noinspection PyUnresolvedReferences
+from wireguard_db.models.tables import WGData, WGRelation
+
+
+def make_server(address: str = "10.0.0.1/29") -> WGData:
+
+    server = WGData.create(description="hub", wg_interface="wg0", wg_address=address)
+    for number in (2, 4):
+        peer = WGData.create(description=f"peer {number}", wg_address=f"10.0.0.{number}/32")
+        WGRelation.create(WGParent=server, WGPeer=peer)
+
+    return server
+
+
+def test_allocate_skips_used(db):
+
+    make_server()
+    allocator = WGAllocator("wg0")
+
+    assert allocator.free == 3
+    assert allocator.peek() == "10.0.0.3/32"
+    assert allocator.allocate(3) == ["10.0.0.3/32", "10.0.0.5/32", "10.0.0.6/32"]
+    assert allocator.peek() is None
+    with pytest.raises(LookupError):
+        allocator.allocate()
+
+
+def test_reserve_and_release(db):
+
+    make_server()
+    allocator = WGAllocator("wg0")
+
+    allocator.reserve("10.0.0.3")
+    with pytest.raises(ValueError, match="is not free"):
+        allocator.reserve("10.0.0.3/32")
+
+    assert allocator.allocate() == ["10.0.0.5/32"]
+
+    allocator.release("10.0.0.3/32")
+    allocator.release("10.0.0.5/32")
+    assert allocator.free == 3
+    assert allocator.allocate(2) == ["10.0.0.3/32", "10.0.0.5/32"]
+
+
+def test_ipv6_subnet(db):
+
+    WGData.create(description="hub", wg_interface="wg6", wg_address="10.9.0.1/24, fd00::1/64")
+    allocator = WGAllocator("wg6", version=6)
+
+    assert allocator.allocate(2) == ["fd00::2/128", "fd00::3/128"]
+    assert allocator.free == 2 ** 64 - 4
+
+
+def test_concurrent_assign(db):
+
+    server = make_server("10.0.0.1/24")
+    allocators = [WGAllocator(server.id) for _ in range(4)]
+    errors = []
+
+    def provision(allocator):
+        try:
+            for number in range(10):
+                allocator.assign(WGData(description=f"new {number}", wg_address=""))
+        except Exception as error:  # pylint: disable=broad-except
+            errors.append(error)
+        finally:
+            db.close()
+
+    threads = [threading.Thread(target=provision, args=(allocator,)) for allocator in allocators]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    addresses = [
+        peer.wg_address
+        for peer in WGData.select().join(WGRelation, on=(WGRelation.WGPeer == WGData.id))
+    ]
+    assert not errors
+    assert len(addresses) == 42
+    assert len(set(addresses)) == 42
+
+
+
+def test_index_matches_a_plain_set(db):
+
+    WGData.create(description="hub", wg_interface="wg0", wg_address="10.0.0.1/22")
+    allocator = WGAllocator("wg0")
+    base = int(ip_address("10.0.0.0"))
+    free = set(range(base + 2, base + 1023))
+    rng = random.Random(5)
+
+    for _ in range(3000):
+        if free and rng.random() < 0.6:
+            assert int(ip_interface(allocator.allocate()[0]).ip) == min(free)
+            free.remove(min(free))
+        else:
+            value = rng.randrange(base + 2, base + 1023)
+            allocator.release(str(ip_address(value)))
+            free.add(value)
+
+        assert allocator.free == len(free)
+
+
+def test_failed_assign_releases_the_address(db, monkeypatch):
+
+    make_server()
+    allocator = WGAllocator("wg0")
+    peer = WGData(description="new", wg_address="")
+
+    def fail(*_, **__):
+
+        raise ValueError("no")
+
+    monkeypatch.setattr(peer, "save", fail)
+    with pytest.raises(ValueError):
+        allocator.assign(peer)
+
+    assert peer.wg_address == ""
+    assert allocator.free == 3
+    assert allocator.peek() == "10.0.0.3/32"
@@ -0,0 +1,28 @@
+# noinspection PyUnresolvedReferences
+from benchmarks import suite
+
+
+def test_suite_measures_small_fleet(tmp_path):
+
+    results = suite.run_size(50, tmp_path, peers_per_server=20)
+
+    assert set(results) >= {"import", "lookup_id", "render_server", "export_full", "startup"}
+    assert all(seconds >= 0 for seconds in results.values())
+
+    report = {"results": {"50": results}}
+    baseline = {"results": {"50": {"import": results["import"] / 2}}}
+    assert suite.compare(report, baseline) == [
+        ("50", "import", results["import"] / 2, results["import"], 2.0, True)
+    ]
+
+
+def test_fleet_addresses_are_unique(tmp_path):
+
+    assert suite.write_fleet(tmp_path, 50, peers_per_server=20) == 3
+
+    lines = [line for path in tmp_path.glob("*.conf") for line in path.read_text().splitlines()]
+    peers = [line for line in lines if line.startswith("AllowedIPs")]
+    servers = [line for line in lines if line.startswith("Address")]
+
+    assert len(set(peers)) == len(peers) == 50
+    assert len(set(servers)) == len(servers) == 3
@@ -0,0 +1,46 @@
+# noinspection PyUnresolvedReferences
+from wireguard_db.models.builder import WGMeshBuilder
+
+# noinspection PyUnresolvedReferences
+from wireguard_db.models.tables import WGData, WGRelation
+
+# noinspection PyUnresolvedReferences
+from wireguard_db.models.topology import WGTopology
+
+
+def make_nodes(count: int, **fields) -> list:
+
+    return [
+        WGData.create(description=f"node {number}", wg_address=f"10.0.0.{number + 1}/32", **fields)
+        for number in range(count)
+    ]
+
+
+def test_full_mesh_is_idempotent(db):
+
+    nodes = make_nodes(6)
+    WGRelation.create(WGParent=nodes[0], WGPeer=nodes[1])
+    builder = WGMeshBuilder(batch_size=7)
+
+    assert builder.full_mesh(nodes) == 6 * 5 - 1
+    assert WGRelation.select().count() == 30
+    assert builder.full_mesh(nodes) == 0
+    assert WGRelation.select().count() == 30
+
+
+def test_hub_and_spoke(db):
+
+    hub, *spokes = make_nodes(4)
+    topology = WGTopology(watch=False)
+
+    assert WGMeshBuilder(topology=topology).hub_and_spoke(hub, spokes) == 3
+    assert topology.peers(hub.id) == tuple(spoke.id for spoke in spokes)
+
+
+def test_partial_mesh_by_host(db):
+
+    make_nodes(3, host_id=1)
+    make_nodes(2, host_id=2)
+
+    assert WGMeshBuilder().partial_mesh(host_id=1) == 6
+    assert WGRelation.select().count() == 6
@@ -0,0 +1,131 @@
+# noinspection PyUnresolvedReferences
+from wireguard_db.models.tables import timestamp, WGChange, WGData, WGRelation
+
+# noinspection PyUnresolvedReferences
+from wireguard_db.models.builder import WGMeshBuilder
+
+# noinspection PyUnresolvedReferences
+from wireguard_db.models.changes import WGChangeFeed
+
+OLD = "2020-01-01 00:00:00"
+
+
+def make_fleet() -> tuple:
+
+    hubs = [
+        WGData.create(description=f"hub {number}", wg_address=f"10.{number}.0.1/24", wg_interface=f"wg{number}")
+        for number in range(2)
+    ]
+    peers = []
+    for hub in hubs:
+        for number in range(3):
+            peer = WGData.create(description=f"peer {number}", wg_address=f"10.{hub.id}.0.{number + 2}/32")
+            WGRelation.create(WGParent=hub, WGPeer=peer)
+            peers.append(peer)
+
+    return hubs, peers
+
+
+def test_timestamps_are_per_row(db):
+
+    assert WGData.updated.default is timestamp
+    assert WGRelation.created.default is timestamp
+
+    row = WGData.create(description="new", wg_address="10.9.0.1/32")
+    assert str(WGData.get_by_id(row.id).updated) > OLD
+
+
+def test_feed_reports_changes_since_cursor(db):
+
+    hubs, peers = make_fleet()
+    start = WGChangeFeed.head()
+    feed = WGChangeFeed(start)
+    assert feed.changes()["rows"] == []
+
+    peers[0].description = "changed"
+    peers[0].save()
+    relation = WGRelation.get(WGRelation.WGPeer == peers[4])
+    relation.delete_instance()
+
+    changes = feed.changes()
+    assert [row["id"] for row in changes["rows"]] == [peers[0].id]
+    assert changes["tombstones"] == [("WGRelation", relation.id, hubs[1].id)]
+    assert changes["cursor"] == start + 2
+    assert WGChangeFeed.interfaces(changes) == ({hubs[0].id, hubs[1].id}, set())
+
+
+def test_feed_sees_a_late_commit(db):
+
+    hubs, peers = make_fleet()
+    feed = WGChangeFeed(WGChangeFeed.head())
+
+    peers[0].description = "early id, late commit"
+    peers[0].save()
+    peers[4].description = "late id, early commit"
+    peers[4].save()
+
+    # the first change is not committed yet when the feed reads
+    late = WGChange.select().where(WGChange.id > feed.cursor).order_by(WGChange.id).first()
+    entry = late.__data__.copy()
+    late.delete_instance()
+
+    changes = feed.changes()
+    feed.advance(changes)
+    assert [row["id"] for row in changes["rows"]] == [peers[4].id]
+    assert feed.gaps == (entry["id"],)
+
+    WGChange.insert(entry).execute()
+    changes = feed.changes()
+    feed.advance(changes)
+    assert [row["id"] for row in changes["rows"]] == [peers[0].id]
+    assert WGChangeFeed.interfaces(changes)[0] == {hubs[0].id}
+    assert feed.gaps == ()
+
+
+def test_feed_drops_gaps_after_the_timeout(db):
+
+    make_fleet()
+    feed = WGChangeFeed(WGChangeFeed.head(), gap_timeout=0.0)
+    row = WGData.create(description="rolled back", wg_address="10.8.0.1/32")
+    WGData.create(description="kept", wg_address="10.8.0.2/32")
+    WGChange.delete().where(WGChange.row_id == row.id).execute()
+
+    feed.advance(feed.changes())
+    assert len(feed.gaps) == 1
+
+    feed.advance(feed.changes())
+    assert feed.gaps == ()
+
+
+def test_feed_sees_bulk_edges(db):
+
+    hubs, peers = make_fleet()
+    spare = WGData.create(description="spare", wg_address="10.7.0.1/32")
+    feed = WGChangeFeed(WGChangeFeed.head())
+
+    WGMeshBuilder().hub_and_spoke(hubs[0], [spare])
+
+    changes = feed.changes()
+    assert changes["relations"] == [(None, hubs[0].id)]
+    assert WGChangeFeed.interfaces(changes) == ({hubs[0].id}, set())
+
+
+def test_regenerate_renders_touched_interfaces_only(db):
+
+    hubs, peers = make_fleet()
+    feed = WGChangeFeed(WGChangeFeed.head())
+    rendered, removed = [], []
+
+    peers[4].wg_persistentkeepalive = 25
+    peers[4].save()
+    stats = feed.regenerate(lambda render: rendered.append(render.server_row["id"]), removed.append)
+    assert stats == {"rendered": 1, "removed": 0}
+    assert rendered == [hubs[1].id]
+
+    # deleting a server removes its config, its peers' relations go along
+    hubs[0].delete_instance(recursive=True)
+    feed.regenerate(lambda render: rendered.append(render.server_row["id"]), removed.append)
+    assert removed == [hubs[0].id]
+    logged = WGChange.select().count()
+    assert WGChangeFeed.purge("2999-01-01 00:00:00") == logged
+    assert WGChange.select().count() == 0
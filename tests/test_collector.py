@@ -0,0 +1,89 @@
+# noinspection PyUnresolvedReferences
+from wireguard_db.models.tables import WGData, WGPeerState, WGTraffic
+
+# noinspection PyUnresolvedReferences
+from wireguard_db.models.collector import WGCollector
+
+# noinspection PyUnresolvedReferences
+from wireguard_db.models.traffic import WGTrafficStore
+
+# noinspection PyUnresolvedReferences
+from wireguard_db.utils.parser import parse_dump
+
+NOW = 1700000000
+DUMP = (
+    "wg0\tcHJpdmF0ZQ==\tc2VydmVy\t51820\toff\n"
+    f"wg0\tcGVlcjE=\t(none)\t192.0.2.1:51820\t10.0.0.2/32\t{NOW - 10}\t1000\t2000\t25\n"
+    "wg0\tcGVlcjI=\t(none)\t(none)\t10.0.0.3/32\t0\t0\t0\toff\n"
+    f"wg0\tdW5rbm93bg==\t(none)\t(none)\t10.0.0.9/32\t{NOW}\t1\t1\toff\n"
+)
+
+
+def test_parse_dump_skips_interfaces():
+
+    peers = list(parse_dump(DUMP))
+
+    assert len(peers) == 3
+    assert peers[0]["endpoint"] == "192.0.2.1:51820"
+    assert peers[0]["keepalive"] == 25
+    assert peers[1]["endpoint"] is None
+    assert peers[1]["keepalive"] is None
+
+
+def test_scrape_upserts_state(db):
+
+    first = WGData.create(description="peer 1", wg_address="10.0.0.2/32", wg_publickey="cGVlcjE=")
+    second = WGData.create(description="peer 2", wg_address="10.0.0.3/32", wg_publickey="cGVlcjI=")
+    collector = WGCollector()
+    try:
+        stats = collector.scrape(DUMP, now=NOW)
+        assert stats == {"peers": 3, "matched": 2, "unknown": 1, "connected": 1}
+
+        state = WGPeerState.get(WGPeerState.peer == first.id)
+        assert (state.rx, state.tx, state.endpoint, state.is_connected) == (1000, 2000, "192.0.2.1:51820", True)
+        assert WGPeerState.get(WGPeerState.peer == second.id).handshake is None
+        assert WGData.get_by_id(first.id).is_connected is True
+
+        # the next scrape updates in place, the handshake got too old
+        collector.scrape(DUMP.replace("\t1000\t2000\t", "\t5000\t6000\t"), now=NOW + 600)
+        assert WGPeerState.select().count() == 2
+        state = WGPeerState.get(WGPeerState.peer == first.id)
+        assert (state.rx, state.is_connected) == (5000, False)
+        assert WGData.get_by_id(first.id).is_connected is False
+
+        # a row created later is found, the unknown key is looked up again
+        WGData.create(description="late", wg_address="10.0.0.9/32", wg_publickey="dW5rbm93bg==")
+        assert collector.scrape(DUMP, now=NOW)["unknown"] == 0
+    finally:
+        collector.close()
+
+
+def test_scrape_feeds_traffic(db):
+
+    peer = WGData.create(description="peer 1", wg_address="10.0.0.2/32", wg_publickey="cGVlcjE=")
+    collector = WGCollector(watch=False, traffic=WGTrafficStore())
+
+    collector.scrape(DUMP, now=NOW)
+    collector.scrape(DUMP.replace("\t1000\t2000\t", "\t1500\t2600\t"), now=NOW + 20)
+
+    row = WGTraffic.get(WGTraffic.peer_id == peer.id)
+    assert (row.bucket, row.rx, row.tx) == (NOW + 20, 500, 600)
+
+
+def test_scrape_writes_a_repeated_key_once(db):
+
+    peer = WGData.create(description="peer 1", wg_address="10.0.0.2/32", wg_publickey="cGVlcjE=")
+    dump = DUMP + f"wg1\tcGVlcjE=\t(none)\t198.51.100.1:51820\t10.0.0.2/32\t{NOW - 5}\t7\t8\toff\n"
+    collector = WGCollector()
+    try:
+        assert collector.scrape(dump, now=NOW)["matched"] == 2
+        state = WGPeerState.get(WGPeerState.peer == peer.id)
+        assert (state.interface, state.rx) == ("wg1", 7)
+
+        # a changed key is forgotten, the new one is looked up
+        peer.wg_publickey = "cGVlcjI="
+        peer.save()
+        assert collector.scrape(DUMP, now=NOW)["matched"] == 1
+        assert WGPeerState.get(WGPeerState.peer == peer.id).interface == "wg0"
+    finally:
+        collector.close()
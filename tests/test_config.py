@@ -1,3 +1,4 @@
+import os
 from pathlib import Path
 import pytest
 
@@ -68,3 +69,88 @@ def test_mysql_db_config():
     setup = DBConfig().read()
 
     assert f"{adapter}" not in setup[0]
+
+
+def test_read_is_cached_and_immutable(tmp_path):
+
+    filename = tmp_path / "wireguard.yaml"
+    filename.write_text("sqlite3:\n    database: /tmp/first.db\n    connect: {}\n")
+
+    setup = DBConfig().read(config_file=str(filename))
+
+    assert setup == DBConfig().read(config_file=str(filename))
+    with pytest.raises(TypeError):
+        setup[1]["database"] = "/tmp/other.db"
+
+
+def test_read_sees_changes(tmp_path):
+
+    filename = tmp_path / "wireguard.yaml"
+    filename.write_text("sqlite3:\n    database: /tmp/first.db\n    connect: {}\n")
+    config = DBConfig()
+    config.read(config_file=str(filename))
+
+    changed = []
+    DBConfig.watch(changed.append)
+    try:
+        filename.write_text("sqlite3:\n    database: /tmp/second-file.db\n    connect: {}\n")
+        setup = config.read()
+    finally:
+        DBConfig.unwatch(changed.append)
+
+    assert setup[1]["database"] == "/tmp/second-file.db"
+    assert changed == [str(filename)]
+
+
+def test_reload_bypasses_cache(tmp_path):
+
+    filename = tmp_path / "wireguard.yaml"
+    filename.write_text("sqlite3:\n    database: /tmp/first.db\n    connect: {}\n")
+    config = DBConfig()
+    config.read(config_file=str(filename))
+    stat = filename.stat()
+
+    # same size and mtime, only a reload notices
+    filename.write_text("sqlite3:\n    database: /tmp/other.db\n    connect: {}\n")
+    os.utime(str(filename), ns=(stat.st_atime_ns, stat.st_mtime_ns))
+
+    assert config.read()[1]["database"] == "/tmp/first.db"
+    assert config.reload()[1]["database"] == "/tmp/other.db"
+
+
+def test_replicas_are_validated(tmp_path):
+
+    filename = tmp_path / "wireguard.yaml"
+    filename.write_text(
+        "sqlite3:\n    database: /tmp/first.db\n    connect: {}\n"
+        "    replicas:\n        - database: /tmp/replica.db\n"
+    )
+
+    setup = DBConfig().read(config_file=str(filename), reload=True)
+    assert setup[1]["replicas"][0]["database"] == "/tmp/replica.db"
+    assert setup[1]["routing"] == "round_robin"
+
+    filename.write_text(
+        "sqlite3:\n    database: /tmp/first.db\n    connect: {}\n"
+        "    replicas:\n        - database: /tmp/replica.db\n    routing: random\n"
+    )
+    with pytest.raises(ValueError):
+        DBConfig().read(config_file=str(filename), reload=True)
+
+
+def test_read_shards(tmp_path):
+
+    filename = tmp_path / "wireguard.yaml"
+    filename.write_text(
+        "sqlite3:\n    database: /tmp/first.db\n    connect:\n        journal_mode: wal\n"
+        "shards:\n    databases:\n"
+        "        eu:\n            adapter: sqlite3\n            database: /tmp/eu.db\n"
+        "        us:\n            adapter: sqlite3\n            database: /tmp/us.db\n"
+        "            connect:\n                foreign_keys: 1\n"
+    )
+
+    key, shards = DBConfig().read_shards(config_file=str(filename))
+    assert key == "host_id"
+    assert list(shards) == ["eu", "us"]
+    assert shards["eu"] == ("sqlite3", {"database": "/tmp/eu.db", "connect": {"journal_mode": "wal"}})
+    assert shards["us"][1]["connect"] == {"journal_mode": "wal", "foreign_keys": 1}
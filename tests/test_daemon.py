@@ -0,0 +1,141 @@
+import socket
+import threading
+import time
+import pytest
+from peewee import OperationalError
+
+# noinspection PyUnresolvedReferences
+from wireguard_db.models.tables import WGData, WGRelation
+
+# noinspection PyUnresolvedReferences
+from wireguard_db.models.render import WGRender
+
+# noinspection PyUnresolvedReferences
+from wireguard_db.models.daemon import WGDaemon
+
+# noinspection PyUnresolvedReferences
+from wireguard_db.models.client import WGClient
+
+
+@pytest.fixture
+def served(db, tmp_path):
+
+    path = str(tmp_path / "daemon.sock")
+    daemon = WGDaemon(path, poll=0.0)
+    thread = threading.Thread(target=daemon.serve_forever, daemon=True)
+    thread.start()
+
+    client = WGClient(path)
+    for _ in range(100):
+        try:
+            client.request("ping")
+            break
+        except OSError:
+            client.close()
+            threading.Event().wait(0.01)
+
+    yield daemon, client
+
+    client.close()
+    daemon.shutdown()
+    thread.join()
+
+
+def make_server() -> tuple:
+
+    server = WGData.create(
+        description="hub", wg_interface="wg0", wg_address="10.0.0.1/24", wg_listenport=51820, wg_publickey="hub="
+    )
+    peer = WGData.create(description="laptop", wg_address="10.0.0.2/32", wg_publickey="laptop=")
+    WGRelation.create(WGParent=server, WGPeer=peer)
+    return server, peer
+
+
+def test_daemon_answers_requests(served):
+
+    _, client = served
+    server, peer = make_server()
+
+    assert client.request("ping") == "pong"
+    assert client.render("wg0") == "".join(WGRender("wg0").server())
+    assert client.render(server.id) == client.render("wg0")
+    assert [row["id"] for row in client.peers("wg0")] == [peer.id]
+    assert client.peer("laptop=")["description"] == "laptop"
+
+    with pytest.raises(LookupError):
+        client.render("wg9")
+    with pytest.raises(LookupError):
+        client.peer("unknown=")
+    with pytest.raises(ValueError):
+        client.request("drop", "table")
+
+    stats = client.request("stats")
+    assert stats["errors"] == 3
+    assert stats["hits"] == 1
+
+
+def test_daemon_drops_changed_configs(served):
+
+    _, client = served
+    _, peer = make_server()
+
+    assert "10.9.0.0/16" not in client.render("wg0")
+    assert client.peer("laptop=")["description"] == "laptop"
+
+    peer.description = "phone"
+    peer.wg_allowedips = "10.9.0.0/16"
+    peer.save()
+    assert "10.9.0.0/16" in client.render("wg0")
+    assert client.peer("laptop=")["description"] == "phone"
+    assert [row["description"] for row in client.peers("wg0")] == ["phone"]
+
+
+def test_daemon_survives_bad_lines(served):
+
+    daemon, client = served
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as raw:
+        raw.settimeout(5)
+        raw.connect(daemon._path)
+        raw.sendall(b"\xff\xfe\n")
+        answer = raw.makefile("rb").readline()
+
+    assert b'"ok": false' in answer
+    assert client.request("ping") == "pong"
+
+
+def test_daemon_survives_database_errors(served, monkeypatch):
+
+    daemon, client = served
+    make_server()
+    changes = daemon._feed.changes
+
+    def locked(*_):
+
+        raise OperationalError("database is locked")
+
+    monkeypatch.setattr(daemon._feed, "changes", locked)
+    with pytest.raises(ValueError, match="database is locked"):
+        client.render("wg0")
+
+    monkeypatch.setattr(daemon._feed, "changes", changes)
+    assert "[Interface]" in client.render("wg0")
+    assert client.request("stats")["errors"] == 1
+
+
+def test_slow_reader_does_not_hold_up_others(served):
+
+    daemon, client = served
+    make_server()
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as slow:
+        slow.connect(daemon._path)
+        # far more answers than the socket buffers, none of them read
+        slow.sendall(b"stats\n" * 5000)
+
+        started = time.monotonic()
+        assert client.request("ping") == "pong"
+        assert time.monotonic() - started < 1.0
+
+        answers = slow.makefile("rb")
+        assert all(b'"ok": true' in answers.readline() for _ in range(5000))
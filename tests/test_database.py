@@ -0,0 +1,164 @@
+import threading
+
+import pytest
+
+# noinspection PyUnresolvedReferences
+from wireguard_db.models.config import DBConfig
+
+# noinspection PyUnresolvedReferences
+from wireguard_db.models.database import DBConnect
+
+# noinspection PyUnresolvedReferences
+from wireguard_db.models.tables import WGData
+
+
+def sqlite_setup(tmp_path, **adapter_param) -> tuple:
+
+    adapter_param.setdefault("database", str(tmp_path / "wireguard.db"))
+    adapter_param.setdefault("connect", {})
+    return "sqlite3", adapter_param
+
+
+def test_no_pool_stats_without_pool(tmp_path):
+
+    connect = DBConnect(sqlite_setup(tmp_path))
+
+    assert connect.pool_stats is None
+
+
+def test_pool_reuses_connections(tmp_path):
+
+    pool = {"max_connections": 2, "wait_timeout": 10}
+    connect = DBConnect(sqlite_setup(tmp_path, pool=pool))
+    db = connect.get()
+    db.close()
+
+    errors = []
+
+    def worker():
+        try:
+            for _ in range(20):
+                with db.connection_context():
+                    WGData.select().count()
+        except Exception as error:  # pylint: disable=broad-except
+            errors.append(error)
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    stats = connect.pool_stats
+    assert not errors
+    assert stats["opened"] <= 2
+    assert stats["in_use"] == 0
+    assert stats["idle"] == stats["opened"]
+    assert stats["max_connections"] == 2
+
+
+def test_pool_config_is_validated(tmp_path):
+
+    config = tmp_path / "wireguard.yaml"
+    config.write_text(
+        "sqlite3:\n"
+        "    database: /tmp/wireguard.db\n"
+        "    pool:\n"
+        "        max_connection: 4\n"
+    )
+
+    with pytest.raises(ValueError, match=r'"pool" key "max_connection" not implemented'):
+        DBConfig().read(config_file=str(config))
+
+
+def test_schema_marker_skips_ddl(tmp_path, monkeypatch):
+
+    # noinspection PyUnresolvedReferences
+    from wireguard_db.models import schema
+
+    setup = sqlite_setup(tmp_path)
+    DBConnect(setup).close()
+
+    marker = schema.WGSchema.select().first()
+    assert marker.version == schema.SCHEMA_VERSION
+    assert marker.schema_hash == schema.schema_hash()
+
+    statements = []
+    connect = DBConnect(setup)
+    execute_sql = connect.get().obj.execute_sql
+
+    def recording(sql, *args, **kwargs):
+        statements.append(sql)
+        return execute_sql(sql, *args, **kwargs)
+
+    monkeypatch.setattr(connect.get().obj, "execute_sql", recording)
+    connect.check(force=True)
+
+    assert len(statements) == 1
+    assert statements[0].startswith("SELECT")
+
+
+def test_schema_migrates_old_version(tmp_path):
+
+    # noinspection PyUnresolvedReferences
+    from wireguard_db.models import schema
+
+    # noinspection PyUnresolvedReferences
+    from wireguard_db.models.tables import database
+
+    setup = sqlite_setup(tmp_path)
+    DBConnect(setup).close()
+
+    # back to the tables of version 1, wgdata_updated is left in place as
+    # by a migration stopped halfway
+    connect = DBConnect(setup)
+    for sql in (
+        "DROP INDEX wgdata_import_batch",
+        "ALTER TABLE WGData DROP COLUMN import_batch",
+        "DROP INDEX wgrelation_created",
+        "DROP INDEX wgdata_wg_publickey",
+        "DROP TABLE WGKeyPool",
+        "DROP TABLE WGChange",
+        "CREATE TABLE WGTombstone (id INTEGER PRIMARY KEY)",
+        "DROP TABLE WGPeerState",
+        "DROP TABLE WGTraffic",
+        "DROP TABLE WGShardMap",
+    ):
+        database.execute_sql(sql)
+    schema.WGSchema.update(version=1, schema_hash="old").execute()
+
+    connect.check(force=True)
+
+    indexes = {meta.name.lower() for meta in database.get_indexes("WGData")}
+    marker = schema.WGSchema.select().order_by(schema.WGSchema.id.desc()).first()
+    assert "import_batch" in {meta.name for meta in database.get_columns("WGData")}
+    assert len(indexes) == len(database.get_indexes("WGData"))
+    assert {"wgdata_updated", "wgdata_wg_publickey", "wgdata_import_batch"} <= indexes
+    assert "wgrelation_created" in {meta.name for meta in database.get_indexes("WGRelation")}
+    for table in ("WGKeyPool", "WGChange", "WGPeerState", "WGTraffic", "WGShardMap"):
+        assert database.table_exists(table)
+    assert not database.table_exists("WGTombstone")
+    assert marker.version == schema.SCHEMA_VERSION
+    assert marker.schema_hash == schema.schema_hash()
+
+
+def test_schema_check_tells_hosts_apart():
+
+    # noinspection PyUnresolvedReferences
+    from peewee import PostgresqlDatabase
+
+    # noinspection PyUnresolvedReferences
+    from wireguard_db.models import schema
+
+    # noinspection PyUnresolvedReferences
+    from wireguard_db.models.tables import database
+
+    keys = set()
+    for host in ("db1", "db2"):
+        previous = database.override(PostgresqlDatabase("wgdb", host=host, port=5432))
+        try:
+            keys.add(schema._database_key())
+        finally:
+            database.override(previous)
+
+    assert len(keys) == 2
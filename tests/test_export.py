@@ -0,0 +1,80 @@
+import os
+
+# noinspection PyUnresolvedReferences
+from wireguard_db.models.tables import WGData, WGRelation
+
+# noinspection PyUnresolvedReferences
+from wireguard_db.models.constants import EXPORT_CACHE_FILE
+
+# noinspection PyUnresolvedReferences
+from wireguard_db.models.export import WGExport
+
+
+def make_server() -> tuple:
+
+    server = WGData.create(
+        description="hub", wg_interface="wg0", wg_address="10.0.0.1/24", wg_listenport=51820
+    )
+    peers = []
+    for number in range(3):
+        peer = WGData.create(description=f"peer {number}", wg_address=f"10.0.0.{number + 2}/32")
+        WGRelation.create(WGParent=server, WGPeer=peer)
+        peers.append(peer)
+
+    return server, peers
+
+
+def test_export_skips_unchanged_files(db, tmp_path):
+
+    server, peers = make_server()
+    target = tmp_path / "export"
+
+    assert WGExport(target).run([server.id]) == {"written": 4, "skipped": 0, "removed": 0}
+    assert (target / "wg0.conf").read_text().startswith("[Interface]")
+    assert oct(os.stat(target / "wg0" / f"peer-{peers[0].id}.conf").st_mode & 0o777) == "0o600"
+    assert (target / EXPORT_CACHE_FILE).exists()
+
+    # a new instance reads the persisted hashes
+    mtime = os.stat(target / "wg0.conf").st_mtime_ns
+    assert WGExport(target).run(["wg0"]) == {"written": 0, "skipped": 4, "removed": 0}
+    assert os.stat(target / "wg0.conf").st_mtime_ns == mtime
+
+    # one peer changed: its own config and the server's
+    peers[1].wg_persistentkeepalive = 25
+    peers[1].save()
+    assert WGExport(target).run(["wg0"]) == {"written": 2, "skipped": 2, "removed": 0}
+    assert not [name for name in os.listdir(target) if name.endswith(".tmp")]
+
+
+def test_export_removes_stale_files(db, tmp_path):
+
+    server, peers = make_server()
+    target = tmp_path / "export"
+    WGExport(target).run([server.id])
+
+    peers[2].delete_instance(recursive=True)
+    assert WGExport(target).run([server.id]) == {"written": 1, "skipped": 2, "removed": 1}
+    assert not (target / "wg0" / f"peer-{peers[2].id}.conf").exists()
+
+    with WGExport(target) as export:
+        export.remove(server.id)
+    assert not (target / "wg0.conf").exists()
+    assert export.stats["removed"] == 3
+
+
+def test_export_keeps_files_taken_over(db, tmp_path):
+
+    server, _ = make_server()
+    target = tmp_path / "export"
+    WGExport(target, peers=False).run([server.id])
+
+    # the interface name moves to another server
+    server.wg_interface = "wg1"
+    server.save()
+    other = WGData.create(description="new hub", wg_interface="wg0", wg_address="10.1.0.1/24")
+    with WGExport(target, peers=False) as export:
+        export.run([other.id])
+        export.remove(server.id)
+
+    assert (target / "wg0.conf").read_text().count("10.1.0.1/24") == 1
+    assert export.stats["removed"] == 0
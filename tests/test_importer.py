@@ -0,0 +1,102 @@
+import tarfile
+
+# noinspection PyUnresolvedReferences
+from wireguard_db.models.importer import WGImport
+
+# noinspection PyUnresolvedReferences
+from wireguard_db.models.tables import WGData, WGRelation
+
+# noinspection PyUnresolvedReferences
+from wireguard_db.utils.dicts import MultiDict
+
+# noinspection PyUnresolvedReferences
+from wireguard_db.utils.parser import parse_config
+
+SERVER_CONFIG = """
+# generated
+[Interface]
+# Name = hub
+Address = 10.0.0.1/24
+ListenPort = 51820
+PrivateKey = server-private
+SaveConfig = false
+
+[Peer]
+# Name = alice
+PublicKey = alice-public
+AllowedIPs = 10.0.0.2/32
+
+[Peer]
+PublicKey = bob-public
+AllowedIPs = 10.0.0.3/32
+"""
+
+
+def test_multidict_state_per_instance():
+
+    first = MultiDict()
+    first["Peer"] = {}
+    second = MultiDict()
+    second["Peer"] = {}
+
+    assert list(second) == ["Peer1"]
+
+
+def test_parse_config_sections():
+
+    sections = parse_config(SERVER_CONFIG)
+
+    assert [section for section, _ in sections] == ["Interface", "Peer", "Peer"]
+    assert sections[0][1]["listenport"] == "51820"
+
+
+def test_import_directory(db, tmp_path):
+
+    configs = tmp_path / "configs"
+    configs.mkdir()
+    (configs / "wg0.conf").write_text(SERVER_CONFIG)
+    (configs / "wg1.conf").write_text(SERVER_CONFIG.replace("server-private", "other"))
+
+    stats = WGImport(batch_size=4).run(str(configs))
+
+    assert stats == {"files": 2, "interfaces": 2, "peers": 4, "relations": 4}
+
+    server = WGData.get(WGData.wg_interface == "wg1")
+    assert server.description == "hub"
+    assert server.wg_saveconfig is False
+    peers = [relation.WGPeer.wg_publickey for relation in server.Parent]
+    assert peers == ["alice-public", "bob-public"]
+
+
+def test_import_tarball(db, tmp_path):
+
+    config = tmp_path / "wg0.conf"
+    config.write_text(SERVER_CONFIG)
+    tarball = tmp_path / "configs.tar.gz"
+    with tarfile.open(str(tarball), "w:gz") as archive:
+        archive.add(str(config), arcname="etc/wg0.conf")
+
+    stats = WGImport().run(str(tarball))
+
+    assert stats["peers"] == 2
+    assert WGRelation.select().count() == 2
+    assert WGData.get(WGData.wg_publickey == "bob-public").wg_address == "10.0.0.3/32"
+
+
+def test_import_without_returning(db, tmp_path, monkeypatch):
+
+    (tmp_path / "wg0.conf").write_text(SERVER_CONFIG)
+    monkeypatch.setattr(db.obj, "returning_clause", False)
+    # another writer takes ids between the imported rows
+    db.execute_sql(
+        'CREATE TRIGGER interleave AFTER INSERT ON "WGData" WHEN NEW.import_batch IS NOT NULL '
+        "BEGIN INSERT INTO \"WGData\" (description, wg_address, is_enabled, is_connected, is_readonly, updated, created) "
+        "VALUES ('other', '10.9.9.9/32', 1, 0, 0, NEW.updated, NEW.created); END"
+    )
+
+    assert WGImport().run(str(tmp_path))["relations"] == 2
+
+    server = WGData.get(WGData.wg_interface == "wg0")
+    assert [relation.WGPeer.wg_publickey for relation in server.Parent] == ["alice-public", "bob-public"]
+    assert WGData.select().where(WGData.import_batch == server.import_batch).count() == 3
+    assert WGData.select().where(WGData.description == "other").count() == 3
@@ -0,0 +1,76 @@
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+# budget for "import wireguard_db" in a fresh interpreter
+IMPORT_BUDGET = 0.05
+HEAVY_MODULES = ("peewee", "yaml", "pymysql", "psycopg2", "cython", "asyncio")
+
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import wireguard_db
+import wireguard_db.models
+seconds = time.perf_counter() - start
+print(json.dumps({"seconds": seconds, "modules": sorted(sys.modules)}))
+"""
+
+
+# peewee imports the drivers it finds itself, DBConnect must add none
+CONNECT_PROBE = """
+import json, sys
+import peewee
+before = sorted(sys.modules)
+from wireguard_db.models.database import DBConnect
+DBConnect(("sqlite3", {"database": ":memory:", "connect": {}})).close()
+print(json.dumps({"before": before, "modules": sorted(sys.modules)}))
+"""
+DRIVER_MODULES = ("sqlite3", "pymysql", "MySQLdb", "psycopg2", "psycopg", "cython")
+
+
+def run_probe(probe: str = PROBE) -> dict:
+
+    result = subprocess.run(
+        [sys.executable, "-c", probe],
+        cwd=str(Path(__file__).parent.parent),
+        check=True,
+        capture_output=True,
+        text=True,
+    )
+    return json.loads(result.stdout)
+
+
+def test_package_import_is_lazy():
+
+    probe = run_probe()
+
+    assert not set(HEAVY_MODULES) & set(probe["modules"])
+
+
+def test_connect_imports_no_further_drivers():
+
+    probe = run_probe(CONNECT_PROBE)
+    added = set(probe["modules"]) - set(probe["before"])
+
+    assert not {name for name in added if name.split(".")[0] in DRIVER_MODULES}
+
+
+def test_package_import_budget():
+
+    # best of three, the first run may pay for a cold file cache
+    seconds = min(run_probe()["seconds"] for _ in range(3))
+
+    assert seconds < IMPORT_BUDGET
+
+
+def test_lazy_names_resolve():
+
+    # noinspection PyUnresolvedReferences
+    import wireguard_db
+
+    # noinspection PyUnresolvedReferences
+    from wireguard_db.models.database import DBConnect
+
+    assert wireguard_db.DBConnect is DBConnect
+    assert "WGData" in dir(wireguard_db)
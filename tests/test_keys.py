@@ -0,0 +1,76 @@
+import base64
+import shutil
+import pytest
+
+# noinspection PyUnresolvedReferences
+from wireguard_db.models.keys import WGKeyService
+
+# noinspection PyUnresolvedReferences
+from wireguard_db.models.tables import WGData, WGKeyPool
+
+# noinspection PyUnresolvedReferences
+from wireguard_db.utils import keys
+
+# public keys are derived by cryptography or 'wg pubkey'
+needs_x25519 = pytest.mark.skipif(
+    not keys.HAS_CRYPTOGRAPHY and shutil.which("wg") is None, reason="neither cryptography nor wg installed"
+)
+
+
+@needs_x25519
+def test_public_key_rfc7748():
+
+    # RFC 7748, 6.1 (Alice)
+    private_key = bytes.fromhex("77076d0a7318a57d3c16c17251b26645df4c2f87ebc0992ab177fba51db92c2a")
+    public_key = bytes.fromhex("8520f0098930a754748b7ddcb43ef75a0dbf3a0d26381af4eba4a98eaa9b4e6a")
+
+    assert keys.public_key(base64.b64encode(private_key).decode()) == base64.b64encode(public_key).decode()
+
+
+def test_public_key_needs_x25519(monkeypatch):
+
+    monkeypatch.setattr(keys, "HAS_CRYPTOGRAPHY", False)
+    monkeypatch.setattr(shutil, "which", lambda _: None)
+
+    with pytest.raises(ImportError, match="cryptography"):
+        keys.public_key(keys.generate_private_key())
+
+
+@needs_x25519
+def test_generate_keypairs():
+
+    pairs = keys.generate_keypairs(5, processes=1)
+
+    assert len(set(pairs)) == 5
+    assert all(keys.public_key(private_key) == public_key for private_key, public_key in pairs)
+    assert len(base64.b64decode(keys.generate_preshared_key())) == 32
+
+
+@needs_x25519
+def test_key_pool(db):
+
+    service = WGKeyService(low_water=5, high_water=12, batch_size=4, processes=1)
+
+    assert service.top_up() == 12
+    assert service.top_up() == 0
+
+    pair = service.take()
+    assert WGKeyPool.select().count() == 8
+    assert pair not in service.take_many(3)
+    assert service.available == 8
+
+    WGData.create(description="peer", wg_address="10.0.0.2/32", wg_privatekey=pair[0], wg_publickey=pair[1])
+    assert not service._unused([pair])  # pylint: disable=protected-access
+
+
+@needs_x25519
+def test_key_pool_background(db):
+
+    service = WGKeyService(low_water=2, high_water=4, batch_size=4, processes=1)
+    service.start(interval=0.01)
+    try:
+        pairs = service.take_many(6)
+    finally:
+        service.stop()
+
+    assert len(set(pairs)) == 6
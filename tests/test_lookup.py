@@ -0,0 +1,90 @@
+import threading
+
+# noinspection PyUnresolvedReferences
+from wireguard_db.models.tables import database, WGData
+
+# noinspection PyUnresolvedReferences
+from wireguard_db.models.lookup import WGKeyLookup
+
+
+def make_peers(count: int) -> list:
+
+    return [
+        WGData.create(description=f"peer {number}", wg_address=f"10.0.0.{number + 2}/32", wg_publickey=f"key{number}=")
+        for number in range(count)
+    ]
+
+
+def test_lookup_caches_rows_and_misses(db):
+
+    peers = make_peers(3)
+    lookup = WGKeyLookup()
+    try:
+        assert lookup.get("key0=").id == peers[0].id
+        assert lookup.get_id("key0=") == peers[0].id
+        assert lookup.get("unknown=") is None
+        assert lookup.get("unknown=") is None
+        assert lookup.stats == {"hits": 2, "misses": 2, "evictions": 0, "size": 2}
+
+        assert lookup.get_ids(["key0=", "key1=", "key2=", "unknown="]) == {
+            "key0=": peers[0].id, "key1=": peers[1].id, "key2=": peers[2].id,
+        }
+        assert lookup.stats["misses"] == 4
+    finally:
+        lookup.close()
+
+
+def test_lookup_drops_changed_rows(db):
+
+    peers = make_peers(2)
+    lookup = WGKeyLookup()
+    try:
+        assert lookup.get("new=") is None
+        assert lookup.get("key0=").description == "peer 0"
+
+        peers[0].wg_publickey = "new="
+        peers[0].save()
+        assert lookup.get("key0=") is None
+        assert lookup.get_id("new=") == peers[0].id
+
+        peers[1].delete_instance()
+        assert lookup.get("key1=") is None
+    finally:
+        lookup.close()
+
+
+def test_lookup_drops_rows_read_before_the_commit(db):
+
+    peers = make_peers(1)
+    lookup = WGKeyLookup()
+
+    def read():
+        rows.append(lookup.get("key0="))
+
+    try:
+        with database.atomic():
+            peers[0].description = "changed"
+            peers[0].save()
+
+            # another connection still reads the committed row and caches it
+            rows = []
+            reader = threading.Thread(target=read)
+            reader.start()
+            reader.join()
+            assert rows[0].description == "peer 0"
+
+        assert lookup.get("key0=").description == "changed"
+    finally:
+        lookup.close()
+
+
+def test_lookup_is_bounded(db):
+
+    make_peers(5)
+    lookup = WGKeyLookup(size=2, watch=False)
+    lookup.get_many([f"key{number}=" for number in range(5)])
+
+    assert lookup.stats["size"] == 2
+    assert lookup.stats["evictions"] == 3
+    assert lookup.get("key4=") is not None
+    assert lookup.stats["hits"] == 1
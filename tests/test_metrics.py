@@ -0,0 +1,66 @@
+import logging
+
+# noinspection PyUnresolvedReferences
+from wireguard_db.models.database import DBConnect
+
+# noinspection PyUnresolvedReferences
+from wireguard_db.models.tables import database, WGData
+
+
+def test_metrics_are_opt_in(tmp_path):
+
+    connect = DBConnect(("sqlite3", {"database": str(tmp_path / "wireguard.db"), "connect": {}}))
+    try:
+        assert connect.metrics is None
+        assert "execute_sql" not in vars(database.obj)
+
+        metrics = connect.instrument()
+        assert "execute_sql" in vars(database.obj)
+
+        connect.uninstrument()
+        assert "execute_sql" not in vars(database.obj)
+        assert not metrics.installed
+    finally:
+        connect.close()
+
+
+def test_metrics_count_queries_rows_and_transactions(tmp_path, caplog):
+
+    connect = DBConnect(("sqlite3", {"database": str(tmp_path / "wireguard.db"), "connect": {}}))
+    metrics = connect.instrument(slow_threshold=0.0)
+    try:
+        with caplog.at_level(logging.WARNING, logger="wireguard_db.slow"):
+            with database.atomic():
+                for number in range(3):
+                    WGData.create(description=f"peer {number}", wg_address=f"10.0.0.{number}/32")
+            assert len(list(WGData.select())) == 3
+
+        snapshot = metrics.as_dict()
+        assert snapshot["queries"]["WGData.insert"]["count"] == 3
+        assert snapshot["queries"]["WGData.insert"]["rows"] == 3
+        assert snapshot["queries"]["WGData.select"]["rows"] == 3
+        assert snapshot["queries"]["WGData.select"]["buckets"]["inf"] == 1
+        assert snapshot["transactions"]["count"] == 1
+        # each row with its change log entry, and the select
+        assert snapshot["slow_queries"] == 7
+        assert len(caplog.records) == 7
+
+        text = connect.metrics.prometheus()
+        assert 'wireguard_db_query_seconds_count{table="WGData",operation="insert"} 3' in text
+        assert 'wireguard_db_query_seconds_bucket{table="WGData",operation="select",le="+Inf"} 1' in text
+        assert "wireguard_db_transaction_seconds_count 1" in text
+    finally:
+        connect.uninstrument()
+        connect.close()
+
+
+def test_statement_labels():
+
+    # noinspection PyUnresolvedReferences
+    from wireguard_db.models.metrics import _label
+
+    assert _label('CREATE TABLE IF NOT EXISTS "WGData" ("id" INTEGER)') == ("WGData", "create")
+    assert _label('CREATE INDEX IF NOT EXISTS "wgdata_updated" ON "WGData" ("updated")') == ("WGData", "create")
+    assert _label('DROP TABLE IF EXISTS "WGTraffic"') == ("WGTraffic", "drop")
+    assert _label('SELECT "t1"."id" FROM "WGData" AS "t1"') == ("WGData", "select")
+    assert _label('UPDATE "WGData" SET "updated" = ?') == ("WGData", "update")
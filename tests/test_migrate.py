@@ -0,0 +1,83 @@
+import json
+import pytest
+
+# noinspection PyUnresolvedReferences
+from wireguard_db.models.database import DBConnect
+
+# noinspection PyUnresolvedReferences
+from wireguard_db.models.tables import WGData, WGKeyPool, WGRelation
+
+# noinspection PyUnresolvedReferences
+from wireguard_db.models.migrate import WGMigrate
+
+
+def make_source(tmp_path) -> tuple:
+
+    setup = ("sqlite3", {"database": str(tmp_path / "source.db"), "connect": {}})
+    connect = DBConnect(setup)
+    hub = WGData.create(description="hub", wg_interface="wg0", wg_address="10.0.0.1/24", is_enabled=False)
+    for number in range(9):
+        peer = WGData.create(description=f"peer {number}", wg_address=f"10.0.0.{number + 2}/32")
+        WGRelation.create(WGParent=hub, WGPeer=peer)
+    # a gap in the ids
+    WGData.get_by_id(5).delete_instance(recursive=True)
+    WGKeyPool.create(privatekey="private", publickey="public")
+
+    rows = [tuple(row) for row in WGData.select().order_by(WGData.id).tuples()]
+    relations = list(WGRelation.select().order_by(WGRelation.id).tuples())
+    connect.close()
+
+    return setup, rows, relations
+
+
+def test_migrate_copies_ids_and_relations(tmp_path):
+
+    source, rows, relations = make_source(tmp_path)
+    target = ("sqlite3", {"database": str(tmp_path / "target.db"), "connect": {}})
+
+    with WGMigrate(source, target, chunk=4) as migrate:
+        assert migrate.run() == {"WGData": 9, "WGRelation": 8, "WGKeyPool": 1}
+        assert [tuple(row) for row in WGData.select().order_by(WGData.id).tuples()] == rows
+        assert list(WGRelation.select().order_by(WGRelation.id).tuples()) == relations
+        assert WGData.create(description="next", wg_address="10.0.0.99/32").id == rows[-1][0] + 1
+
+
+def test_migrate_resumes_from_checkpoint(tmp_path, monkeypatch):
+
+    source, rows, _ = make_source(tmp_path)
+    target = ("sqlite3", {"database": str(tmp_path / "target.db"), "connect": {}})
+    checkpoint = tmp_path / "checkpoint.json"
+
+    verify = WGMigrate._verify
+    calls = []
+
+    def interrupted(model, fields, convert, chunk):
+        calls.append(model)
+        if 2 == len(calls):
+            raise KeyboardInterrupt
+        verify(model, fields, convert, chunk)
+
+    monkeypatch.setattr(WGMigrate, "_verify", staticmethod(interrupted))
+    with WGMigrate(source, target, chunk=4, checkpoint=str(checkpoint)) as migrate:
+        with pytest.raises(KeyboardInterrupt):
+            migrate.run()
+    # the second chunk was rolled back
+    assert json.loads(checkpoint.read_text()) == {"WGData": rows[3][0]}
+
+    monkeypatch.setattr(WGMigrate, "_verify", staticmethod(verify))
+    with WGMigrate(source, target, chunk=4, checkpoint=str(checkpoint)) as migrate:
+        assert migrate.run() == {"WGData": 5, "WGRelation": 8, "WGKeyPool": 1}
+        assert [tuple(row) for row in WGData.select().order_by(WGData.id).tuples()] == rows
+
+
+def test_migrate_detects_differing_rows(tmp_path):
+
+    source, _, _ = make_source(tmp_path)
+    target = ("sqlite3", {"database": str(tmp_path / "target.db"), "connect": {}})
+    connect = DBConnect(target)
+    WGData.create(id=1, description="other", wg_address="10.9.9.9/32")
+    connect.close()
+
+    with WGMigrate(source, target) as migrate:
+        with pytest.raises(LookupError):
+            migrate.run()
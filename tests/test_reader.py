@@ -0,0 +1,194 @@
+from datetime import datetime
+import pytest
+
+# noinspection PyUnresolvedReferences
+from peewee import PostgresqlDatabase
+
+# noinspection PyUnresolvedReferences
+from wireguard_db.models.tables import database, WGData, WGRelation
+
+# noinspection PyUnresolvedReferences
+from wireguard_db.models.bulk import insert_rows
+
+# noinspection PyUnresolvedReferences
+from wireguard_db.models.reader import WGReader
+
+# noinspection PyUnresolvedReferences
+from wireguard_db.utils.dicts import wgdata2wireguard, compile_wgdata2wireguard
+
+
+def make_rows(count: int) -> None:
+
+    # fields left out get their defaults
+    fields = (WGData.description, WGData.wg_address, WGData.wg_persistentkeepalive, WGData.wg_saveconfig)
+    with database.atomic():
+        insert_rows(
+            WGData,
+            fields,
+            [(f"peer {number}", f"10.0.{number // 256}.{number % 256}/32", 25, number % 2 == 0) for number in range(count)],
+        )
+
+
+def test_reader_matches_model_rows(db):
+
+    make_rows(300)
+
+    expected = [row.get_dict() for row in WGData.select().order_by(WGData.id)]
+    rows = list(WGReader(fetch_size=64))
+
+    assert len(rows) == 300
+    assert [row._asdict() for row in rows] == expected
+    assert rows[0].is_enabled is True
+    assert rows[1].wg_saveconfig is False
+    assert isinstance(rows[0].updated, datetime)
+
+    assert list(WGReader().wireguard()) == [wgdata2wireguard(row) for row in expected]
+
+
+def test_reader_selected_fields_and_filter(db):
+
+    make_rows(10)
+
+    reader = WGReader(WGData.id, WGData.wg_address, where=WGData.wg_saveconfig == True)  # noqa: E712
+    assert reader.columns == ("id", "wg_address")
+    assert [row.wg_address for row in reader] == [f"10.0.0.{number}/32" for number in range(0, 10, 2)]
+    assert list(reader.wireguard())[0] == {"address": "10.0.0.0/32"}
+
+
+def test_chunks_match_one_query(db):
+
+    make_rows(250)
+
+    expected = list(WGReader())
+    assert list(WGReader(chunk=64)) == expected
+    assert list(WGReader(chunk=250)) == expected
+    assert list(WGReader(WGData.wg_address, chunk=7)) == [(row.wg_address,) for row in expected]
+
+
+def test_chunks_by_updated(db):
+
+    make_rows(30)
+    # equal timestamps are ordered by id, none is skipped at chunk borders
+    WGData.update(updated=datetime(2024, 1, 1, 12)).where(WGData.id > 20).execute()
+    WGData.update(updated=datetime(2024, 1, 1, 11)).where(WGData.id <= 10).execute()
+
+    rows = list(WGReader(WGData.id, WGData.description, order="updated", chunk=4))
+
+    assert rows[0]._fields == ("id", "description")
+    assert [row.id for row in rows] == list(range(1, 11)) + list(range(21, 31)) + list(range(11, 21))
+
+
+def test_stream_filters(db):
+
+    make_rows(6)
+    server = WGData.create(description="server", wg_interface="wg0", wg_address="10.1.0.1/24", host_id=7)
+    for peer_id in (1, 2, 3):
+        WGRelation.create(WGParent=server, WGPeer=peer_id)
+    WGData.update(is_enabled=False).where(WGData.id == 2).execute()
+    WGData.update(host_id=7).where(WGData.id.in_([3, 4])).execute()
+
+    assert [row.id for row in WGData.stream(WGData.id, interface="wg0", chunk=2)] == [1, 2, 3, server.id]
+    assert [row.id for row in WGData.stream(WGData.id, interface="wg0", enabled_only=True)] == [1, 3, server.id]
+    assert [row.id for row in WGData.stream(WGData.id, host_id=7, chunk=None)] == [3, 4, server.id]
+    assert [row.id for row in WGData.stream(WGData.id, host_id=7, where=WGData.id < 4)] == [3]
+    assert list(WGData.stream(interface="wg1")) == []
+
+
+def test_reader_checks_arguments():
+
+    for kwargs in ({"order": "created"}, {"chunk": 0}, {"fetch_size": 0}):
+        with pytest.raises(ValueError):
+            WGReader(**kwargs)
+
+
+def test_compiled_translation_is_cached():
+
+    columns = ("id", "wg_address", "wg_listenport", "description")
+    translate = compile_wgdata2wireguard(columns)
+
+    assert compile_wgdata2wireguard(columns) is translate
+    assert translate((1, "10.0.0.1/24", None, "x")) == wgdata2wireguard(
+        {"id": 1, "wg_address": "10.0.0.1/24", "wg_listenport": None, "description": "x"}
+    )
+
+
+class FakeCursor:
+
+    def __init__(self, rows):
+
+        self.rows = list(rows)
+        self.closed = False
+
+    def execute(self, sql, params):
+
+        pass
+
+    def fetchmany(self, size):
+
+        rows, self.rows = self.rows[:size], self.rows[size:]
+        return rows
+
+    def close(self):
+
+        self.closed = True
+
+
+class FakeConnection:
+
+    def __init__(self, rows):
+
+        self.rows = rows
+        self.cursors = []
+        self.closed = False
+
+    def cursor(self, *_, name=None):
+
+        assert name is not None
+        self.cursors.append(FakeCursor(self.rows))
+        return self.cursors[-1]
+
+    def close(self):
+
+        self.closed = True
+
+
+def test_reader_streams_postgresql_through_a_connection_of_its_own():
+
+    connections = []
+
+    class FakePostgresql(PostgresqlDatabase):
+
+        def _connect(self):
+
+            connections.append(FakeConnection([(number, f"peer {number}") for number in range(10)]))
+            return connections[-1]
+
+    previous = database.override(FakePostgresql("wgdb"))
+    try:
+        # read to the end: closed at once
+        assert len(list(WGReader(WGData.id, WGData.description, fetch_size=3))) == 10
+        assert connections[0].closed and connections[0].cursors[0].closed
+
+        # left unread: closed with the block, no transaction of the thread
+        with WGReader(WGData.id, WGData.description, fetch_size=3) as reader:
+            rows = iter(reader)
+            assert next(rows).description == "peer 0"
+            assert not connections[1].closed
+            assert not database.in_transaction()
+
+        assert connections[1].closed and connections[1].cursors[0].closed
+    finally:
+        database.override(previous)
+
+
+def test_reader_close_leaves_the_connection_usable(db):
+
+    make_rows(50)
+
+    with WGReader(fetch_size=10) as reader:
+        rows = iter(reader)
+        next(rows)
+
+    assert not reader._streams
+    WGData.create(description="after", wg_address="10.1.0.1/32")
+    assert WGData.select().count() == 51
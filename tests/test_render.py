@@ -0,0 +1,76 @@
+# noinspection PyUnresolvedReferences
+from wireguard_db.models.render import WGRender
+
+# noinspection PyUnresolvedReferences
+from wireguard_db.models.tables import WGData, WGRelation
+
+
+def make_hub(peers: int) -> WGData:
+
+    server = WGData.create(
+        description="hub",
+        wg_interface="wg0",
+        wg_address="10.0.0.1/24",
+        wg_listenport=51820,
+        wg_privatekey="server-private",
+        wg_publickey="server-public",
+        wg_endpoint="vpn.example.org:51820",
+    )
+    for number in range(peers):
+        peer = WGData.create(
+            description=f"peer {number}",
+            wg_address=f"10.0.0.{number + 2}/32",
+            wg_privatekey=f"peer-private-{number}",
+            wg_publickey=f"peer-public-{number}",
+            is_enabled=number != 1,
+        )
+        WGRelation.create(WGParent=server, WGPeer=peer)
+
+    return server
+
+
+def count_queries(db, monkeypatch) -> list:
+
+    queries = []
+    execute_sql = db.obj.execute_sql
+
+    def counting(sql, params=None, *args, **kwargs):
+        queries.append(sql)
+        return execute_sql(sql, params, *args, **kwargs)
+
+    monkeypatch.setattr(db.obj, "execute_sql", counting)
+    return queries
+
+
+def test_render_server(db, monkeypatch):
+
+    make_hub(3)
+    queries = count_queries(db, monkeypatch)
+
+    config = "".join(WGRender("wg0").server())
+
+    assert config.startswith("[Interface]\nAddress = 10.0.0.1/24\nListenPort = 51820\n")
+    assert config.count("[Peer]") == 2
+    assert "PublicKey = peer-public-1" not in config
+    assert "AllowedIPs = 10.0.0.3/32" not in config
+    assert "AllowedIPs = 10.0.0.4/32" in config
+    assert len(queries) == 2
+
+
+def test_render_peers_constant_queries(db, monkeypatch):
+
+    server = make_hub(50)
+    queries = count_queries(db, monkeypatch)
+
+    render = WGRender(server.id, enabled_only=False)
+    peers = dict(render.peers())
+    server_config = "".join(render.server())
+
+    assert len(peers) == 50
+    assert server_config.count("[Peer]") == 50
+    assert len(queries) == 3
+
+    config = next(iter(peers.values()))
+    assert "PrivateKey = peer-private-0" in config
+    assert "Endpoint = vpn.example.org:51820" in config
+    assert "AllowedIPs = 10.0.0.1/24" in config
@@ -0,0 +1,67 @@
+import shutil
+
+# noinspection PyUnresolvedReferences
+from wireguard_db.models.database import DBConnect
+
+# noinspection PyUnresolvedReferences
+from wireguard_db.models.tables import database, WGData
+
+
+def _replicated(tmp_path, routing="round_robin"):
+
+    # the replicas are copies of the primary, taken before the next write
+    primary = str(tmp_path / "primary.db")
+    connect = DBConnect(("sqlite3", {"database": primary, "connect": {}}))
+    WGData.create(description="copied", wg_address="10.0.0.1/32")
+    connect.close()
+
+    replicas = []
+    for number in range(2):
+        replica = str(tmp_path / f"replica{number}.db")
+        shutil.copyfile(primary, replica)
+        replicas.append({"database": replica})
+
+    return DBConnect(
+        ("sqlite3", {"database": primary, "connect": {}, "replicas": replicas, "routing": routing})
+    )
+
+
+def test_selects_go_to_the_replicas(tmp_path):
+
+    connect = _replicated(tmp_path)
+    try:
+        WGData.create(description="primary only", wg_address="10.0.0.2/32")
+
+        # the replicas do not have the new row
+        assert WGData.select().count() == 1
+        assert WGData.select().count() == 1
+        stats = connect.router.stats
+        assert stats["replicas"][0] == stats["replicas"][1]
+        assert stats["fallbacks"] == 0
+
+        with connect.pinned():
+            assert WGData.select().count() == 2
+
+        with database.atomic():
+            assert WGData.select().count() == 2
+    finally:
+        connect.close()
+
+
+def test_least_loaded_and_no_replicas(tmp_path):
+
+    connect = _replicated(tmp_path, routing="least_loaded")
+    try:
+        assert WGData.select().count() == 1
+        assert sum(connect.router.stats["replicas"]) >= 1
+    finally:
+        connect.close()
+
+    connect = DBConnect(("sqlite3", {"database": str(tmp_path / "primary.db"), "connect": {}}))
+    try:
+        assert connect.router is None
+        assert "execute_sql" not in vars(database.obj)
+        with connect.pinned():
+            assert WGData.select().count() == 1
+    finally:
+        connect.close()
@@ -0,0 +1,101 @@
+import pytest
+
+# noinspection PyUnresolvedReferences
+from wireguard_db.models.shards import DBShards
+
+# noinspection PyUnresolvedReferences
+from wireguard_db.models.tables import database, WGData, WGRelation, WGShardMap
+
+
+def make_shards(tmp_path) -> DBShards:
+
+    return DBShards({
+        name: ("sqlite3", {"database": str(tmp_path / f"{name}.db"), "connect": {"foreign_keys": 1}})
+        for name in ("eu", "us")
+    })
+
+
+def make_host(shards: DBShards, host_id: int, peers: int = 3) -> WGData:
+
+    with shards.host(host_id):
+        server = WGData.create(description=f"host {host_id}", wg_interface="wg0", wg_address="10.0.0.1/24", host_id=host_id)
+        for number in range(peers):
+            peer = WGData.create(description=f"peer {number}", wg_address=f"10.0.0.{number + 2}/32", host_id=host_id)
+            shards.relate(server, peer)
+
+    return server
+
+
+def counts(shards: DBShards) -> dict:
+
+    return shards.fan_out(lambda: (WGData.select().count(), WGRelation.select().count()))
+
+
+def test_rows_go_to_the_shard_of_their_host(tmp_path):
+
+    shards = make_shards(tmp_path)
+    try:
+        hosts = {}
+        for host_id in range(1, 9):
+            hosts.setdefault(shards.shard_of(host_id), []).append(host_id)
+            make_host(shards, host_id)
+        assert set(hosts) == {"eu", "us"}
+
+        assert counts(shards) == {name: (4 * len(ids), 3 * len(ids)) for name, ids in hosts.items()}
+        assert len(shards.rows(WGData.select().where(WGData.wg_interface == "wg0"))) == 8
+
+        # the shard map is kept in the first shard
+        with shards.use("eu"):
+            assert WGShardMap.select().count() == 8
+        assert WGData.select().count() == counts(shards)["eu"][0]
+    finally:
+        shards.close()
+
+
+def test_move_host_between_shards(tmp_path):
+
+    shards = make_shards(tmp_path)
+    try:
+        server = make_host(shards, 1)
+        make_host(shards, 2)
+        source = shards.shard_of(1)
+        target = "us" if "eu" == source else "eu"
+        before = counts(shards)
+
+        assert shards.move(1, target, chunk=2) == 4
+        assert shards.shard_of(1) == target
+        after = counts(shards)
+        assert after[source] == (before[source][0] - 4, before[source][1] - 3)
+        assert after[target] == (before[target][0] + 4, before[target][1] + 3)
+
+        with shards.host(1):
+            moved = WGData.get(WGData.description == "host 1")
+            assert sorted(relation.WGPeer.description for relation in moved.Parent) == ["peer 0", "peer 1", "peer 2"]
+
+        # running it again changes nothing
+        assert shards.move(1, target) == 0
+        assert counts(shards) == after
+    finally:
+        shards.close()
+
+    # a new instance reads the shard map
+    shards = make_shards(tmp_path)
+    try:
+        assert shards.shard_of(1) == target
+    finally:
+        shards.close()
+
+
+def test_move_refuses_edges_between_hosts(tmp_path):
+
+    shards = make_shards(tmp_path)
+    try:
+        with shards.use(shards.shard_of(1)):
+            server = WGData.create(description="host 1", wg_address="10.0.0.1/24", host_id=1)
+            peer = WGData.create(description="other", wg_address="10.0.0.2/32", host_id=None)
+            WGRelation.create(WGParent=server, WGPeer=peer)
+
+        with pytest.raises(ValueError):
+            shards.move(1, "us" if "eu" == shards.shard_of(1) else "eu")
+    finally:
+        shards.close()
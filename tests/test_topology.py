@@ -0,0 +1,53 @@
+# noinspection PyUnresolvedReferences
+from wireguard_db.models.tables import WGData, WGRelation
+
+# noinspection PyUnresolvedReferences
+from wireguard_db.models.topology import WGTopology
+
+
+def make_nodes(count: int) -> list:
+
+    return [
+        WGData.create(description=f"node {number}", wg_address=f"10.0.0.{number + 1}/32").id
+        for number in range(count)
+    ]
+
+
+def test_topology_queries(db):
+
+    hub, second_hub, peer_a, peer_b, lonely = make_nodes(5)
+    for parent, peer in ((hub, peer_a), (hub, peer_b), (second_hub, peer_b)):
+        WGRelation.create(WGParent=parent, WGPeer=peer)
+
+    topology = WGTopology(watch=False)
+
+    assert topology.peers(hub) == (peer_a, peer_b)
+    assert topology.parents(peer_b) == (hub, second_hub)
+    assert topology.degree(peer_b) == 2
+    assert topology.reachable(peer_a) == {hub, peer_b}
+    assert topology.reachable(peer_a, hops=3) == {hub, peer_b, second_hub}
+    assert topology.path(peer_a, second_hub) == [peer_a, hub, peer_b, second_hub]
+    assert topology.path(peer_a, lonely) is None
+    assert len(topology) == 3
+
+
+def test_topology_follows_changes(db):
+
+    hub, peer_a, peer_b = make_nodes(3)
+    topology = WGTopology()
+    try:
+        relation = WGRelation.create(WGParent=hub, WGPeer=peer_a)
+        WGRelation.create(WGParent=hub, WGPeer=peer_b)
+        assert topology.peers(hub) == (peer_a, peer_b)
+
+        relation.delete_instance()
+        assert topology.peers(hub) == (peer_b,)
+
+        WGData.get_by_id(peer_b).delete_instance(recursive=True)
+        assert topology.peers(hub) == ()
+        assert topology.degree(hub) == 0
+    finally:
+        topology.close()
+
+    WGRelation.create(WGParent=hub, WGPeer=peer_a)
+    assert topology.peers(hub) == ()
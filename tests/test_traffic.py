@@ -0,0 +1,64 @@
+# noinspection PyUnresolvedReferences
+from wireguard_db.models.tables import WGTraffic
+
+# noinspection PyUnresolvedReferences
+from wireguard_db.models.traffic import WGTrafficStore
+
+DAY = 86400
+START = 1700000000 - 1700000000 % DAY
+
+
+def feed(store: WGTrafficStore, minutes: int) -> None:
+
+    # two peers, one scrape every 20 seconds, peer 2 resets its counters once
+    for step in range(minutes * 3 + 1):
+        now = START + step * 20
+        peer_2 = (step % 100) * 10
+        store.append([(1, step * 100, step * 200, now - 5), (2, peer_2, peer_2, None)], now)
+
+
+def test_append_stores_deltas_and_rolls_up(db):
+
+    store = WGTrafficStore()
+    feed(store, 120)
+
+    raw = WGTraffic.select().where((WGTraffic.resolution == 0) & (WGTraffic.peer_id == 1))
+    assert {row.rx for row in raw} == {100}
+    # a counter reset counts the new value, never a negative delta
+    assert min(row.rx for row in WGTraffic.select().where(WGTraffic.peer_id == 2)) >= 0
+
+    minutes = WGTraffic.select().where((WGTraffic.resolution == 60) & (WGTraffic.peer_id == 1))
+    assert minutes.count() == 120
+    assert {(row.rx, row.samples) for row in minutes if row.bucket > START} == {(300, 3)}
+
+    hours = WGTraffic.select().where((WGTraffic.resolution == 3600) & (WGTraffic.peer_id == 1))
+    assert [row.rx for row in hours] == [17900, 18000]
+
+
+def test_series_picks_resolution(db):
+
+    store = WGTrafficStore()
+    feed(store, 120)
+    now = START + 7200
+
+    assert store.resolution(START, now, points=100, now=now) == 60
+    assert store.resolution(START, now, points=1000, now=now) == 0
+    assert store.resolution(now - 400 * DAY, now, now=now) == 86400
+    # raw samples are gone after two days, minutes are the finest left
+    assert store.resolution(START, START + 600, now=START + 3 * DAY) == 60
+
+    series = store.series(1, START, now, points=2, now=now)
+    assert series["resolution"] == 3600
+    assert [point[1] for point in series["points"]] == [17900, 18000]
+
+
+def test_prune_in_chunks(db, monkeypatch):
+
+    store = WGTrafficStore()
+    feed(store, 10)
+    raw = WGTraffic.select().where(WGTraffic.resolution == 0).count()
+
+    monkeypatch.setattr("wireguard_db.models.traffic.PRUNE_CHUNK", 7)
+    assert store.prune(now=START + 3 * DAY, max_chunks=2) == 14
+    assert store.prune(now=START + 3 * DAY) == raw - 14
+    assert WGTraffic.select().where(WGTraffic.resolution == 60).count() == 2 * 10
@@ -0,0 +1,128 @@
+import multiprocessing
+import sqlite3
+import threading
+
+import pytest
+from peewee import OperationalError
+
+# noinspection PyUnresolvedReferences
+from wireguard_db.models.tables import WGData
+
+# noinspection PyUnresolvedReferences
+from wireguard_db.models.writer import WGWriteClient, WGWriteQueue, WGWriteServer
+
+AUTHKEY = b"test"
+
+
+def rename(row_id: int, description: str) -> int:
+
+    return WGData.update(description=description).where(WGData.id == row_id).execute()
+
+
+def write_peers(path: str, worker: int) -> None:
+
+    # another process, no database connection of its own
+    with WGWriteClient(path, authkey=AUTHKEY) as client:
+        for number in range(50):
+            peer = WGData(description=f"peer {worker}-{number}", wg_address=f"10.{worker}.0.{number}/32")
+            assert client.save(peer) == 1
+            assert peer.id is not None
+        assert client.submit(rename, peer.id, f"last of {worker}") == 1
+
+
+def test_writes_from_threads_are_batched(db):
+
+    futures = []
+    lock = threading.Lock()
+
+    def provision(worker: int) -> None:
+        for number in range(50):
+            future = writer.save(WGData(description=f"peer {worker}-{number}", wg_address=f"10.{worker}.0.{number}/32"))
+            with lock:
+                futures.append(future)
+
+    with WGWriteQueue(batch_size=64, max_latency=0.01) as writer:
+        threads = [threading.Thread(target=provision, args=(worker,)) for worker in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    assert [future.result(timeout=5) for future in futures] == [1] * 400
+    assert WGData.select().count() == 400
+    assert writer.stats["writes"] == 400
+    assert writer.stats["batches"] < 400
+
+
+def test_failing_write_keeps_the_batch(db):
+
+    def fail():
+        raise ValueError("no")
+
+    with WGWriteQueue(max_latency=0.05) as writer:
+        before = writer.save(WGData(description="before", wg_address="10.0.0.1/32"))
+        failing = writer.submit(fail)
+        after = writer.execute(WGData.update(description="after"))
+
+    assert before.result() == 1
+    with pytest.raises(ValueError):
+        failing.result()
+    assert after.result() == 1
+    assert WGData.get().description == "after"
+    assert writer.stats["failed"] == 1
+
+
+def test_submit_needs_start(db):
+
+    with pytest.raises(RuntimeError):
+        WGWriteQueue().submit(print)
+
+
+def test_locked_batch_fails_its_futures(db):
+
+    db.obj.timeout = 0.2
+    other = sqlite3.connect(db.obj.database, isolation_level=None)
+    other.execute("BEGIN IMMEDIATE")
+    try:
+        with WGWriteQueue() as writer:
+            future = writer.save(WGData(description="locked", wg_address="10.0.0.1/32"))
+            with pytest.raises(OperationalError):
+                future.result(timeout=5)
+    finally:
+        other.rollback()
+        other.close()
+
+    assert writer.stats["failed"] == 1
+    assert WGData.select().count() == 0
+
+
+def test_writes_from_processes_go_through_one_server(db, tmp_path):
+
+    path = str(tmp_path / "writer.sock")
+    context = multiprocessing.get_context("spawn")
+
+    with WGWriteServer(path, authkey=AUTHKEY, max_latency=0.01) as server:
+        processes = [context.Process(target=write_peers, args=(path, worker)) for worker in range(2)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join(timeout=60)
+
+    assert [process.exitcode for process in processes] == [0, 0]
+    assert WGData.select().count() == 100
+    assert WGData.select().where(WGData.description.startswith("last of")).count() == 2
+    assert server.stats["failed"] == 0
+    assert server.stats["writes"] == 102
+
+
+def test_write_server_returns_errors(db, tmp_path):
+
+    path = str(tmp_path / "writer.sock")
+
+    with WGWriteServer(path, authkey=AUTHKEY) as server:
+        with WGWriteClient(path, authkey=AUTHKEY) as client:
+            with pytest.raises(ValueError):
+                client.submit(int, "no number")
+            assert client.submit(rename, 1, "nobody") == 0
+
+    assert server.stats["failed"] == 1
@@ -1,4 +1,46 @@
+from importlib import import_module
+
 from .models.constants import CONFIG_PATH, SAMPLE_CONFIG, DBCONFIG_FILE, DB_FILE
-from .models.config import DBConfig
-from .models.database import DBConnect
-from .models.tables import WGData, WGRelation
+
+# imported on first access, keeps "import wireguard_db" free of peewee and drivers
+_LAZY = {
+    "DBConfig": ".models.config",
+    "DBConnect": ".models.database",
+    "DBShards": ".models.shards",
+    "AsyncDBConnect": ".models.aio",
+    "WGData": ".models.tables",
+    "WGRelation": ".models.tables",
+    "WGAllocator": ".models.allocator",
+    "WGTopology": ".models.topology",
+    "WGMeshBuilder": ".models.builder",
+    "WGKeyService": ".models.keys",
+    "WGChangeFeed": ".models.changes",
+    "WGExport": ".models.export",
+    "WGReader": ".models.reader",
+    "WGKeyLookup": ".models.lookup",
+    "WGCollector": ".models.collector",
+    "WGTrafficStore": ".models.traffic",
+    "WGWriteQueue": ".models.writer",
+    "WGWriteServer": ".models.writer",
+    "WGWriteClient": ".models.writer",
+    "WGMigrate": ".models.migrate",
+    "WGDaemon": ".models.daemon",
+    "WGClient": ".models.client",
+    "WGImport": ".models.importer",
+    "WGRender": ".models.render",
+}
+
+__all__ = ["CONFIG_PATH", "SAMPLE_CONFIG", "DBCONFIG_FILE", "DB_FILE"] + list(_LAZY)
+
+
+def __getattr__(name: str):
+    if name not in _LAZY:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+    value = getattr(import_module(_LAZY[name], __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY))
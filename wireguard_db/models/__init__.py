@@ -7,7 +7,52 @@ __maintainer__ = "Markus Neubauer"
 __email__ = "neubauer@invalid.email-online.org"
 __status__ = "Development"
 
-# pylint: disable=import-error
-from .config import DBConfig  # pylint disable=import-error
-from .database import DBConnect  # pylint disable=import-error
-from .tables import MODELS, WGData, WGRelation
+from importlib import import_module
+
+# imported on first access, peewee is loaded only if a model or connector is used
+_LAZY = {
+    "DBConfig": ".config",
+    "DBConnect": ".database",
+    "DBShards": ".shards",
+    "AsyncDBConnect": ".aio",
+    "WGAllocator": ".allocator",
+    "WGTopology": ".topology",
+    "WGMeshBuilder": ".builder",
+    "WGKeyService": ".keys",
+    "WGChangeFeed": ".changes",
+    "WGExport": ".export",
+    "WGReader": ".reader",
+    "WGKeyLookup": ".lookup",
+    "WGCollector": ".collector",
+    "WGTrafficStore": ".traffic",
+    "WGWriteQueue": ".writer",
+    "WGWriteServer": ".writer",
+    "WGWriteClient": ".writer",
+    "WGMigrate": ".migrate",
+    "WGDaemon": ".daemon",
+    "WGClient": ".client",
+    "WGImport": ".importer",
+    "WGRender": ".render",
+    "MODELS": ".tables",
+    "WGData": ".tables",
+    "WGRelation": ".tables",
+    "WGKeyPool": ".tables",
+    "WGChange": ".tables",
+    "WGPeerState": ".tables",
+    "WGTraffic": ".tables",
+}
+
+__all__ = list(_LAZY)
+
+
+def __getattr__(name: str):
+    if name not in _LAZY:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+    value = getattr(import_module(_LAZY[name], __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY))
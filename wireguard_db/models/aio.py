@@ -0,0 +1,230 @@
+# -*- coding: utf-8 -*-
+__version__ = "0.1.0"
+__license__ = "GPLv3"
+__docformat__ = "reStructuredText"
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from .bulk import insert_rows  # pylint: disable=E0402
+from .database import DBConnect  # pylint: disable=E0402
+from .render import WGRender  # pylint: disable=E0402
+from .tables import database, WGData, WGRelation  # pylint: disable=E0402
+
+DEFAULT_WORKERS = 4
+
+
+class AsyncDBConnect:
+    """
+    asyncio front-end for DBConnect: the blocking peewee calls run on a
+    bounded thread pool, the event loop only awaits their results.
+    The database is set up by start() on the pool as well, "async with"
+    and the first call start it.
+    """
+
+    def __init__(self, setup: tuple, *, max_workers: int = None, max_pending: int = None):
+        """
+        :param setup: tuple: as returned from DBConfig.read()
+        :param max_workers: int: threads running queries
+                (default: pool max_connections or DEFAULT_WORKERS)
+        :param max_pending: int: operations queued or running before callers wait
+                (default: 4 * max_workers)
+        ivar _connect: DBConnect: the wrapped connector, None until started
+        ivar _starting: asyncio.Future: DBConnect set up on the pool
+        ivar _executor: ThreadPoolExecutor: runs the blocking calls
+        ivar _pending: asyncio.Semaphore: backpressure, created within the running loop
+        """
+        if max_workers is None:
+            pool = setup[1].get("pool")
+            max_workers = pool.get("max_connections", 20) if pool is not None else DEFAULT_WORKERS
+
+        if not isinstance(max_workers, int) or max_workers < 1:
+            raise ValueError('"max_workers" must be a positive integer')
+
+        self._setup = setup
+        self._connect = None
+        self._starting = None
+        self._max_workers = max_workers
+        self._max_pending = max_pending or 4 * max_workers
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="wireguard_db"
+        )
+        self._pending = None
+
+    async def start(self) -> DBConnect:
+        """
+        Sets up the database on a worker thread, once
+        :returns: connector
+        :rtype: DBConnect
+        """
+        if self._starting is None:
+            self._starting = asyncio.get_running_loop().run_in_executor(
+                self._executor, DBConnect, self._setup
+            )
+
+        # a cancelled caller leaves the setup to the others
+        self._connect = await asyncio.shield(self._starting)
+        return self._connect
+
+    @property
+    def connector(self) -> DBConnect:
+        """
+        Gets the wrapped DBConnect
+        :returns: connector, None until started
+        :rtype: DBConnect
+        """
+        return self._connect
+
+    @staticmethod
+    def _call(function, args, kwargs):
+        """
+        Runs within a worker thread, the connection is given back afterwards
+        """
+        with database.connection_context():
+            return function(*args, **kwargs)
+
+    async def run(self, function, *args, **kwargs):
+        """
+        Runs any blocking database function on the worker threads.
+        Cancelling the caller drops the call if it has not started yet,
+        a started call runs to its end.
+        :param function: callable: run with args and kwargs
+        :returns: the result of function
+        """
+        if self._connect is None:
+            await self.start()
+
+        if self._pending is None:
+            self._pending = asyncio.Semaphore(self._max_pending)
+
+        await self._pending.acquire()
+
+        loop = asyncio.get_running_loop()
+        try:
+            future = self._executor.submit(self._call, function, args, kwargs)
+        except BaseException:
+            self._pending.release()
+            raise
+
+        def release(_):
+            # the slot is freed when the thread is done, not when the caller gives up
+            if not loop.is_closed():
+                loop.call_soon_threadsafe(self._pending.release)
+
+        future.add_done_callback(release)
+
+        return await asyncio.wrap_future(future)
+
+    async def get_peer(self, key) -> WGData:
+        """
+        Gets one row by id or public key
+        :param key: int or str: WGData id or wg_publickey
+        :returns: the row or None
+        :rtype: WGData
+        """
+        if isinstance(key, int):
+            where = WGData.id == key
+        else:
+            where = WGData.wg_publickey == key
+
+        return await self.run(lambda: WGData.select().where(where).first())
+
+    async def list_peers(self, server: int) -> list:
+        """
+        Lists the peers of a server
+        :param server: int: WGData id of the server
+        :returns: list of WGData
+        :rtype: list
+        """
+
+        def peers():
+            return list(
+                WGData.select()
+                .join(WGRelation, on=(WGRelation.WGPeer == WGData.id))
+                .where(WGRelation.WGParent == server)
+                .order_by(WGRelation.id)
+            )
+
+        return await self.run(peers)
+
+    async def save(self, row: WGData, **kwargs) -> int:
+        """
+        Saves a row
+        :param row: WGData: row to be saved
+        :returns: Number of rows modified.
+        :rtype: int
+        """
+        return await self.run(row.save, **kwargs)
+
+    async def insert_many(self, rows: list) -> int:
+        """
+        Inserts WGData rows within one transaction, see bulk.insert_rows()
+        :param rows: list of dict: field values per row, fields left out
+                get their defaults
+        :returns: number of rows inserted
+        :rtype: int
+        """
+
+        def insert():
+            names = set().union(*rows)
+            fields = tuple(
+                field for field in WGData._meta.sorted_fields  # pylint: disable=protected-access
+                if field.name in names
+            )
+            defaults = {
+                field.name: field.default() if callable(field.default) else field.default
+                for field in fields
+            }
+            with database.atomic():
+                return insert_rows(
+                    WGData,
+                    fields,
+                    (tuple(row.get(field.name, defaults[field.name]) for field in fields) for row in rows),
+                )
+
+        if not rows:
+            return 0
+
+        return await self.run(insert)
+
+    async def render(self, server, **kwargs) -> tuple:
+        """
+        Renders the configs of a server and its peers, see WGRender
+        :param server: int or str: WGData id or wg_interface of the server
+        :returns: (server config: str, peer configs: dict of id: str)
+        :rtype: tuple
+        """
+
+        def render():
+            configs = WGRender(server, **kwargs)
+            return "".join(configs.server()), dict(configs.peers())
+
+        return await self.run(render)
+
+    async def close(self) -> None:
+        """
+        Waits for running calls, then closes the database
+        :returns: None
+        """
+        await asyncio.get_running_loop().run_in_executor(
+            None, self._executor.shutdown, True
+        )
+        if self._connect is not None:
+            self._connect.close()
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *_):
+        await self.close()
+
+    def __repr__(self) -> str:
+        """
+        Returns the wrapped connector and the worker limit
+        :returns: a text line
+        :rtype: str
+        """
+        if self._connect is None:
+            return f'AsyncDBConnect: Adapter "{self._setup[0]}", not started, workers {self._max_workers}'
+
+        return f"Async{self._connect!r}, workers {self._max_workers}"
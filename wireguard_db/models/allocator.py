@@ -0,0 +1,326 @@
+# -*- coding: utf-8 -*-
+__version__ = "0.1.0"
+__license__ = "GPLv3"
+__docformat__ = "reStructuredText"
+
+import threading
+from bisect import bisect_right
+from ipaddress import ip_address, ip_interface
+from peewee import SqliteDatabase
+from .tables import database, WGData, WGRelation  # pylint: disable=E0402
+
+
+def parse_addresses(wg_address: str) -> list:
+    """
+    Splits a wg_address value into interfaces
+    :param wg_address: str: e.g. '10.0.0.2/32, fd00::2/128'
+    :returns: list of ipaddress.IPv4Interface/IPv6Interface, invalid parts are skipped
+    :rtype: list
+    """
+    interfaces = []
+    for part in (wg_address or "").split(","):
+        try:
+            interfaces.append(ip_interface(part.strip()))
+        except ValueError:
+            continue
+
+    return interfaces
+
+
+class WGAllocator:
+    """
+    Hands out free addresses of a server subnet.
+    Free addresses are kept as sorted, non-overlapping intervals, built once
+    from the server and its related peers and updated incrementally.
+    Intervals used up by allocate() are skipped by a head index and dropped
+    in bulk, so allocations do not shift the lists.
+    """
+
+    def __init__(self, server, *, version: int = 4):
+        """
+        :param server: int or str: WGData id or wg_interface of the server
+        :param version: int: 4 or 6, which subnet of the server is used
+        ivar _starts: list: first free address (int) per interval
+        ivar _ends: list: last free address (int) per interval, inclusive
+        ivar _head: int: index of the first interval in use, those before are used up
+        ivar _free: int: free addresses, the sum of the intervals
+        ivar _last_relation: int: highest WGRelation id seen
+        """
+        if isinstance(server, int):
+            where = WGData.id == server
+        else:
+            where = WGData.wg_interface == server
+
+        self._server = WGData.select().where(where).first()
+        if self._server is None:
+            raise LookupError(f'Server "{server}" not found')
+
+        subnets = [
+            interface
+            for interface in parse_addresses(self._server.wg_address)
+            if version == interface.version
+        ]
+        if not subnets:
+            raise ValueError(f'Server "{server}" has no IPv{version} address')
+
+        self._interface = subnets[0]
+        self._lock = threading.RLock()
+        self._starts = []
+        self._ends = []
+        self._head = 0
+        self._free = 0
+        self._last_relation = 0
+        self.load()
+
+    @property
+    def network(self):
+        """
+        Gets the subnet addresses are allocated from
+        :returns: server subnet
+        :rtype: ipaddress.IPv4Network or ipaddress.IPv6Network
+        """
+        return self._interface.network
+
+    @property
+    def free(self) -> int:
+        """
+        Gets the number of free addresses
+        :returns: free addresses
+        :rtype: int
+        """
+        return self._free
+
+    def load(self) -> None:
+        """
+        Builds the index from the database
+        :returns: None
+        """
+        network = self.network
+        first, last = int(network.network_address), int(network.broadcast_address)
+        if network.num_addresses > 2:
+            # network (and for IPv4 broadcast) address are not handed out
+            first += 1
+            last -= 1 if 4 == network.version else 0
+
+        with self._lock:
+            self._starts, self._ends = [first], [last]
+            self._head = 0
+            self._free = last - first + 1
+            self._last_relation = 0
+            self._mark(self._interface.ip)
+            self.refresh()
+
+    def refresh(self) -> int:
+        """
+        Marks the addresses of peers related since the last load/refresh as used.
+        Addresses of deleted or changed peers are only given back by release() or load().
+        :returns: number of relations read
+        :rtype: int
+        """
+        query = (
+            WGRelation.select(WGRelation.id, WGData.wg_address)
+            .join(WGData, on=(WGRelation.WGPeer == WGData.id))
+            .where(
+                (WGRelation.WGParent == self._server.id)
+                & (WGRelation.id > self._last_relation)
+            )
+            .order_by(WGRelation.id)
+            .tuples()
+        )
+
+        count = 0
+        with self._lock:
+            for relation_id, wg_address in query.iterator():
+                for interface in parse_addresses(wg_address):
+                    if interface.ip in self.network:
+                        self._mark(interface.ip)
+                self._last_relation = relation_id
+                count += 1
+
+        return count
+
+    def _find(self, value: int) -> int:
+        """
+        Gets the index of the free interval holding value, or -1
+        """
+        index = bisect_right(self._starts, value, self._head) - 1
+        if index >= self._head and value <= self._ends[index]:
+            return index
+
+        return -1
+
+    def _mark(self, address) -> bool:
+        """
+        Removes one address from the free intervals
+        :returns: True if it was free
+        :rtype: bool
+        """
+        value = int(address)
+        index = self._find(value)
+        if index < 0:
+            return False
+
+        start, end = self._starts[index], self._ends[index]
+        if start == end and index == self._head:
+            self._head += 1
+        elif start == end:
+            del self._starts[index]
+            del self._ends[index]
+        elif value == start:
+            self._starts[index] = value + 1
+        elif value == end:
+            self._ends[index] = value - 1
+        else:
+            self._ends[index] = value - 1
+            self._starts.insert(index + 1, value + 1)
+            self._ends.insert(index + 1, end)
+
+        self._free -= 1
+        return True
+
+    def _drop_used(self) -> None:
+        """
+        Drops the used up intervals before the head once they are the most
+        """
+        if self._head > 64 and 2 * self._head > len(self._starts):
+            del self._starts[:self._head]
+            del self._ends[:self._head]
+            self._head = 0
+
+    def _interface_of(self, value: int) -> str:
+        """
+        Formats an allocated address as host interface
+        """
+        address = ip_address(value)
+        return f"{address}/{address.max_prefixlen}"
+
+    def peek(self) -> str:
+        """
+        Gets the next free address without allocating it
+        :returns: address as host interface, e.g. '10.0.0.2/32', or None if exhausted
+        :rtype: str
+        """
+        with self._lock:
+            if self._head == len(self._starts):
+                return None
+            return self._interface_of(self._starts[self._head])
+
+    def allocate(self, count: int = 1) -> list:
+        """
+        Allocates the lowest free addresses
+        :param count: int: number of addresses
+        :returns: addresses as host interfaces, e.g. ['10.0.0.2/32']
+        :rtype: list
+        """
+        if not isinstance(count, int) or count < 1:
+            raise ValueError('"count" must be a positive integer')
+
+        with self._lock:
+            if self._free < count:
+                raise LookupError(f"{self.network} has less than {count} free addresses")
+
+            allocated = []
+            while len(allocated) < count:
+                head = self._head
+                start, end = self._starts[head], self._ends[head]
+                take = min(count - len(allocated), end - start + 1)
+                allocated.extend(range(start, start + take))
+
+                if start + take > end:
+                    self._head += 1
+                else:
+                    self._starts[head] = start + take
+
+            self._free -= count
+            self._drop_used()
+
+        return [self._interface_of(value) for value in allocated]
+
+    def reserve(self, address: str) -> None:
+        """
+        Marks an address as used, e.g. for gateways outside the database
+        :param address: str: address, with or without prefix
+        :returns: None
+        """
+        interface = ip_interface(address)
+        if interface.ip not in self.network:
+            raise ValueError(f'"{address}" is not within {self.network}')
+
+        with self._lock:
+            if not self._mark(interface.ip):
+                raise ValueError(f'"{address}" is not free')
+
+    def release(self, address: str) -> None:
+        """
+        Gives an address back
+        :param address: str: address, with or without prefix
+        :returns: None
+        """
+        interface = ip_interface(address)
+        if interface.ip not in self.network or interface.ip == self._interface.ip:
+            raise ValueError(f'"{address}" can not be released')
+
+        value = int(interface.ip)
+        with self._lock:
+            if self._find(value) >= 0:
+                return
+
+            self._free += 1
+            index = bisect_right(self._starts, value, self._head)
+            merge_left = index > self._head and self._ends[index - 1] == value - 1
+            merge_right = index < len(self._starts) and self._starts[index] == value + 1
+
+            if merge_left and merge_right:
+                self._ends[index - 1] = self._ends[index]
+                del self._starts[index]
+                del self._ends[index]
+            elif merge_left:
+                self._ends[index - 1] = value
+            elif merge_right:
+                self._starts[index] = value
+            elif index == self._head and self._head > 0:
+                # in front of all others, the slot of a used up one is taken
+                self._head -= 1
+                self._starts[self._head] = value
+                self._ends[self._head] = value
+            else:
+                self._starts.insert(index, value)
+                self._ends.insert(index, value)
+
+    def assign(self, peer: WGData) -> str:
+        """
+        Allocates an address for a peer, saves it and relates it to the server.
+        The server row is locked meanwhile, so allocators in other processes
+        see the address before they pick their own.
+        :param peer: WGData: new or existing peer row
+        :returns: address assigned
+        :rtype: str
+        """
+        with self._lock:
+            if isinstance(database.obj, SqliteDatabase):
+                # take the write lock right away
+                transaction = database.atomic("IMMEDIATE")
+            else:
+                transaction = database.atomic()
+
+            with transaction:
+                if not isinstance(database.obj, SqliteDatabase):
+                    WGData.select(WGData.id).where(
+                        WGData.id == self._server.id
+                    ).for_update().execute()
+
+                self.refresh()
+                address = self.allocate()[0]
+                previous, peer.wg_address = peer.wg_address, address
+                try:
+                    peer.save()
+                    relation, _ = WGRelation.get_or_create(WGParent=self._server, WGPeer=peer)
+                except Exception:
+                    # rolled back, the address is free again
+                    peer.wg_address = previous
+                    self.release(address)
+                    raise
+
+                self._last_relation = max(self._last_relation, relation.id)
+
+        return address
@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+__version__ = "0.1.0"
+__license__ = "GPLv3"
+__docformat__ = "reStructuredText"
+
+from datetime import datetime
+from .bulk import chunk_size, insert_rows, log_changes  # pylint: disable=E0402
+from .tables import database, WGData, WGRelation  # pylint: disable=E0402
+
+# WGData fields a partial mesh can be selected by
+MESH_FILTERS = ("host_id", "config_class", "wg_interface")
+
+
+class WGMeshBuilder:
+    """
+    Creates the WGRelation edges of a topology in bulk.
+    Only edges missing in the database are inserted, conflicting inserts
+    are ignored, so running a builder twice changes nothing.
+    """
+
+    def __init__(self, *, batch_size: int = 20000, topology=None):
+        """
+        :param batch_size: int: edges written within one transaction
+        :param topology: WGTopology: optional, gets the new edges added
+        ivar _inserted: int: edges inserted by the last build
+        """
+        if not isinstance(batch_size, int) or batch_size < 1:
+            raise ValueError('"batch_size" must be a positive integer')
+
+        self._batch_size = batch_size
+        self._topology = topology
+        self._inserted = 0
+
+    @property
+    def inserted(self) -> int:
+        """
+        Gets the number of edges inserted by the last build
+        :returns: edges inserted
+        :rtype: int
+        """
+        return self._inserted
+
+    @staticmethod
+    def _ids(nodes) -> list:
+        """
+        Turns WGData rows or ids into a list of unique ids, in order
+        """
+        ids = [node.id if isinstance(node, WGData) else int(node) for node in nodes]
+        return list(dict.fromkeys(ids))
+
+    def _existing(self, parents: list, peers: set) -> dict:
+        """
+        Reads the edges from parents to peers that exist already
+        :returns: parent id -> set of peer ids
+        :rtype: dict
+        """
+        existing = {}
+        # parents are chunked to stay below the bound parameter limits
+        size = chunk_size(1)
+        for start in range(0, len(parents), size):
+            query = WGRelation.select(WGRelation.WGParent, WGRelation.WGPeer).where(
+                WGRelation.WGParent.in_(parents[start:start + size])
+            )
+            # plain ids, no row objects needed
+            for parent, peer in database.execute(query):
+                if peer in peers:
+                    existing.setdefault(parent, set()).add(peer)
+
+        return existing
+
+    def build(self, parents, peers) -> int:
+        """
+        Creates the missing edges from every parent to every peer, no self edges
+        :param parents: iterable of WGData or ids
+        :param peers: iterable of WGData or ids
+        :returns: edges inserted
+        :rtype: int
+        """
+        parents, peers = self._ids(parents), self._ids(peers)
+        peer_set = set(peers)
+        fields = (WGRelation.WGParent, WGRelation.WGPeer, WGRelation.created)
+        self._inserted = 0
+
+        # parents are handled in slices, so only their existing edges are in memory
+        step = max(1, self._batch_size // max(1, len(peers)))
+        for start in range(0, len(parents), step):
+            part = parents[start:start + step]
+            existing = self._existing(part, peer_set)
+            now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+            missing = [
+                (parent, peer, now)
+                for parent in part
+                for peer in peers
+                if parent != peer and peer not in existing.get(parent, ())
+            ]
+            if not missing:
+                continue
+
+            with database.atomic():
+                self._inserted += insert_rows(
+                    WGRelation, fields, missing, ignore=True, convert=False
+                )
+                # the edges are not known by id, their parents are
+                log_changes("created", [("WGRelation", None, parent) for parent in dict.fromkeys(row[0] for row in missing)])
+
+            if self._topology is not None:
+                for parent, peer, _ in missing:
+                    self._topology.add(parent, peer)
+
+        return self._inserted
+
+    def full_mesh(self, nodes) -> int:
+        """
+        Connects every node with every other node, in both directions
+        :param nodes: iterable of WGData or ids
+        :returns: edges inserted
+        :rtype: int
+        """
+        nodes = self._ids(nodes)
+        return self.build(nodes, nodes)
+
+    def hub_and_spoke(self, hubs, spokes) -> int:
+        """
+        Connects every hub (parent) with every spoke (peer)
+        :param hubs: iterable of WGData or ids, or a single one
+        :param spokes: iterable of WGData or ids
+        :returns: edges inserted
+        :rtype: int
+        """
+        if isinstance(hubs, (int, WGData)):
+            hubs = [hubs]
+
+        return self.build(hubs, spokes)
+
+    def partial_mesh(self, **filters) -> int:
+        """
+        Full mesh of the rows matching all filters, e.g. host_id=3
+        :param filters: WGData field values, any of MESH_FILTERS
+        :returns: edges inserted
+        :rtype: int
+        """
+        if not filters:
+            raise ValueError(f"At least one filter of {MESH_FILTERS} is required")
+
+        query = WGData.select(WGData.id)
+        for name, value in filters.items():
+            if name not in MESH_FILTERS:
+                raise ValueError(f'"{name}" is not any of {MESH_FILTERS}')
+            query = query.where(getattr(WGData, name) == value)
+
+        return self.full_mesh(row[0] for row in query.order_by(WGData.id).tuples())
@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+__version__ = "0.1.0"
+__license__ = "GPLv3"
+__docformat__ = "reStructuredText"
+
+from itertools import chain
+from peewee import MySQLDatabase, SqliteDatabase
+from .tables import CHANGE_FIELDS, database, WGChange  # pylint: disable=E0402
+
+# sqlite builds before 3.32 allow no more than 999 bound parameters
+SQLITE_MAX_VARIABLES = 999
+# rows per statement for the other adapters
+MAX_ROWS = 1000
+
+# INSERT statements: (database class, model, fields, rows, returning, ignore) -> sql
+_statements = {}
+
+
+def chunk_size(columns: int) -> int:
+    """
+    Rows per INSERT statement for the bound database
+    :param columns: int: values per row
+    :returns: number of rows
+    :rtype: int
+    """
+    if isinstance(database.obj, SqliteDatabase):
+        return max(1, SQLITE_MAX_VARIABLES // columns)
+
+    return MAX_ROWS
+
+
+def _defaults(model, fields: tuple) -> tuple:
+    """
+    Fields with a default missing in fields, peewee adds them to the INSERT
+    """
+    # fields compare to expressions, names are compared instead
+    names = {field.name for field in fields}
+    return tuple(
+        field for field in model._meta.defaults if field.name not in names  # pylint: disable=protected-access
+    )
+
+
+def execute_insert(
+    model, fields: tuple, rows: list, *, returning: bool = False, ignore: bool = False, convert: bool = True, conflict: tuple = None
+):
+    """
+    Runs one multi-row INSERT. The statement is built by peewee once per
+    row count and reused, the values are only converted by the fields.
+    :param model: peewee.Model: table to insert into
+    :param fields: tuple: fields in row order, missing fields with a default
+            get it, evaluated once per statement
+    :param rows: list of row tuples, at most chunk_size() of all columns
+    :param returning: bool: add a RETURNING clause for the primary key
+    :param ignore: bool: skip rows conflicting with a unique index
+    :param convert: bool: pass values through the fields' db_value,
+            False if the rows hold database values already
+    :param conflict: tuple: fields of a unique index, a conflicting row
+            is updated with the other fields (upsert)
+    :returns: DB-API cursor
+    """
+    key = (type(database.obj), model, fields, len(rows), returning, ignore, conflict)
+    sql = _statements.get(key)
+    missing = _defaults(model, fields)
+
+    if sql is None:
+        columns = fields + missing
+        query = model.insert_many([(None,) * len(columns)] * len(rows), fields=columns)
+        if returning:
+            query = query.returning(model._meta.primary_key)
+        if ignore:
+            query = query.on_conflict_ignore()
+        if conflict:
+            names = {field.name for field in conflict}
+            query = query.on_conflict(
+                # mysql updates on any unique index, a target is not accepted
+                conflict_target=None if isinstance(database.obj, MySQLDatabase) else conflict,
+                preserve=[field for field in fields if field.name not in names],
+            )
+        sql, _ = query.sql()
+        _statements[key] = sql
+
+    if convert:
+        converters = [field.db_value for field in fields]
+        rows = [
+            [converter(value) for converter, value in zip(converters, row)]
+            for row in rows
+        ]
+
+    if missing:
+        extra = tuple(
+            field.db_value(field.default() if callable(field.default) else field.default)
+            for field in missing
+        )
+        rows = [tuple(row) + extra for row in rows]
+
+    params = list(chain.from_iterable(rows))
+
+    return database.execute_sql(sql, params)
+
+
+def insert_rows(model, fields: tuple, rows, *, ignore: bool = False, convert: bool = True, conflict: tuple = None) -> int:
+    """
+    Inserts any number of rows in statements of chunk_size() rows.
+    Runs within the caller's transaction, if any.
+    :param model: peewee.Model: table to insert into
+    :param fields: tuple: fields in row order, see execute_insert()
+    :param rows: iterable of row tuples
+    :param ignore: bool: skip rows conflicting with a unique index
+    :param convert: bool: see execute_insert()
+    :param conflict: tuple: see execute_insert()
+    :returns: number of rows inserted
+    :rtype: int
+    """
+    size = chunk_size(len(fields) + len(_defaults(model, fields)))
+    inserted = 0
+    chunk = []
+
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == size:
+            inserted += execute_insert(
+                model, fields, chunk, ignore=ignore, convert=convert, conflict=conflict
+            ).rowcount
+            chunk = []
+
+    if chunk:
+        inserted += execute_insert(
+            model, fields, chunk, ignore=ignore, convert=convert, conflict=conflict
+        ).rowcount
+
+    return inserted
+
+
+def log_changes(action: str, entries) -> int:
+    """
+    Logs changes made by bulk queries for the change feed, see WGChange.
+    Call it within the transaction of the change.
+    :param action: str: 'created', 'updated' or 'deleted'
+    :param entries: iterable of (table, row id, parent id)
+    :returns: number of entries logged
+    :rtype: int
+    """
+    return insert_rows(WGChange, CHANGE_FIELDS, (entry + (action,) for entry in entries))
@@ -0,0 +1,232 @@
+# -*- coding: utf-8 -*-
+__version__ = "0.1.0"
+__license__ = "GPLv3"
+__docformat__ = "reStructuredText"
+
+import time
+from datetime import datetime
+from peewee import fn
+from .bulk import chunk_size  # pylint: disable=E0402
+from .render import WGRender  # pylint: disable=E0402
+from .tables import database, WGChange, WGData, WGRelation  # pylint: disable=E0402
+
+# seconds a change id missing below the cursor is read again: its
+# transaction may commit later, or was rolled back and leaves a gap
+GAP_TIMEOUT = 60.0
+# missing ids followed at most
+MAX_GAPS = 10000
+
+
+def _timestamp(value) -> datetime:
+    """
+    Turns a timestamp given as datetime or str into a datetime
+    """
+    if isinstance(value, datetime):
+        return value.replace(microsecond=0)
+
+    if isinstance(value, str):
+        return datetime.strptime(value, "%Y-%m-%d %H:%M:%S")
+
+    raise ValueError(f'"{value}" is no timestamp, use a datetime or "YYYY-MM-DD HH:MM:SS"')
+
+
+class WGChangeFeed:
+    """
+    Rows, relations and deletions since a cursor, read from the change log
+    WGChange. The cursor is the highest log id read. Ids are taken when a
+    change is written, not when it commits, so a lower id may show up after
+    a higher one: ids missing below the cursor are read again until they
+    show up or gap_timeout passes.
+    Changes made through model instances are logged, bulk writers log
+    theirs by bulk.log_changes().
+    """
+
+    def __init__(self, cursor: int = 0, *, gap_timeout: float = GAP_TIMEOUT):
+        """
+        :param cursor: int: log id to start after, 0 for everything, see head()
+        :param gap_timeout: float: seconds a missing id is read again
+        ivar _cursor: int: highest log id seen
+        ivar _gaps: dict: missing log id -> monotonic time it was first missed
+        """
+        if not isinstance(cursor, int) or cursor < 0:
+            raise ValueError('"cursor" must be a non negative integer')
+
+        self._cursor = cursor
+        self._gap_timeout = gap_timeout
+        self._gaps = {}
+
+    @property
+    def cursor(self) -> int:
+        """
+        Gets the cursor the next call starts from
+        :returns: highest log id seen
+        :rtype: int
+        """
+        return self._cursor
+
+    @property
+    def gaps(self) -> tuple:
+        """
+        Gets the missing log ids below the cursor still read again
+        :returns: log ids
+        :rtype: tuple
+        """
+        return tuple(sorted(self._gaps))
+
+    @staticmethod
+    def head() -> int:
+        """
+        Gets the highest log id, a cursor for changes from now on
+        :returns: log id, 0 if nothing was logged
+        :rtype: int
+        """
+        return WGChange.select(fn.MAX(WGChange.id)).scalar() or 0
+
+    def _entries(self, since: int, gaps: list) -> list:
+        """
+        Reads the log entries after since and of the missing ids
+        """
+        fields = (WGChange.id, WGChange.row_table, WGChange.row_id, WGChange.parent_id, WGChange.action)
+        entries = list(database.execute(WGChange.select(*fields).where(WGChange.id > since)))
+
+        size = chunk_size(1)
+        for start in range(0, len(gaps), size):
+            query = WGChange.select(*fields).where(WGChange.id.in_(gaps[start:start + size]))
+            entries.extend(database.execute(query))
+
+        return sorted(entries)
+
+    def changes(self, since: int = None) -> dict:
+        """
+        Reads the changes since a cursor, does not move the own cursor,
+        see advance()
+        :param since: int: cursor (default: own cursor and its gaps)
+        :returns: dict with cursor, gaps, rows (WGData dicts), relations
+                (id, parent) and tombstones (table, row id, parent id)
+        :rtype: dict
+        """
+        if since is None:
+            since, gaps = self._cursor, dict(self._gaps)
+        else:
+            gaps = {}
+
+        entries = self._entries(since, sorted(gaps))
+        row_ids, relations, tombstones = set(), [], []
+
+        for _, row_table, row_id, parent_id, action in entries:
+            if "deleted" == action:
+                tombstones.append((row_table, row_id, parent_id))
+            elif "WGRelation" == row_table:
+                relations.append((row_id, parent_id))
+            elif row_id is not None:
+                row_ids.add(row_id)
+
+        rows = []
+        ids = sorted(row_ids)
+        size = chunk_size(1)
+        for start in range(0, len(ids), size):
+            # rows deleted since are reported by their tombstone
+            rows.extend(WGData.select().where(WGData.id.in_(ids[start:start + size])).order_by(WGData.id).dicts())
+
+        # ids skipped by the new entries are waited for, the old gaps until
+        # they are seen or time out
+        now = time.monotonic()
+        seen = {entry[0] for entry in entries}
+        gaps = {
+            log_id: missed for log_id, missed in gaps.items()
+            if log_id not in seen and now - missed < self._gap_timeout
+        }
+        cursor = since
+        for log_id in sorted(log_id for log_id in seen if log_id > since):
+            for missing in range(cursor + 1, min(log_id, cursor + 1 + MAX_GAPS - len(gaps))):
+                gaps[missing] = now
+            cursor = log_id
+
+        return {"cursor": cursor, "gaps": gaps, "rows": rows, "relations": relations, "tombstones": tombstones}
+
+    def advance(self, changes: dict) -> None:
+        """
+        Moves the own cursor past changes read from it
+        :param changes: dict: as returned by changes()
+        :returns: None
+        """
+        self._cursor = changes["cursor"]
+        self._gaps = dict(changes["gaps"])
+
+    @staticmethod
+    def interfaces(changes: dict) -> tuple:
+        """
+        Gets the interfaces (parents) whose configs are affected by changes.
+        A changed row affects its parents, and itself if it has peers or
+        no parents (a standalone interface).
+        :param changes: dict: as returned by changes()
+        :returns: (set of WGData ids to render, set of deleted WGData ids)
+        :rtype: tuple
+        """
+        changed = [row["id"] for row in changes["rows"]]
+        touched = {parent for _, parent in changes["relations"]}
+        deleted = set()
+
+        for row_table, row_id, parent_id in changes["tombstones"]:
+            if parent_id is not None:
+                touched.add(parent_id)
+            elif "WGData" == row_table:
+                deleted.add(row_id)
+
+        has_parents = set()
+        size = chunk_size(2)
+        for start in range(0, len(changed), size):
+            chunk = changed[start:start + size]
+            query = WGRelation.select(WGRelation.WGParent, WGRelation.WGPeer).where(
+                WGRelation.WGParent.in_(chunk) | WGRelation.WGPeer.in_(chunk)
+            )
+            chunk = set(chunk)
+            for parent, peer in database.execute(query):
+                touched.add(parent)
+                if peer in chunk:
+                    has_parents.add(peer)
+
+        touched.update(row_id for row_id in changed if row_id not in has_parents)
+
+        # rows deleted after the change have nothing left to render
+        existing = set()
+        ids = sorted(touched - deleted)
+        size = chunk_size(1)
+        for start in range(0, len(ids), size):
+            query = WGData.select(WGData.id).where(WGData.id.in_(ids[start:start + size]))
+            existing.update(row[0] for row in database.execute(query))
+
+        return existing, deleted
+
+    def regenerate(self, write, remove=None, *, enabled_only: bool = True) -> dict:
+        """
+        Renders only the interfaces affected since the cursor. The cursor
+        moves on once all of them were handled, so a failed run is repeated.
+        :param write: callable: write(render: WGRender), per affected interface
+        :param remove: callable: remove(id: int), per deleted WGData row
+        :param enabled_only: bool: passed to WGRender
+        :returns: dict with rendered and removed counts
+        :rtype: dict
+        """
+        changes = self.changes()
+        touched, deleted = self.interfaces(changes)
+
+        for server in sorted(touched):
+            write(WGRender(server, enabled_only=enabled_only))
+
+        if remove is not None:
+            for server in sorted(deleted):
+                remove(server)
+
+        self.advance(changes)
+        return {"rendered": len(touched), "removed": len(deleted)}
+
+    @staticmethod
+    def purge(before) -> int:
+        """
+        Deletes log entries older than a timestamp, read by every feed in use
+        :param before: datetime or str: timestamp
+        :returns: number of entries deleted
+        :rtype: int
+        """
+        return WGChange.delete().where(WGChange.changed < _timestamp(before)).execute()
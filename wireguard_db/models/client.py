@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+"""
+Asks the config daemon (wireguard_db.models.daemon), e.g. from a wg-quick hook:
+
+    python -m wireguard_db.models.client render wg0 > /etc/wireguard/wg0.conf
+
+Imports neither peewee nor a database driver, only the standard library.
+"""
+__version__ = "0.1.0"
+__license__ = "GPLv3"
+__docformat__ = "reStructuredText"
+
+import json
+import socket
+import sys
+from .constants import SOCKET_PATH  # pylint: disable=E0402
+
+# seconds to wait for the daemon
+TIMEOUT = 5.0
+
+
+class WGClient:
+    """
+    Client of WGDaemon, one connection for any number of requests
+    """
+
+    def __init__(self, path: str = SOCKET_PATH, *, timeout: float = TIMEOUT):
+        """
+        :param path: str: socket file of the daemon
+        :param timeout: float: seconds to wait for an answer
+        ivar _socket: socket.socket: connected on first request
+        """
+        self._path = path
+        self._timeout = timeout
+        self._socket = None
+        self._file = None
+
+    def close(self) -> None:
+        """
+        Closes the connection
+        :returns: None
+        """
+        if self._socket is not None:
+            self._file.close()
+            self._socket.close()
+            self._socket = self._file = None
+
+    def request(self, command: str, argument: str = ""):
+        """
+        Sends one request
+        :param command: str: render, peers, peer, stats or ping
+        :param argument: str: interface name, id or public key
+        :returns: the result of the answer
+        :raises LookupError: if not found, ValueError on other errors
+        """
+        if self._socket is None:
+            connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            connection.settimeout(self._timeout)
+            try:
+                connection.connect(self._path)
+            except OSError:
+                connection.close()
+                raise
+            self._socket, self._file = connection, connection.makefile("rb")
+
+        self._socket.sendall(f"{command} {argument}".strip().encode("utf8") + b"\n")
+        line = self._file.readline()
+        if not line:
+            self.close()
+            raise ConnectionError("The daemon closed the connection")
+
+        answer = json.loads(line)
+        if not answer["ok"]:
+            raise (LookupError if "LookupError" == answer.get("type") else ValueError)(answer["error"])
+
+        return answer["result"]
+
+    def render(self, server) -> str:
+        """
+        Gets the config of a server
+        :param server: int or str: WGData id or wg_interface
+        :returns: config text
+        :rtype: str
+        """
+        return self.request("render", str(server))
+
+    def peers(self, server) -> list:
+        """
+        Gets the peers of a server
+        :param server: int or str: WGData id or wg_interface
+        :returns: row dicts, timestamps as str
+        :rtype: list
+        """
+        return self.request("peers", str(server))
+
+    def peer(self, public_key: str) -> dict:
+        """
+        Gets the row of a public key
+        :param public_key: str: base64 public key
+        :returns: row dict, timestamps as str
+        :rtype: dict
+        """
+        return self.request("peer", public_key)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+
+def main(argv=None) -> int:
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv:
+        print("usage: client <render|peers|peer|stats|ping> [argument]", file=sys.stderr)
+        return 2
+
+    try:
+        with WGClient() as client:
+            result = client.request(argv[0], " ".join(argv[1:]))
+    except (LookupError, ValueError, OSError) as error:
+        print(error, file=sys.stderr)
+        return 1
+
+    if isinstance(result, str):
+        sys.stdout.write(result if "render" == argv[0] else result + "\n")
+    else:
+        print(json.dumps(result, indent=2))
+    return 0
+
+
+if "__main__" == __name__:
+    sys.exit(main())
@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+__version__ = "0.1.0"
+__license__ = "GPLv3"
+__docformat__ = "reStructuredText"
+
+import threading
+import time
+from datetime import datetime
+from ..utils.parser import parse_dump  # pylint: disable=E0402
+from .bulk import chunk_size, insert_rows  # pylint: disable=E0402
+from .tables import add_listener, remove_listener, database, timestamp, WGData, WGPeerState  # pylint: disable=E0402
+
+# seconds since the latest handshake a peer counts as connected,
+# WireGuard drops a session after 180 seconds without a new handshake
+CONNECTED_AFTER = 180
+
+
+class WGCollector:
+    """
+    Stores the peer state reported by 'wg show all dump' in WGPeerState.
+    Peers are matched by the indexed WGData.wg_publickey, the ids are
+    cached between scrapes. Each scrape writes all states with one batched
+    upsert and flips WGData.is_connected only for peers that changed.
+    """
+
+    def __init__(self, *, connected_after: int = CONNECTED_AFTER, watch: bool = True, traffic=None):
+        """
+        :param connected_after: int: seconds a handshake keeps a peer connected
+        :param watch: bool: drop cached ids of rows changed through the models
+        :param traffic: WGTrafficStore: optional, gets the counters of each scrape
+        ivar _ids: dict: public key -> WGData id
+        ivar _keys: dict: WGData id -> public key, the reverse of _ids
+        ivar _unknown: set: public keys without a row, not looked up again
+        ivar _connected: dict: WGData id -> is_connected as last written
+        """
+        self._connected_after = connected_after
+        self._traffic = traffic
+        self._lock = threading.RLock()
+        self._ids = {}
+        self._keys = {}
+        self._unknown = set()
+        self._connected = {}
+        self._watching = False
+
+        if watch:
+            add_listener(self._changed)
+            self._watching = True
+
+    def close(self) -> None:
+        """
+        Stops following changes
+        :returns: None
+        """
+        if self._watching:
+            remove_listener(self._changed)
+            self._watching = False
+
+    def _changed(self, model, action: str, instance) -> None:
+        """
+        Listener for model changes, a public key may have moved or gone
+        """
+        if model is not WGData:
+            return
+
+        with self._lock:
+            # the new key is read again, the old one is forgotten
+            self._unknown.discard(instance.wg_publickey)
+            for key in (self._keys.pop(instance.id, None), instance.wg_publickey):
+                row_id = self._ids.pop(key, None)
+                if row_id is not None and row_id != instance.id:
+                    self._keys.pop(row_id, None)
+            self._connected.pop(instance.id, None)
+
+    def _lookup(self, keys: set) -> None:
+        """
+        Reads the ids of public keys not cached yet
+        """
+        missing = [key for key in keys if key not in self._ids and key not in self._unknown]
+        size = chunk_size(1)
+
+        for start in range(0, len(missing), size):
+            query = WGData.select(WGData.wg_publickey, WGData.id, WGData.is_connected).where(
+                WGData.wg_publickey.in_(missing[start:start + size])
+            )
+            for public_key, row_id, connected in database.execute(query):
+                self._ids[public_key] = row_id
+                self._keys[row_id] = public_key
+                self._connected[row_id] = bool(connected)
+
+        self._unknown.update(key for key in missing if key not in self._ids)
+
+    def scrape(self, source, now: float = None) -> dict:
+        """
+        Parses a dump and writes the state of all known peers
+        :param source: str or iterable of lines, e.g. a file object or sys.stdin
+        :param now: float: epoch seconds of the scrape (default: now)
+        :returns: dict with peers, matched, unknown and connected counts
+        :rtype: dict
+        """
+        now = time.time() if now is None else now
+        peers = list(parse_dump(source))
+        updated = timestamp()
+
+        with self._lock:
+            self._lookup({peer["public_key"] for peer in peers})
+
+            # one row per peer, the upsert must not touch a row twice: a key
+            # reported by several interfaces takes its latest handshake
+            latest, unknown = {}, 0
+            for peer in peers:
+                row_id = self._ids.get(peer["public_key"])
+                if row_id is None:
+                    unknown += 1
+                elif row_id not in latest or (peer["handshake"] or 0) >= (latest[row_id]["handshake"] or 0):
+                    latest[row_id] = peer
+
+            rows, samples, flips = [], [], {True: [], False: []}
+            for row_id, peer in latest.items():
+                handshake = peer["handshake"] or None
+                connected = handshake is not None and now - handshake <= self._connected_after
+                if handshake is not None:
+                    handshake = datetime.fromtimestamp(handshake).strftime("%Y-%m-%d %H:%M:%S")
+
+                rows.append((row_id, peer["interface"], peer["endpoint"], handshake, peer["rx"], peer["tx"], connected, updated))
+                samples.append((row_id, peer["rx"], peer["tx"], peer["handshake"]))
+                if self._connected.get(row_id) != connected:
+                    flips[connected].append(row_id)
+
+            fields = (
+                WGPeerState.peer, WGPeerState.interface, WGPeerState.endpoint, WGPeerState.handshake,
+                WGPeerState.rx, WGPeerState.tx, WGPeerState.is_connected, WGPeerState.updated,
+            )
+            with database.atomic():
+                insert_rows(WGPeerState, fields, rows, conflict=(WGPeerState.peer,))
+
+                size = chunk_size(1)
+                for connected, ids in flips.items():
+                    for start in range(0, len(ids), size):
+                        # bulk update, no listener sees is_connected
+                        WGData.update(is_connected=connected).where(
+                            WGData.id.in_(ids[start:start + size])
+                        ).execute()
+
+            for connected, ids in flips.items():
+                for row_id in ids:
+                    self._connected[row_id] = connected
+
+        if self._traffic is not None:
+            self._traffic.append(samples, now)
+
+        return {
+            "peers": len(peers),
+            "matched": len(peers) - unknown,
+            "unknown": unknown,
+            "connected": sum(1 for row in rows if row[6]),
+        }
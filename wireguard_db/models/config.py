@@ -7,15 +7,86 @@ __license__ = "GPLv3"
 __docformat__ = "reStructuredText"
 
 import os
+import threading
 from pathlib import Path
+from types import MappingProxyType
 import yaml
 from .constants import (  # pylint: disable=relative-beyond-top-level
     ADAPTERS,
     CONFIG_PATH,
     DBCONFIG_FILE,
+    POOL_PARAMS,
+    ROUTING_POLICIES,
     SAMPLE_CONFIG,
 )
 
+try:
+    # libyaml, if available
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader
+
+# parsed config files: path -> (mtime_ns, size, setup)
+_cache = {}
+_cache_lock = threading.Lock()
+# callables notified with the path if a config file changed
+_watchers = []
+
+
+def _freeze(value):
+    """
+    Returns a read-only copy: dicts become mapping proxies, lists tuples
+    """
+    if isinstance(value, dict):
+        return MappingProxyType({key: _freeze(val) for key, val in value.items()})
+
+    if isinstance(value, list):
+        return tuple(_freeze(val) for val in value)
+
+    return value
+
+
+def _thaw(value):
+    """
+    Returns a plain copy of a frozen value, e.g. for yaml.dump
+    """
+    if isinstance(value, MappingProxyType):
+        return {key: _thaw(val) for key, val in value.items()}
+
+    if isinstance(value, tuple):
+        return [_thaw(val) for val in value]
+
+    return value
+
+
+def _load(configfile: Path, *, reload: bool = False):
+    """
+    Parses a config file once, again only if its mtime or size changed
+    :param configfile: Path: config file
+    :param reload: bool: parse in any case
+    :returns: the parsed config, read-only
+    :rtype: MappingProxyType
+    """
+    stat = configfile.stat()
+    key = str(configfile)
+
+    with _cache_lock:
+        cached = _cache.get(key)
+        if not reload and cached and cached[0:2] == (stat.st_mtime_ns, stat.st_size):
+            return cached[2]
+
+    with configfile.open("r", encoding="utf8") as config:
+        setup = _freeze(yaml.load(config, Loader=SafeLoader) or {})
+
+    with _cache_lock:
+        _cache[key] = (stat.st_mtime_ns, stat.st_size, setup)
+        watchers = list(_watchers) if cached and cached[2] != setup else []
+
+    for watcher in watchers:
+        watcher(key)
+
+    return setup
+
 
 class DBConfig:
     """
@@ -66,15 +137,16 @@ class DBConfig:
 
         self._configfile = configfile
 
-    def read(self, *, config_adapter: str = "defaults", config_file: str = "default") -> tuple:  # pylint: disable=too-many-branches
+    def read(self, *, config_adapter: str = "defaults", config_file: str = "default", reload: bool = False) -> tuple:  # pylint: disable=too-many-branches
         """
-        Reads a config file
+        Reads a config file, parsed files are cached by path, mtime and size
         :param config_adapter: str, optional: any of
                 ('defaults', 'sqlite3', 'mysql', 'postgresql')
                 ('defaults' reads the default adapter from config file)
         :param config_file: str, optional: filename inclusive path to be used
                 ('default' uses previous set filename)
-        :returns: (adapter: str, setup: dict)
+        :param reload: bool, optional: parse the file even if cached
+        :returns: (adapter: str, setup: read-only mapping)
         :rtype: tuple
         """
         # initialize class vars
@@ -101,8 +173,7 @@ class DBConfig:
         if not configfile.is_file():
             raise ValueError(f'"{configfile}" does not exist.')
 
-        with configfile.open("r", encoding="utf8") as config:
-            setup = yaml.safe_load(config)
+        setup = _load(configfile, reload=reload)
 
         adapter = None
 
@@ -134,16 +205,120 @@ class DBConfig:
                 f'Missing "database" key for "{adapter}" in config "{configfile}"'
             )
 
-        if "connect" not in setup[adapter]:
+        section = _thaw(setup[adapter])
+
+        if "connect" not in section:
             print(f'WARN: Missing "connect" section for "{adapter}", using defaults.')
-            setup[adapter]["connect"] = {}
+            section["connect"] = {}
+
+        if "pool" in section:
+            pool = section["pool"] or {}
+
+            if not isinstance(pool, dict):
+                raise ValueError(f'"pool" for "{adapter}" is not a section')
+
+            for key, value in pool.items():
+                if key not in POOL_PARAMS:
+                    raise ValueError(f'"pool" key "{key}" not implemented')
+
+                if value is not None and not isinstance(value, int):
+                    raise ValueError(f'"pool" key "{key}" is not an integer')
+
+            section["pool"] = pool
+
+        if "replicas" in section:
+            replicas = section["replicas"] or []
+
+            if not isinstance(replicas, list):
+                raise ValueError(f'"replicas" for "{adapter}" is not a list')
+
+            for replica in replicas:
+                if not isinstance(replica, dict) or "database" not in replica:
+                    raise ValueError(f'Every replica for "{adapter}" needs a "database" key')
+
+            routing = section.setdefault("routing", ROUTING_POLICIES[0])
+            if routing not in ROUTING_POLICIES:
+                raise ValueError(f'"routing" "{routing}" is not any of {ROUTING_POLICIES}')
+
+            section["replicas"] = replicas
 
         self._configfile = configfile
         self._adapter = adapter
-        self._setup = (self._adapter, setup[adapter])
+        self._setup = (self._adapter, _freeze(section))
 
         return self._setup
 
+    def reload(self, *, config_adapter: str = None) -> tuple:
+        """
+        Reads the config file again, bypassing the cache
+        :param config_adapter: str, optional: adapter (default: as read before)
+        :returns: (adapter: str, setup: read-only mapping)
+        :rtype: tuple
+        """
+        return self.read(
+            config_adapter=config_adapter or self._adapter or "defaults", reload=True
+        )
+
+    def read_shards(self, *, config_file: str = "default", reload: bool = False) -> tuple:
+        """
+        Reads the "shards" section: the databases WGData rows are spread over.
+        Each shard takes its adapter section, overridden by its own keys.
+        :param config_file: str, optional: see read()
+        :param reload: bool, optional: see read()
+        :returns: (key: WGData field name, shards: dict name -> setup as from read())
+        :rtype: tuple
+        """
+        if "default" != config_file:
+            self.filename = config_file
+        elif self._configfile is None:
+            self.filename = CONFIG_PATH + os.path.sep + DBCONFIG_FILE
+
+        if not self._configfile.is_file():
+            raise ValueError(f'"{self._configfile}" does not exist.')
+
+        shards = _thaw(_load(self._configfile, reload=reload).get("shards"))
+        if not isinstance(shards, dict) or not isinstance(shards.get("databases"), dict) or not shards["databases"]:
+            raise LookupError(f'Missing "shards" section with "databases" in config "{self._configfile}"')
+
+        setups = {}
+        for name, shard in shards["databases"].items():
+            if not isinstance(shard, dict) or "adapter" not in shard or "database" not in shard:
+                raise ValueError(f'Shard "{name}" needs an "adapter" and a "database" key')
+            if len(str(name)) > 24:
+                raise ValueError(f'Shard name "{name}" is longer than 24 characters')
+
+            section = _thaw(self.read(config_adapter=shard["adapter"])[1])
+            # replicas of the adapter section belong to its database
+            section.pop("replicas", None)
+            section.pop("routing", None)
+            section.update({key: value for key, value in shard.items() if key not in ("adapter", "connect")})
+            section["connect"] = {**section.get("connect", {}), **(shard.get("connect") or {})}
+            setups[str(name)] = (shard["adapter"], _freeze(section))
+
+        return shards.get("key", "host_id"), setups
+
+    @staticmethod
+    def watch(callback) -> None:
+        """
+        Registers a callable, called with the filename whenever a read
+        finds the content of a config file changed
+        :param callback: callable: callback(filename: str)
+        :returns: None
+        """
+        with _cache_lock:
+            _watchers.append(callback)
+
+    @staticmethod
+    def unwatch(callback) -> None:
+        """
+        Removes a callable registered by watch()
+        :param callback: callable: as registered
+        :returns: None
+        """
+        with _cache_lock:
+            if callback in _watchers:
+                _watchers.remove(callback)
+
     @property
     def getadapter(self) -> str:
         """
@@ -190,7 +365,7 @@ class DBConfig:
             else:
                 config = {
                     "defaults": {"adapter": self._adapter},
-                    self._adapter: self._setup,
+                    self._adapter: _thaw(self._setup[1]),
                 }
                 yaml.dump(
                     config, configfile, default_flow_style=False, allow_unicode=True
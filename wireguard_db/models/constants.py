@@ -2,10 +2,19 @@
 __version__ = "0.1.7"
 
 ADAPTERS = ("sqlite3", "mysql", "postgresql")
+POOL_PARAMS = ("max_connections", "stale_timeout", "wait_timeout")
+# how SELECTs are spread over the replicas of an adapter section
+ROUTING_POLICIES = ("round_robin", "least_loaded")
 
 CONFIG_PATH = "/etc/wireguard"
 DBCONFIG_FILE = "wireguard.yaml"
 DB_FILE = "wireguard.db"
+# content hashes of exported configs, kept within the export path
+EXPORT_CACHE_FILE = ".wireguard_db-export.json"
+# Unix socket of the config daemon
+SOCKET_PATH = "/run/wireguard_db.sock"
+# Unix socket of the write server of a sqlite file
+WRITER_SOCKET_PATH = "/run/wireguard_db-writer.sock"
 
 SAMPLE_CONFIG = f"""
 defaults:
@@ -33,6 +42,20 @@ mysql:
         charset: 'utf8mb4'
         use_unicode: True
         sql_mode: 'PIPES_AS_CONCAT'
+    # optional: share pooled connections among threads
+    # pool:
+    #     max_connections: 20
+    #     # seconds until an idle connection is recycled
+    #     stale_timeout: 300
+    #     # seconds to wait for a free connection, 0 waits forever
+    #     wait_timeout: 10
+    # optional: SELECTs go to read replicas, "connect" defaults to the one above
+    # replicas:
+    #     - database: wgdb
+    #       connect:
+    #           host: replica1
+    # # round_robin or least_loaded
+    # routing: round_robin
 
 postgresql:
     database: wgdb
@@ -42,33 +65,79 @@ postgresql:
         port: 5432
         user: wgdb
         password: yoyodine
+    # optional: share pooled connections among threads
+    # pool:
+    #     max_connections: 20
+    #     stale_timeout: 300
+    #     wait_timeout: 10
+
+# optional: WGData spread over several databases, see DBShards
+# shards:
+#     # WGData field choosing the shard
+#     key: host_id
+#     # the first keeps the shard map, each takes its adapter section above
+#     databases:
+#         eu:
+#             adapter: postgresql
+#             database: wgdb_eu
+#         us:
+#             adapter: postgresql
+#             database: wgdb_us
+#             connect:
+#                 host: us-db
 """.strip()  # pylint: disable=trailing-whitespace
 
-try:
-    import sqlite3  # pylint: disable=unused-import
+# adapter: (driver module, install hint)
+DRIVERS = {
+    "sqlite3": ("sqlite3", "python3 built with sqlite3"),
+    "mysql": ("pymysql", "pip3 install PyMySQL"),
+    "postgresql": ("psycopg2", "pip3 install psycopg2"),
+}
+
+# formerly imported eagerly, now probed on first access. This keeps
+# wireguard_db from importing drivers, peewee itself still imports the
+# installed ones (sqlite3, psycopg2, pymysql) once it is imported.
+_MODULE_FLAGS = {
+    "HAS_SQLITE3": "sqlite3",
+    "HAS_MYSQL": "pymysql",
+    "HAS_POSTGRES": "psycopg2",
+    # just informational for improvement tips
+    "HAS_CYTHON": "cython",
+}
+_found = {}
+
+
+def has_module(name: str) -> bool:
+    """
+    Checks if a module can be imported, without importing it
+    :param name: str: module name
+    :returns: True if found
+    :rtype: bool
+    """
+    if name not in _found:
+        from importlib.util import find_spec  # pylint: disable=import-outside-toplevel
 
-    HAS_SQLITE3 = True
-except ImportError:
-    HAS_SQLITE3 = False
+        _found[name] = find_spec(name) is not None
 
-try:
-    import pymysql  # pylint: disable=unused-import
+    return _found[name]
 
-    HAS_MYSQL = True
-except ImportError:
-    HAS_MYSQL = False
 
-try:
-    import psycopg2  # pylint: disable=unused-import
+def has_driver(adapter: str) -> bool:
+    """
+    Checks if the driver module of an adapter is available, without
+    importing it; the import is left to peewee
+    :param adapter: str: any of ADAPTERS
+    :returns: True if found
+    :rtype: bool
+    """
+    return has_module(DRIVERS[adapter][0])
 
-    HAS_POSTGRES = True
-except ImportError:
-    HAS_POSTGRES = False
 
-# just informational for improvement tips
-try:
-    import cython  # pylint: disable=unused-import
+def __getattr__(name: str):
+    """
+    Lazy HAS_* flags
+    """
+    if name in _MODULE_FLAGS:
+        return has_module(_MODULE_FLAGS[name])
 
-    HAS_CYTHON = True
-except ImportError:
-    HAS_CYTHON = False
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,349 @@
+# -*- coding: utf-8 -*-
+"""
+Serves rendered configs and peers from a warm process over a Unix socket:
+
+    python -m wireguard_db.models.daemon --socket /run/wireguard_db.sock
+
+One request per line, "<command> [argument]", one JSON answer per line:
+{"ok": true, "result": ...} or {"ok": false, "error": "...", "type": "LookupError"}.
+Commands: ping, render <interface or id>, peers <interface or id>,
+peer <public key>, stats. See WGClient for the client side.
+"""
+__version__ = "0.1.0"
+__license__ = "GPLv3"
+__docformat__ = "reStructuredText"
+
+import argparse
+import json
+import os
+import selectors
+import socket
+import sys
+import time
+from peewee import DatabaseError, InterfaceError
+from .changes import WGChangeFeed  # pylint: disable=E0402
+from .config import DBConfig  # pylint: disable=E0402
+from .constants import SOCKET_PATH  # pylint: disable=E0402
+from .database import DBConnect  # pylint: disable=E0402
+from .lookup import WGKeyLookup  # pylint: disable=E0402
+from .render import WGRender  # pylint: disable=E0402
+from .tables import database  # pylint: disable=E0402
+
+# bytes of answers a client has not taken yet, beyond which its requests
+# are not read until it takes them
+PENDING_LIMIT = 1 << 20
+# seconds between two reads of the change feed
+POLL = 1.0
+
+
+def _server_key(argument: str):
+    """
+    Gets the WGRender key of an argument: an id or an interface name
+    """
+    if not argument:
+        raise ValueError("An interface name or id is needed")
+
+    return int(argument) if argument.isdigit() else argument
+
+
+class WGDaemon:
+    """
+    Keeps the connection, the parsed config and rendered configs of a
+    process and answers requests over a Unix socket (see the module
+    docstring for the protocol). Cached configs and peers are dropped by
+    the change feed, read at most every poll seconds, so changes of other
+    processes are seen; bulk queries only if logged by bulk.log_changes().
+    """
+
+    def __init__(self, path: str = SOCKET_PATH, *, poll: float = POLL, enabled_only: bool = True):
+        """
+        :param path: str: socket file, replaced if it exists
+        :param poll: float: seconds between reads of the change feed
+        :param enabled_only: bool: passed to WGRender
+        ivar _renders: dict: server key -> (server id, config text)
+        ivar _peers: dict: server key -> (server id, peer rows)
+        ivar _stats: dict: requests, errors, hits and misses of the caches
+        """
+        self._path = path
+        self._poll = poll
+        self._enabled_only = enabled_only
+        self._feed = WGChangeFeed(WGChangeFeed.head())
+        self._polled = time.monotonic()
+        self._lookup = WGKeyLookup()
+        self._renders = {}
+        self._peers = {}
+        self._stats = {"requests": 0, "errors": 0, "hits": 0, "misses": 0}
+        self._wake = None
+
+    @property
+    def stats(self) -> dict:
+        """
+        Gets the counters since start
+        :returns: requests, errors, hits and misses of the config caches,
+                lookup: the WGKeyLookup counters
+        :rtype: dict
+        """
+        return dict(self._stats, lookup=self._lookup.stats)
+
+    def _refresh(self) -> None:
+        """
+        Drops what the changes since the last read affect
+        """
+        now = time.monotonic()
+        if now - self._polled < self._poll:
+            return
+
+        self._polled = now
+        changes = self._feed.changes()
+        self._feed.advance(changes)
+        if not (changes["rows"] or changes["relations"] or changes["tombstones"]):
+            return
+
+        touched, deleted = WGChangeFeed.interfaces(changes)
+        dropped = touched | deleted
+        for cache in (self._renders, self._peers):
+            for key in [key for key, (server_id, _) in cache.items() if server_id in dropped]:
+                del cache[key]
+        self._lookup.clear()
+
+    def _cached(self, cache: dict, key, build):
+        """
+        Gets a cached value of a server or builds it by build(render)
+        """
+        if key in cache:
+            self._stats["hits"] += 1
+            return cache[key][1]
+
+        self._stats["misses"] += 1
+        render = WGRender(key, enabled_only=self._enabled_only)
+        value = build(render)
+        cache[key] = (render.server_row["id"], value)
+        return value
+
+    def render(self, server) -> str:
+        """
+        Gets the config of a server
+        :param server: int or str: WGData id or wg_interface
+        :returns: config text
+        :rtype: str
+        """
+        self._refresh()
+        return self._cached(self._renders, server, lambda render: "".join(render.server()))
+
+    def peers(self, server) -> list:
+        """
+        Gets the peer rows of a server
+        :param server: int or str: WGData id or wg_interface
+        :returns: row dicts in relation order
+        :rtype: list
+        """
+        self._refresh()
+        return self._cached(self._peers, server, lambda render: list(render.peer_rows()))
+
+    def peer(self, public_key: str) -> dict:
+        """
+        Gets the row of a public key
+        :param public_key: str: base64 public key
+        :returns: row dict
+        :rtype: dict
+        """
+        self._refresh()
+        row = self._lookup.get(public_key)
+        if row is None:
+            raise LookupError(f'Peer "{public_key}" not found')
+
+        return row._asdict()
+
+    def _reconnect(self) -> None:
+        """
+        Closes the connection after a database error, the next request
+        opens a new one
+        """
+        try:
+            database.close()
+        except (DatabaseError, InterfaceError):
+            # a broken connection may not even close
+            pass
+
+    def answer(self, line) -> bytes:
+        """
+        Answers one request line, any error is an answer and keeps the
+        daemon serving
+        :param line: bytes or str: "<command> [argument]"
+        :returns: JSON answer line
+        :rtype: bytes
+        """
+        self._stats["requests"] += 1
+        if isinstance(line, bytes):
+            line = line.decode("utf8", errors="replace")
+        command, _, argument = line.strip().partition(" ")
+        argument = argument.strip()
+
+        try:
+            if "render" == command:
+                result = self.render(_server_key(argument))
+            elif "peers" == command:
+                result = self.peers(_server_key(argument))
+            elif "peer" == command:
+                result = self.peer(argument)
+            elif "stats" == command:
+                result = self.stats
+            elif "ping" == command:
+                result = "pong"
+            else:
+                raise ValueError(f'"{command}" is not a command')
+            answer = {"ok": True, "result": result}
+        except Exception as error:  # pylint: disable=broad-except
+            self._stats["errors"] += 1
+            if isinstance(error, (DatabaseError, InterfaceError)):
+                self._reconnect()
+            answer = {"ok": False, "error": str(error), "type": type(error).__name__}
+
+        return (json.dumps(answer, default=str) + "\n").encode("utf8")
+
+    def serve_forever(self) -> None:
+        """
+        Binds the socket (mode 0600, configs hold private keys) and serves
+        until shutdown(). All clients are served by this thread, so the
+        database is used by one connection only; answers are sent when a
+        socket is writable, a slow reader does not hold up the others.
+        :returns: None
+        """
+        if os.path.exists(self._path):
+            os.unlink(self._path)
+
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        umask = os.umask(0o177)
+        try:
+            listener.bind(self._path)
+        finally:
+            os.umask(umask)
+        listener.listen(64)
+
+        wake, self._wake = socket.socketpair()
+        selector = selectors.DefaultSelector()
+        selector.register(listener, selectors.EVENT_READ)
+        selector.register(wake, selectors.EVENT_READ)
+
+        try:
+            running = True
+            while running:
+                for key, events in selector.select():
+                    if key.fileobj is listener:
+                        connection, _ = listener.accept()
+                        connection.setblocking(False)
+                        # requests read, answers not sent yet
+                        selector.register(connection, selectors.EVENT_READ, (bytearray(), bytearray()))
+                    elif key.fileobj is wake:
+                        running = False
+                    else:
+                        self._serve(selector, key.fileobj, key.data, events)
+        finally:
+            for key in list(selector.get_map().values()):
+                key.fileobj.close()
+            selector.close()
+            self._wake.close()
+            self._lookup.close()
+            if os.path.exists(self._path):
+                os.unlink(self._path)
+
+    def _serve(self, selector, connection, data: tuple, events: int) -> None:
+        """
+        Serves a client that is ready for reading or writing
+        """
+        alive = True
+        if events & selectors.EVENT_READ:
+            alive = self._receive(connection, data)
+        if alive and events & selectors.EVENT_WRITE:
+            alive = self._send(connection, data[1])
+
+        if alive:
+            self._update(selector, connection, data)
+        else:
+            # gone, or its socket failed
+            selector.unregister(connection)
+            connection.close()
+
+    def _receive(self, connection, data: tuple) -> bool:
+        """
+        Reads from a client that is ready, answers its complete lines and
+        sends what the socket takes without waiting
+        :returns: False if the client is gone
+        """
+        received, pending = data
+        try:
+            chunk = connection.recv(65536)
+        except BlockingIOError:
+            return True
+        except OSError:
+            return False
+
+        if not chunk:
+            return False
+
+        received.extend(chunk)
+        while b"\n" in received:
+            line, _, rest = bytes(received).partition(b"\n")
+            received[:] = rest
+            pending.extend(self.answer(line))
+
+        return self._send(connection, pending)
+
+    @staticmethod
+    def _send(connection, pending: bytearray) -> bool:
+        """
+        Sends as much of the pending answers as the socket takes now
+        :returns: False if the client is gone
+        """
+        try:
+            while pending:
+                sent = connection.send(pending)
+                del pending[:sent]
+        except BlockingIOError:
+            pass
+        except OSError:
+            return False
+
+        return True
+
+    @staticmethod
+    def _update(selector, connection, data: tuple) -> None:
+        """
+        Waits for writable while answers are pending; a client not taking
+        them is not read beyond PENDING_LIMIT, the others go on meanwhile
+        """
+        _, pending = data
+        events = selectors.EVENT_WRITE if pending else 0
+        if len(pending) < PENDING_LIMIT:
+            events |= selectors.EVENT_READ
+        if selector.get_key(connection).events != events:
+            selector.modify(connection, events, data)
+
+    def shutdown(self) -> None:
+        """
+        Stops serve_forever(), from another thread
+        :returns: None
+        """
+        if self._wake is not None:
+            self._wake.send(b"\0")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--socket", default=SOCKET_PATH)
+    parser.add_argument("--config", default="default", help="config file")
+    parser.add_argument("--adapter", default="defaults")
+    parser.add_argument("--poll", type=float, default=POLL, help="seconds between reads of the change feed")
+    args = parser.parse_args(argv)
+
+    DBConnect(DBConfig().read(config_adapter=args.adapter, config_file=args.config)).get()
+    try:
+        WGDaemon(args.socket, poll=args.poll).serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+    return 0
+
+
+if "__main__" == __name__:
+    sys.exit(main())
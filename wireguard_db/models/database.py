@@ -4,13 +4,100 @@ __license__ = "GPLv3"
 __docformat__ = "reStructuredText"
 
 import sys
+import threading
+from collections.abc import Mapping
+from contextlib import contextmanager
 
 import peewee
 from peewee import SqliteDatabase, MySQLDatabase, PostgresqlDatabase
-from .constants import HAS_SQLITE3, HAS_POSTGRES, HAS_MYSQL  # pylint: disable=E0402
+from playhouse.pool import (
+    MaxConnectionsExceeded,
+    _PooledMySQLDatabase,
+    _PooledPostgresqlDatabase,
+    _PooledSqliteDatabase,
+)
+from .constants import DRIVERS, has_driver  # pylint: disable=E0402
+from .metrics import DBMetrics  # pylint: disable=E0402
+from .router import DBRouter  # pylint: disable=E0402
+from .schema import check_schema  # pylint: disable=E0402
 from .tables import database, MODELS  # pylint: disable=E0402
 
 
+class _PoolStats:
+    """
+    Pool counters: raw connections opened and callers that had to wait
+    """
+
+    def __init__(self, *args, **kwargs):
+        self._pool_opened = 0
+        self._pool_waits = 0
+        self._pool_waiting = threading.local()
+        super().__init__(*args, **kwargs)
+
+    def connect(self, reuse_if_open=False):
+        """
+        Count a caller only once while it waits for a free connection
+        """
+        self._pool_waiting.state = False
+        return super().connect(reuse_if_open)
+
+    def _connect(self):
+        try:
+            return super()._connect()
+        except MaxConnectionsExceeded:
+            if not self._pool_waiting.state:
+                self._pool_waiting.state = True
+                self._pool_waits += 1
+            raise
+
+    @property
+    def pool_stats(self) -> dict:
+        """
+        Gets the pool counters
+        :returns: max_connections, in_use, idle, opened, waits
+        :rtype: dict
+        """
+        with self._pool_lock:
+            return {
+                "max_connections": self._max_connections,
+                "in_use": len(self._in_use),
+                "idle": len(self._connections),
+                "opened": self._pool_opened,
+                "waits": self._pool_waits,
+            }
+
+
+class _RawConnect:  # pylint: disable=too-few-public-methods
+    """
+    Counts connections opened by the driver, placed behind the pool
+    """
+
+    def _connect(self):
+        conn = super()._connect()
+        self._pool_opened += 1
+        return conn
+
+
+class PooledSqlite(_PoolStats, _PooledSqliteDatabase, _RawConnect, SqliteDatabase):
+    """
+    Pooled sqlite database with pool_stats
+    """
+
+
+class PooledMySQL(_PoolStats, _PooledMySQLDatabase, _RawConnect, MySQLDatabase):
+    """
+    Pooled mysql database with pool_stats
+    """
+
+
+class PooledPostgresql(
+    _PoolStats, _PooledPostgresqlDatabase, _RawConnect, PostgresqlDatabase
+):
+    """
+    Pooled postgresql database with pool_stats
+    """
+
+
 class DBConnect:
     """
     Set up a database connection with the requested driver/adapter using peewee adapters
@@ -23,10 +110,14 @@ class DBConnect:
         ivar _adapter: str: adapter name
         ivar _database: obj: peewee.DatabaseProxy
         ivar _connected: bool: connected state of db
+        ivar _metrics: DBMetrics: query instrumentation, see instrument()
+        ivar _router: DBRouter: read replica routing, if the setup has replicas
         """
         self._adapter = None
         self._database = None
         self._connected = False
+        self._metrics = None
+        self._router = None
 
         if setup:
             # full init if setup is given
@@ -38,47 +129,107 @@ class DBConnect:
         :param setup: tuple: as returned from DBConfig.read()
         :returns: None
         """
-        if not isinstance(setup, tuple) and 2 == len(setup):
+        adapter = self.create_database(setup)
+
+        if self._router is not None:
+            self._router.uninstall()
+            self._router = None
+
+        database.initialize(adapter)
+        self._adapter = setup[0]
+        if setup[1].get("replicas"):
+            # routing first, the metrics then time the replica reads as well
+            self._router = DBRouter(
+                adapter,
+                [self.create_database(replica) for replica in self.replica_setups(setup)],
+                routing=setup[1].get("routing", "round_robin"),
+            )
+            self._router.install()
+        if self._metrics is not None:
+            self._metrics.install(adapter)
+
+        database.bind(MODELS)
+        self._database = database
+        self.check()
+
+    @staticmethod
+    def create_database(setup: tuple) -> peewee.Database:
+        """
+        Creates the peewee database for a setup, pooled if a "pool" section is given
+        :param setup: tuple: as returned from DBConfig.read()
+        :returns: peewee database, not connected
+        :rtype: peewee.Database
+        """
+        if not isinstance(setup, tuple) or 2 != len(setup):
             raise ValueError('"setup" invalid allowed is one tuple.')
 
         _adapter, adapter_param = setup
-        if not (isinstance(_adapter, str) and isinstance(adapter_param, dict)):
+        if not (isinstance(_adapter, str) and isinstance(adapter_param, Mapping)):
             raise ValueError(
                 '"setup" format invalid: Hint: (adapter: str,setup: dict).'
             )
 
-        if "sqlite3" == _adapter:
-            if not HAS_SQLITE3:
-                raise ImportError('driver missing: Hint "pip3 install PyMySQL"')
+        if _adapter in DRIVERS and not has_driver(_adapter):
+            raise ImportError(f'driver missing: Hint "{DRIVERS[_adapter][1]}"')
 
-            adapter = SqliteDatabase(
-                adapter_param["database"], pragmas=adapter_param["connect"]
-            )
+        pool = adapter_param.get("pool")
+        pool_param = {}
+        if pool is not None:
+            pool_param = {
+                "max_connections": pool.get("max_connections", 20),
+                "stale_timeout": pool.get("stale_timeout"),
+                "timeout": pool.get("wait_timeout"),
+            }
 
-        elif "mysql" == _adapter:
-            if not HAS_MYSQL:
-                raise ImportError('driver missing: Hint "pip3 install PyMySQL"')
+        if "sqlite3" == _adapter:
+            if pool is None:
+                return SqliteDatabase(
+                    adapter_param["database"], pragmas=dict(adapter_param["connect"])
+                )
 
-            adapter = MySQLDatabase(
-                adapter_param["database"], **adapter_param["connect"]
+            # pooled connections are handed over between threads
+            return PooledSqlite(
+                adapter_param["database"],
+                pragmas=dict(adapter_param["connect"]),
+                check_same_thread=False,
+                **pool_param,
             )
 
-        elif "postgresql" == _adapter:
-            if not HAS_POSTGRES:
-                raise ImportError('driver missing: Hint "pip3 install psycopg2"')
+        if "mysql" == _adapter:
+            return (PooledMySQL if pool is not None else MySQLDatabase)(
+                adapter_param["database"], **adapter_param["connect"], **pool_param
+            )
 
-            adapter = PostgresqlDatabase(
-                adapter_param["database"], **adapter_param["connect"]
+        if "postgresql" == _adapter:
+            return (PooledPostgresql if pool is not None else PostgresqlDatabase)(
+                adapter_param["database"], **adapter_param["connect"], **pool_param
             )
-        else:
-            raise ValueError(f'"{_adapter}" not implemented.')
 
-        database.initialize(adapter)
-        self._adapter = _adapter
+        raise ValueError(f'"{_adapter}" not implemented.')
 
-        database.bind(MODELS)
-        self._database = database
-        self.check()
+    @staticmethod
+    def replica_setups(setup: tuple) -> list:
+        """
+        Gets the setups of the read replicas, each is the adapter section with
+        the database and connect parameters of the replica, not pooled
+        :param setup: tuple: as returned from DBConfig.read()
+        :returns: list of setup tuples for create_database()
+        :rtype: list
+        """
+        _adapter, adapter_param = setup
+        base = {
+            key: value for key, value in adapter_param.items()
+            if key not in ("replicas", "routing", "pool")
+        }
+
+        return [
+            (_adapter, {
+                **base,
+                "database": replica["database"],
+                "connect": {**base.get("connect", {}), **replica.get("connect", {})},
+            })
+            for replica in adapter_param.get("replicas") or ()
+        ]
 
     def get(self) -> peewee.DatabaseProxy:
         """
@@ -105,6 +256,76 @@ class DBConnect:
         """
         return self._connected
 
+    @property
+    def pool_stats(self) -> dict:
+        """
+        Returns the connection pool counters
+        :returns: max_connections, in_use, idle, opened, waits or None if not pooled
+        :rtype: dict
+        """
+        if self._database is None or not isinstance(self._database.obj, _PoolStats):
+            return None
+
+        return self._database.obj.pool_stats
+
+    def instrument(self, *, slow_threshold: float = 0.5) -> DBMetrics:
+        """
+        Starts recording queries, transactions and slow statements
+        :param slow_threshold: float: seconds from which a statement goes to
+                the "wireguard_db.slow" logger, None to log none
+        :returns: the metrics, also available as metrics
+        :rtype: DBMetrics
+        """
+        if self._metrics is None:
+            self._metrics = DBMetrics(slow_threshold=slow_threshold)
+        else:
+            self._metrics.slow_threshold = slow_threshold
+
+        if self._database is not None and not self._metrics.installed:
+            self._metrics.install(self._database.obj)
+
+        return self._metrics
+
+    def uninstrument(self) -> None:
+        """
+        Stops recording, the database runs unwrapped again
+        :returns: None
+        """
+        if self._metrics is not None:
+            self._metrics.uninstall()
+            self._metrics = None
+
+    @property
+    def metrics(self) -> DBMetrics:
+        """
+        Returns the query metrics
+        :returns: DBMetrics or None if not instrumented
+        :rtype: DBMetrics
+        """
+        return self._metrics
+
+    @property
+    def router(self) -> DBRouter:
+        """
+        Returns the read replica routing
+        :returns: DBRouter or None if the setup has no replicas
+        :rtype: DBRouter
+        """
+        return self._router
+
+    @contextmanager
+    def pinned(self):
+        """
+        Context within which this thread reads from the primary only, to read
+        its own writes; does nothing without replicas
+        """
+        if self._router is None:
+            yield self
+            return
+
+        with self._router.pinned():
+            yield self
+
     @property
     def adapter(self) -> str:
         """
@@ -114,14 +335,13 @@ class DBConnect:
         """
         return self._adapter
 
-    def check(self) -> None:
+    def check(self, *, force: bool = False) -> None:
         """
-        Sanitizer: checks and creates tables, if they do not exist
+        Sanitizer: checks the schema marker, creates or migrates tables if it does not match
+        :param force: bool: check again, even if this process checked the database before
         :returns: None
         """
-        for dbtable in MODELS:
-            dbtable.validate_model()
-            dbtable.create_table(safe=True)
+        check_schema(force=force)
         self._connected = True
 
     def close(self) -> None:
@@ -130,6 +350,9 @@ class DBConnect:
         :returns: None
         """
         self._database.close()
+        if self._router is not None:
+            for replica in self._router.replicas:
+                replica.close()
         self._connected = False
 
     def __repr__(self) -> str:
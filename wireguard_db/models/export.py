@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+__version__ = "0.1.0"
+__license__ = "GPLv3"
+__docformat__ = "reStructuredText"
+
+import hashlib
+import json
+import os
+import tempfile
+from pathlib import Path
+from .constants import CONFIG_PATH, EXPORT_CACHE_FILE  # pylint: disable=E0402
+from .render import WGRender  # pylint: disable=E0402
+
+
+def write_atomic(filename: Path, text: str, mode: int = 0o600) -> None:
+    """
+    Writes a file by a temp file in the same directory and a rename,
+    readers see either the old or the new content
+    :param filename: Path: file to write
+    :param text: str: content
+    :param mode: int: permissions, configs hold private keys
+    :returns: None
+    """
+    handle, temp_name = tempfile.mkstemp(dir=filename.parent, prefix=f".{filename.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(handle, "w", encoding="utf8") as temp_file:
+            temp_file.write(text)
+            temp_file.flush()
+            os.fsync(temp_file.fileno())
+        os.chmod(temp_name, mode)
+        os.replace(temp_name, filename)
+    except BaseException:
+        os.unlink(temp_name)
+        raise
+
+
+class WGExport:
+    """
+    Writes the wg-quick configs rendered by WGRender to files:
+    <path>/<interface>.conf and <path>/<interface>/peer-<id>.conf.
+    A content hash per file is kept in EXPORT_CACHE_FILE within the path,
+    unchanged configs are not written again, so their mtime stays and
+    watchers or 'wg syncconf' are not triggered.
+    """
+
+    def __init__(self, path: str = CONFIG_PATH, *, peers: bool = True):
+        """
+        :param path: str: directory to export to
+        :param peers: bool: export the peer configs too
+        ivar _hashes: dict: relative filename -> [sha256 hex digest, server id]
+        ivar _owned: dict: server id -> set of relative filenames, index of _hashes
+        ivar _stats: dict: counters since the last run()
+        """
+        self._path = Path(path)
+        self._peers = peers
+        self._cache_file = self._path / EXPORT_CACHE_FILE
+        self._hashes = self._load()
+        self._owned = {}
+        for name, (_, owner) in self._hashes.items():
+            self._owned.setdefault(owner, set()).add(name)
+        self._dirty = False
+        self._stats = {"written": 0, "skipped": 0, "removed": 0}
+
+    @property
+    def stats(self) -> dict:
+        """
+        Gets the counters since the last run
+        :returns: files written, skipped as unchanged and removed
+        :rtype: dict
+        """
+        return dict(self._stats)
+
+    def _load(self) -> dict:
+        """
+        Reads the hash cache, an unreadable one is dropped
+        """
+        try:
+            with open(self._cache_file, encoding="utf8") as cache_file:
+                hashes = json.load(cache_file)
+        except (OSError, ValueError):
+            return {}
+
+        return hashes if isinstance(hashes, dict) else {}
+
+    def flush(self) -> None:
+        """
+        Persists the hash cache if it changed
+        :returns: None
+        """
+        if self._dirty:
+            self._path.mkdir(parents=True, exist_ok=True)
+            write_atomic(self._cache_file, json.dumps(self._hashes, sort_keys=True), 0o644)
+            self._dirty = False
+
+    def _output(self, name: str, server_id: int, text: str) -> bool:
+        """
+        Writes one config unless its hash is cached and the file exists
+        :returns: True if written
+        """
+        digest = hashlib.sha256(text.encode("utf8")).hexdigest()
+        filename = self._path / name
+        cached = self._hashes.get(name)
+
+        if cached is not None and digest == cached[0] and filename.exists():
+            self._stats["skipped"] += 1
+            return False
+
+        filename.parent.mkdir(parents=True, exist_ok=True)
+        write_atomic(filename, text)
+        if cached is not None and cached[1] != server_id:
+            self._owned[cached[1]].discard(name)
+        self._hashes[name] = [digest, server_id]
+        self._owned.setdefault(server_id, set()).add(name)
+        self._dirty = True
+        self._stats["written"] += 1
+        return True
+
+    def write(self, render: WGRender) -> None:
+        """
+        Exports the server and (optionally) the peer configs of a render,
+        matches the write callable of WGChangeFeed.regenerate()
+        :param render: WGRender: server to export
+        :returns: None
+        """
+        server = render.server_row
+        interface = server["wg_interface"] or f"wg{server['id']}"
+        names = {f"{interface}.conf"}
+
+        self._output(f"{interface}.conf", server["id"], "".join(render.server()))
+        if self._peers:
+            for peer_id, text in render.peers():
+                name = f"{interface}/peer-{peer_id}.conf"
+                names.add(name)
+                self._output(name, server["id"], text)
+
+        # peers gone or an interface renamed since the last export
+        self._remove(server["id"], keep=names)
+
+    def _remove(self, server_id: int, keep: set = frozenset()) -> None:
+        """
+        Removes the files exported for a server, but those to keep
+        """
+        owned = self._owned.get(server_id, set())
+        for name in owned - keep:
+            try:
+                (self._path / name).unlink()
+            except FileNotFoundError:
+                pass
+            del self._hashes[name]
+            owned.discard(name)
+            self._dirty = True
+            self._stats["removed"] += 1
+
+        if not owned:
+            self._owned.pop(server_id, None)
+
+    def remove(self, server_id: int) -> None:
+        """
+        Removes the files of a deleted server,
+        matches the remove callable of WGChangeFeed.regenerate()
+        :param server_id: int: WGData id
+        :returns: None
+        """
+        self._remove(server_id)
+
+    def run(self, servers) -> dict:
+        """
+        Exports a number of servers and persists the hash cache
+        :param servers: iterable of WGData ids or interface names
+        :returns: counters, see stats
+        :rtype: dict
+        """
+        self._stats = {"written": 0, "skipped": 0, "removed": 0}
+        try:
+            for server in servers:
+                self.write(WGRender(server))
+        finally:
+            self.flush()
+
+        return self.stats
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.flush()
@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+__version__ = "0.1.0"
+__license__ = "GPLv3"
+__docformat__ = "reStructuredText"
+
+from uuid import uuid4
+from ..utils.dicts import config2wgdata  # pylint: disable=E0402
+from ..utils.parser import iter_config_sources, parse_config  # pylint: disable=E0402
+from .bulk import chunk_size, execute_insert, insert_rows, log_changes  # pylint: disable=E0402
+from .tables import database, timestamp, WGData, WGRelation  # pylint: disable=E0402
+
+TRUE_VALUES = ("true", "yes", "on", "1")
+
+
+class WGImport:
+    """
+    Bulk import of wg-quick config files into WGData/WGRelation.
+    Each [Interface] becomes a row, each [Peer] of that file becomes a row
+    plus a WGRelation edge from the interface to the peer. The rows of a
+    run share a WGData.import_batch token.
+    """
+
+    def __init__(self, batch_size: int = 5000):
+        """
+        :param batch_size: int: rows written within one transaction
+        ivar _fields: tuple: WGData fields written (all but id)
+        ivar _stats: dict: counters of the last run()
+        ivar _batch: str: import_batch token of the current run()
+        ivar _last_id: int: highest id inserted by the current run()
+        """
+        if not isinstance(batch_size, int) or batch_size < 1:
+            raise ValueError('"batch_size" must be a positive integer')
+
+        self._batch_size = batch_size
+        self._fields = tuple(
+            field for field in WGData._meta.sorted_fields if field is not WGData.id
+        )
+        self._stats = {}
+        self._batch = None
+        self._last_id = 0
+
+    @property
+    def stats(self) -> dict:
+        """
+        Gets the counters of the last run
+        :returns: files, interfaces, peers and relations imported
+        :rtype: dict
+        """
+        return dict(self._stats)
+
+    def run(self, path: str) -> dict:
+        """
+        Imports a config file, a directory of config files or a tarball
+        :param path: str: source to import
+        :returns: counters, see stats
+        :rtype: dict
+        """
+        self._stats = {"files": 0, "interfaces": 0, "peers": 0, "relations": 0}
+        self._batch = uuid4().hex
+        self._last_id = 0
+
+        batch = []
+        batch_rows = 0
+
+        for interface, peers in self.rows(iter_config_sources(path)):
+            batch.append((interface, peers))
+            batch_rows += 1 + len(peers)
+
+            if batch_rows >= self._batch_size:
+                self._write(batch)
+                batch, batch_rows = [], 0
+
+        if batch:
+            self._write(batch)
+
+        return self.stats
+
+    def rows(self, sources):
+        """
+        Turns config sources into WGData row tuples
+        :param sources: iterable of (name, text) as from iter_config_sources()
+        :returns: generator of (interface: tuple, peers: list of tuple)
+        :rtype: generator
+        """
+        for name, text in sources:
+            interface = None
+            peers = []
+
+            for section, options in parse_config(text):
+                if "Interface" == section and interface is None:
+                    interface = self._row(options, name, wg_interface=name)
+
+                elif "Peer" == section:
+                    peers.append(self._row(options, f"{name} peer {len(peers) + 1}"))
+
+            self._stats["files"] += 1
+            if interface is not None:
+                yield interface, peers
+
+    def _row(self, options: dict, description: str, **fields) -> tuple:
+        """
+        Builds one WGData row tuple, ordered as self._fields
+        :param options: dict: one config section
+        :param description: str: used if the section has no comment
+        :returns: row values
+        :rtype: tuple
+        """
+        data = config2wgdata(options)
+        if not data.get("description"):
+            data["description"] = description
+
+        # a peer section has no Address, its AllowedIPs are its addresses
+        if data.get("wg_address") is None and data.get("wg_allowedips"):
+            data["wg_address"] = data["wg_allowedips"]
+
+        if data.get("wg_saveconfig") is not None:
+            data["wg_saveconfig"] = str(data["wg_saveconfig"]).lower() in TRUE_VALUES
+
+        data.update(fields)
+        data["import_batch"] = self._batch
+        now = timestamp()
+
+        return tuple(
+            data[field.name]
+            if field.name in data
+            else (now if field.name in ("created", "updated") else field.default)
+            for field in self._fields
+        )
+
+    def _insert(self, rows: list) -> list:
+        """
+        Inserts WGData rows and returns their ids in the same order
+        :param rows: list of row tuples
+        :returns: ids
+        :rtype: list
+        """
+        ids = []
+        size = chunk_size(len(self._fields))
+        returning = database.returning_clause
+
+        for start in range(0, len(rows), size):
+            chunk = rows[start:start + size]
+            cursor = execute_insert(WGData, self._fields, chunk, returning=returning)
+
+            if returning:
+                ids.extend(row[0] for row in cursor.fetchall())
+                continue
+
+            # without RETURNING the ids need not be consecutive (mysql
+            # innodb_autoinc_lock_mode=2, auto_increment_increment), but
+            # they grow in row order: read back by the token of this run
+            query = WGData.select(WGData.id).where(
+                (WGData.import_batch == self._batch) & (WGData.id > self._last_id)
+            ).order_by(WGData.id)
+            ids.extend(row[0] for row in database.execute(query))
+            self._last_id = ids[-1]
+
+        if ids:
+            self._last_id = max(self._last_id, ids[-1])
+        return ids
+
+    def _write(self, batch: list) -> None:
+        """
+        Writes one batch of interfaces, peers and relations in a transaction
+        :param batch: list of (interface, peers) as from rows()
+        :returns: None
+        """
+        with database.atomic():
+            parent_ids = self._insert([interface for interface, _ in batch])
+            peer_ids = self._insert([peer for _, peers in batch for peer in peers])
+
+            peer_ids = iter(peer_ids)
+            relations = [
+                (parent_id, next(peer_ids))
+                for parent_id, (_, peers) in zip(parent_ids, batch)
+                for _ in peers
+            ]
+
+            now = timestamp()
+            insert_rows(
+                WGRelation,
+                (WGRelation.WGParent, WGRelation.WGPeer, WGRelation.created),
+                [edge + (now,) for edge in relations],
+            )
+            # the peers are reported along with their interfaces
+            log_changes("created", [("WGData", parent_id, None) for parent_id in parent_ids])
+
+        self._stats["interfaces"] += len(parent_ids)
+        self._stats["peers"] += sum(len(peers) for _, peers in batch)
+        self._stats["relations"] += len(relations)
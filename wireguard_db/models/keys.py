@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+__version__ = "0.1.0"
+__license__ = "GPLv3"
+__docformat__ = "reStructuredText"
+
+import threading
+from collections import deque
+from datetime import datetime
+from peewee import SqliteDatabase
+from ..utils.keys import generate_keypairs, generate_preshared_key  # pylint: disable=E0402
+from .bulk import chunk_size, insert_rows  # pylint: disable=E0402
+from .tables import database, WGData, WGKeyPool  # pylint: disable=E0402
+
+
+class WGKeyService:
+    """
+    Hands out WireGuard key pairs from a pool.
+    Key pairs are generated in batches across processes and kept in the
+    table WGKeyPool; a batch of them is moved to memory, so take() is O(1).
+    Keys in use by WGData.wg_privatekey are never handed out.
+    """
+
+    def __init__(self, *, low_water: int = 1000, high_water: int = 5000, batch_size: int = 500, processes: int = None):
+        """
+        :param low_water: int: pool size that triggers a top-up
+        :param high_water: int: pool size a top-up fills to
+        :param batch_size: int: key pairs moved from the pool to memory at once
+        :param processes: int: worker processes generating keys (default: cpu count)
+        ivar _keys: deque: key pairs claimed by this process
+        ivar _worker: threading.Thread: background top-up, see start()
+        """
+        if not 0 <= low_water <= high_water:
+            raise ValueError('"low_water" must be within 0 and "high_water"')
+
+        self._low_water = low_water
+        self._high_water = high_water
+        self._batch_size = batch_size
+        self._processes = processes
+        self._keys = deque()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._worker = None
+
+    @property
+    def available(self) -> int:
+        """
+        Gets the number of key pairs in the pool and in memory
+        :returns: key pairs
+        :rtype: int
+        """
+        return WGKeyPool.select().count() + len(self._keys)
+
+    @staticmethod
+    def _unused(pairs: list) -> list:
+        """
+        Drops pairs whose private key is stored already
+        """
+        private_keys = [private_key for private_key, _ in pairs]
+        used = set()
+        size = chunk_size(1)
+
+        for start in range(0, len(private_keys), size):
+            chunk = private_keys[start:start + size]
+            for model, field in ((WGData, WGData.wg_privatekey), (WGKeyPool, WGKeyPool.privatekey)):
+                query = model.select(field).where(field.in_(chunk))
+                used.update(row[0] for row in database.execute(query))
+
+        return [pair for pair in pairs if pair[0] not in used]
+
+    def fill(self, count: int) -> int:
+        """
+        Generates key pairs and stores them in the pool
+        :param count: int: number of key pairs
+        :returns: key pairs added
+        :rtype: int
+        """
+        pairs = self._unused(generate_keypairs(count, processes=self._processes))
+        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        fields = (WGKeyPool.privatekey, WGKeyPool.publickey, WGKeyPool.created)
+
+        with database.atomic():
+            return insert_rows(
+                WGKeyPool, fields, [pair + (now,) for pair in pairs], ignore=True
+            )
+
+    def top_up(self) -> int:
+        """
+        Fills the pool to high_water if it is below low_water
+        :returns: key pairs added
+        :rtype: int
+        """
+        size = WGKeyPool.select().count()
+        if size >= self._low_water:
+            return 0
+
+        return self.fill(self._high_water - size)
+
+    def _claim(self, count: int) -> list:
+        """
+        Moves key pairs from the pool table to the caller, once
+        """
+        if isinstance(database.obj, SqliteDatabase):
+            transaction = database.atomic("IMMEDIATE")
+        else:
+            transaction = database.atomic()
+
+        with transaction:
+            query = (
+                WGKeyPool.select(WGKeyPool.id, WGKeyPool.privatekey, WGKeyPool.publickey)
+                .order_by(WGKeyPool.id)
+                .limit(count)
+            )
+            if not isinstance(database.obj, SqliteDatabase):
+                query = query.for_update()
+
+            rows = list(database.execute(query))
+            if rows:
+                WGKeyPool.delete().where(WGKeyPool.id.in_([row[0] for row in rows])).execute()
+
+        return [(private_key, public_key) for _, private_key, public_key in rows]
+
+    def take(self) -> tuple:
+        """
+        Hands out one unused key pair
+        :returns: (private key, public key), base64 encoded
+        :rtype: tuple
+        """
+        with self._lock:
+            if not self._keys:
+                pairs = self._claim(self._batch_size)
+                if not pairs:
+                    # empty pool: generate inline rather than fail
+                    pairs = self._unused(generate_keypairs(self._batch_size, processes=1))
+                self._keys.extend(pairs)
+                self._wakeup.set()
+
+            return self._keys.popleft()
+
+    def take_many(self, count: int) -> list:
+        """
+        Hands out a number of unused key pairs
+        :param count: int: number of key pairs
+        :returns: list of (private key, public key)
+        :rtype: list
+        """
+        return [self.take() for _ in range(count)]
+
+    @staticmethod
+    def preshared() -> str:
+        """
+        Generates a preshared key, random bytes need no pool
+        :returns: base64 encoded key
+        :rtype: str
+        """
+        return generate_preshared_key()
+
+    def start(self, interval: float = 60.0) -> None:
+        """
+        Starts a background thread topping up the pool
+        :param interval: float: seconds between checks, take() wakes it up early
+        :returns: None
+        """
+        if self._worker is not None:
+            return
+
+        def run():
+            while not self._stopped.is_set():
+                with database.connection_context():
+                    self.top_up()
+                self._wakeup.wait(interval)
+                self._wakeup.clear()
+
+        self._stopped.clear()
+        self._worker = threading.Thread(target=run, name="wireguard_db-keys", daemon=True)
+        self._worker.start()
+
+    def stop(self) -> None:
+        """
+        Stops the background thread
+        :returns: None
+        """
+        if self._worker is None:
+            return
+
+        self._stopped.set()
+        self._wakeup.set()
+        self._worker.join()
+        self._worker = None
@@ -0,0 +1,213 @@
+# -*- coding: utf-8 -*-
+__version__ = "0.1.0"
+__license__ = "GPLv3"
+__docformat__ = "reStructuredText"
+
+import threading
+from collections import OrderedDict
+from .bulk import chunk_size  # pylint: disable=E0402
+from .reader import row_converter, row_type  # pylint: disable=E0402
+from .tables import add_listener, after_commit, remove_listener, database, WGData  # pylint: disable=E0402
+
+# public keys cached at most
+CACHE_SIZE = 10000
+
+# cached for keys without a row
+_MISSING = object()
+
+# SELECT statements: (database class, number of keys) -> sql
+_statements = {}
+
+
+def _select(keys: list):
+    """
+    Runs the SELECT of all WGData fields for some public keys, the
+    statement is built by peewee once per number of keys and reused
+    """
+    key = (type(database.obj), len(keys))
+    sql = _statements.get(key)
+
+    if sql is None:
+        query = WGData.select(*WGData._meta.sorted_fields).where(  # pylint: disable=protected-access
+            WGData.wg_publickey.in_([None] * len(keys))
+        )
+        sql, _ = query.sql()
+        _statements[key] = sql
+
+    return database.execute_sql(sql, list(keys))
+
+
+class WGKeyLookup:
+    """
+    Finds WGData rows by public key, the key of everything reported by
+    WireGuard itself. Reads use the index on WGData.wg_publickey, the rows
+    are kept in a bounded LRU cache as WGReader rows, keys without a row
+    are cached as well. Rows changed through model instances are dropped
+    from the cache, once at the change and again after its commit, as
+    other threads read the old row until then; bulk updates
+    (Model.update()) are not seen, clear() after them.
+    """
+
+    def __init__(self, *, size: int = CACHE_SIZE, watch: bool = True):
+        """
+        :param size: int: public keys cached at most
+        :param watch: bool: drop rows changed through the models
+        ivar _cache: OrderedDict: public key -> row or _MISSING, oldest first
+        ivar _keys: dict: WGData id -> public key cached for it
+        ivar _stats: dict: hits, misses and evictions
+        ivar _generation: int: counts changes, reads overlapping one are not cached
+        """
+        if not isinstance(size, int) or size < 1:
+            raise ValueError('"size" must be a positive integer')
+
+        self._size = size
+        self._lock = threading.Lock()
+        self._cache = OrderedDict()
+        self._keys = {}
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0}
+        self._generation = 0
+        self._watching = False
+
+        fields = tuple(WGData._meta.sorted_fields)  # pylint: disable=protected-access
+        self._convert = row_converter(fields)
+        self._make = row_type(tuple(field.name for field in fields))._make
+
+        if watch:
+            add_listener(self._changed)
+            self._watching = True
+
+    @property
+    def stats(self) -> dict:
+        """
+        Gets the cache counters
+        :returns: hits, misses, evictions and size
+        :rtype: dict
+        """
+        with self._lock:
+            return dict(self._stats, size=len(self._cache))
+
+    def close(self) -> None:
+        """
+        Stops following changes
+        :returns: None
+        """
+        if self._watching:
+            remove_listener(self._changed)
+            self._watching = False
+
+    def clear(self) -> None:
+        """
+        Empties the cache, the counters are kept
+        :returns: None
+        """
+        with self._lock:
+            self._generation += 1
+            self._cache.clear()
+            self._keys.clear()
+
+    def _changed(self, model, action: str, instance) -> None:
+        """
+        Listener for model changes, drops the old and the new key of a row
+        """
+        if model is not WGData:
+            return
+
+        row_id, public_key = instance.id, instance.wg_publickey
+        self._drop(row_id, public_key)
+        # rows read before the commit and cached since are stale
+        after_commit(lambda: self._drop(row_id, public_key))
+
+    def _drop(self, row_id: int, public_key: str) -> None:
+        """
+        Drops the cached key of a row and a public key
+        """
+        with self._lock:
+            self._generation += 1
+            for key in (self._keys.pop(row_id, None), public_key):
+                if key is not None:
+                    self._cache.pop(key, None)
+
+    def _store(self, key: str, row) -> None:
+        """
+        Caches a row or _MISSING, evicting the least recently used
+        """
+        self._cache[key] = row
+        self._cache.move_to_end(key)
+        if row is not _MISSING:
+            self._keys[row.id] = key
+
+        while len(self._cache) > self._size:
+            _, old_row = self._cache.popitem(last=False)
+            if old_row is not _MISSING:
+                self._keys.pop(old_row.id, None)
+            self._stats["evictions"] += 1
+
+    def get(self, public_key: str):
+        """
+        Finds the row of a public key
+        :param public_key: str: base64 public key
+        :returns: WGRow namedtuple of all WGData fields or None
+        :rtype: tuple
+        """
+        return self.get_many([public_key]).get(public_key)
+
+    def get_id(self, public_key: str) -> int:
+        """
+        Finds the WGData id of a public key
+        :param public_key: str: base64 public key
+        :returns: id or None
+        :rtype: int
+        """
+        row = self.get(public_key)
+        return None if row is None else row.id
+
+    def get_many(self, public_keys) -> dict:
+        """
+        Finds the rows of many public keys, the ones not cached by one
+        WHERE IN query per chunk
+        :param public_keys: iterable of str
+        :returns: public key -> WGRow, keys without a row are left out
+        :rtype: dict
+        """
+        found, missing = {}, []
+
+        with self._lock:
+            for key in dict.fromkeys(public_keys):
+                row = self._cache.get(key)
+                if row is None:
+                    missing.append(key)
+                    continue
+
+                self._cache.move_to_end(key)
+                self._stats["hits"] += 1
+                if row is not _MISSING:
+                    found[key] = row
+            self._stats["misses"] += len(missing)
+            generation = self._generation
+
+        if not missing:
+            return found
+
+        rows = {}
+        size = chunk_size(1)
+        for start in range(0, len(missing), size):
+            for row in _select(missing[start:start + size]):
+                row = self._make(row if self._convert is None else self._convert(row))
+                rows[row.wg_publickey] = row
+
+        with self._lock:
+            if generation == self._generation:
+                for key in missing:
+                    self._store(key, rows.get(key, _MISSING))
+
+        found.update(rows)
+        return found
+
+    def get_ids(self, public_keys) -> dict:
+        """
+        Finds the WGData ids of many public keys
+        :param public_keys: iterable of str
+        :returns: public key -> id, keys without a row are left out
+        :rtype: dict
+        """
+        return {key: row.id for key, row in self.get_many(public_keys).items()}
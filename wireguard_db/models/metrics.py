@@ -0,0 +1,331 @@
+# -*- coding: utf-8 -*-
+__version__ = "0.1.0"
+__license__ = "GPLv3"
+__docformat__ = "reStructuredText"
+
+import logging
+import re
+import threading
+import time
+from bisect import bisect_left
+
+# upper bounds in seconds of the latency histograms, as prometheus buckets
+BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+
+# statements slower than the threshold are logged here as warnings
+slow_log = logging.getLogger("wireguard_db.slow")
+
+# methods of the database instance wrapped by DBMetrics
+_WRAPPED = ("execute_sql", "begin", "commit", "rollback")
+
+# the table after FROM, INTO, UPDATE, TABLE [IF [NOT] EXISTS] or INDEX [IF NOT EXISTS] <name> ON
+_TABLE = re.compile(
+    r'\b(?:FROM|INTO|UPDATE|TABLE(?:\s+IF(?:\s+NOT)?\s+EXISTS)?'
+    r'|INDEX\s+(?:IF\s+NOT\s+EXISTS\s+)?\S+\s+ON)\s+[`"]?(\w+)',
+    re.IGNORECASE,
+)
+
+
+def _label(sql: str) -> tuple:
+    """
+    Gets (table, operation) of a statement, e.g. ("WGData", "select")
+    """
+    operation = sql.lstrip()[:8].split(None, 1)
+    operation = operation[0].lower() if operation else "unknown"
+    table = _TABLE.search(sql)
+
+    return (table.group(1) if table is not None else "", operation)
+
+
+class _Histogram:
+    """
+    Count, sum and bucket counts of observed durations
+    """
+    __slots__ = ("count", "total", "buckets")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.buckets = [0] * (len(BUCKETS) + 1)
+
+    def observe(self, seconds: float) -> None:
+        self.count += 1
+        self.total += seconds
+        self.buckets[bisect_left(BUCKETS, seconds)] += 1
+
+    def as_dict(self) -> dict:
+        cumulative, running = {}, 0
+        for bound, count in zip(BUCKETS + (float("inf"),), self.buckets):
+            running += count
+            cumulative[str(bound)] = running
+
+        return {"count": self.count, "sum": self.total, "buckets": cumulative}
+
+
+class _CountingCursor:
+    """
+    DB-API cursor proxy counting the rows fetched from a SELECT, added to
+    the metrics once the cursor is exhausted or closed
+    """
+
+    def __init__(self, cursor, metrics, label: tuple):
+        self._cursor = cursor
+        self._metrics = metrics
+        self._label = label
+        self._count = 0
+
+    def _flush(self) -> None:
+        if self._count:
+            self._metrics.add_rows(self._label, self._count)
+            self._count = 0
+
+    def fetchone(self):
+        row = self._cursor.fetchone()
+        if row is None:
+            self._flush()
+        else:
+            self._count += 1
+        return row
+
+    def fetchmany(self, *args):
+        rows = self._cursor.fetchmany(*args)
+        self._count += len(rows)
+        if not rows:
+            self._flush()
+        return rows
+
+    def fetchall(self):
+        rows = self._cursor.fetchall()
+        self._count += len(rows)
+        self._flush()
+        return rows
+
+    def __iter__(self):
+        try:
+            for row in self._cursor:
+                self._count += 1
+                yield row
+        finally:
+            self._flush()
+
+    def close(self):
+        self._flush()
+        return self._cursor.close()
+
+    def __del__(self):
+        # left unread and unclosed
+        self._flush()
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class DBMetrics:
+    """
+    Query instrumentation of one peewee database: statements, latency
+    histograms and rows per (table, operation), and transaction durations.
+    Installed by wrapping the methods of the database instance, so there
+    is no cost at all while it is not installed.
+    Latency is the execution of a statement, rows of a SELECT are counted
+    once its cursor is read to the end or closed.
+    """
+
+    def __init__(self, *, slow_threshold: float = 0.5):
+        """
+        :param slow_threshold: float: seconds from which a statement is logged
+                to the "wireguard_db.slow" logger, None to log none
+        ivar _queries: dict: (table, operation) -> _Histogram
+        ivar _rows: dict: (table, operation) -> rows returned or changed
+        ivar _database: peewee.Database: the instrumented database, if installed
+        """
+        self.slow_threshold = slow_threshold
+        self._lock = threading.Lock()
+        self._queries = {}
+        self._rows = {}
+        self._transactions = _Histogram()
+        self._slow = 0
+        self._started = threading.local()
+        self._database = None
+        self._previous = {}
+
+    def install(self, db) -> None:
+        """
+        Instruments a peewee database, see uninstall()
+        :param db: peewee.Database: not the proxy
+        :returns: None
+        """
+        if self._database is not None:
+            self.uninstall()
+
+        execute_sql = db.execute_sql
+        begin, commit, rollback = db.begin, db.commit, db.rollback
+        # wrappers installed before (e.g. by a router) are put back by uninstall()
+        self._previous = {name: db.__dict__[name] for name in _WRAPPED if name in db.__dict__}
+
+        def timed_execute_sql(sql, params=None, *args, **kwargs):
+            start = time.perf_counter()
+            cursor = execute_sql(sql, params, *args, **kwargs)
+            seconds = time.perf_counter() - start
+
+            label = _label(sql)
+            self.observe(label, seconds, sql)
+            if "select" == label[1]:
+                return _CountingCursor(cursor, self, label)
+
+            if cursor.rowcount and cursor.rowcount > 0:
+                self.add_rows(label, cursor.rowcount)
+            return cursor
+
+        def timed_begin(*args, **kwargs):
+            self._started.value = time.perf_counter()
+            return begin(*args, **kwargs)
+
+        def ended(end):
+            def timed_end(*args, **kwargs):
+                try:
+                    return end(*args, **kwargs)
+                finally:
+                    start = getattr(self._started, "value", None)
+                    if start is not None:
+                        self._started.value = None
+                        with self._lock:
+                            self._transactions.observe(time.perf_counter() - start)
+            return timed_end
+
+        # instance attributes shadow the class methods
+        db.execute_sql = timed_execute_sql
+        db.begin = timed_begin
+        db.commit = ended(commit)
+        db.rollback = ended(rollback)
+        self._database = db
+
+    def uninstall(self) -> None:
+        """
+        Removes the instrumentation, the counters are kept
+        :returns: None
+        """
+        if self._database is None:
+            return
+
+        for name in _WRAPPED:
+            self._database.__dict__.pop(name, None)
+        self._database.__dict__.update(self._previous)
+        self._database = None
+
+    @property
+    def installed(self) -> bool:
+        """
+        Gets whether a database is instrumented
+        :returns: True if installed
+        :rtype: bool
+        """
+        return self._database is not None
+
+    def observe(self, label: tuple, seconds: float, sql: str = "") -> None:
+        """
+        Records one statement
+        :param label: tuple: (table, operation)
+        :param seconds: float: execution time
+        :param sql: str: statement, logged if slow
+        :returns: None
+        """
+        with self._lock:
+            histogram = self._queries.get(label)
+            if histogram is None:
+                histogram = self._queries[label] = _Histogram()
+            histogram.observe(seconds)
+
+            slow = self.slow_threshold is not None and seconds >= self.slow_threshold
+            if slow:
+                self._slow += 1
+
+        if slow:
+            slow_log.warning("%.3fs %s", seconds, sql)
+
+    def add_rows(self, label: tuple, rows: int) -> None:
+        """
+        Records rows returned or changed by a statement
+        :returns: None
+        """
+        with self._lock:
+            self._rows[label] = self._rows.get(label, 0) + rows
+
+    def reset(self) -> None:
+        """
+        Clears all counters
+        :returns: None
+        """
+        with self._lock:
+            self._queries, self._rows = {}, {}
+            self._transactions = _Histogram()
+            self._slow = 0
+
+    def as_dict(self) -> dict:
+        """
+        Gets a snapshot of all counters
+        :returns: dict with queries, slow_queries, transactions; queries are
+                keyed by "table.operation" with count, sum, buckets and rows
+        :rtype: dict
+        """
+        with self._lock:
+            queries = {}
+            for (table, operation), histogram in sorted(self._queries.items()):
+                query = histogram.as_dict()
+                query["rows"] = self._rows.get((table, operation), 0)
+                queries[f"{table}.{operation}"] = query
+
+            return {
+                "queries": queries,
+                "slow_queries": self._slow,
+                "transactions": self._transactions.as_dict(),
+            }
+
+    def prometheus(self, prefix: str = "wireguard_db") -> str:
+        """
+        Gets a snapshot in the prometheus text exposition format
+        :param prefix: str: metric name prefix
+        :returns: metrics text
+        :rtype: str
+        """
+        snapshot = self.as_dict()
+        lines = [
+            f"# HELP {prefix}_query_seconds Statement execution time",
+            f"# TYPE {prefix}_query_seconds histogram",
+        ]
+        rows = [
+            f"# HELP {prefix}_query_rows_total Rows returned or changed",
+            f"# TYPE {prefix}_query_rows_total counter",
+        ]
+
+        for name, query in snapshot["queries"].items():
+            table, operation = name.rsplit(".", 1)
+            labels = f'table="{table}",operation="{operation}"'
+            lines.extend(_histogram_lines(f"{prefix}_query_seconds", labels, query))
+            rows.append(f"{prefix}_query_rows_total{{{labels}}} {query['rows']}")
+
+        lines.extend(rows)
+        lines.extend([
+            f"# HELP {prefix}_slow_queries_total Statements over the slow threshold",
+            f"# TYPE {prefix}_slow_queries_total counter",
+            f"{prefix}_slow_queries_total {snapshot['slow_queries']}",
+            f"# HELP {prefix}_transaction_seconds Transaction duration",
+            f"# TYPE {prefix}_transaction_seconds histogram",
+        ])
+        lines.extend(_histogram_lines(f"{prefix}_transaction_seconds", "", snapshot["transactions"]))
+
+        return "\n".join(lines) + "\n"
+
+
+def _histogram_lines(name: str, labels: str, histogram: dict) -> list:
+    """
+    Prometheus lines of one histogram
+    """
+    separator = "," if labels else ""
+    lines = [
+        f'{name}_bucket{{{labels}{separator}le="{"+Inf" if "inf" == bound else bound}"}} {count}'
+        for bound, count in histogram["buckets"].items()
+    ]
+    braces = f"{{{labels}}}" if labels else ""
+    lines.append(f"{name}_sum{braces} {histogram['sum']}")
+    lines.append(f"{name}_count{braces} {histogram['count']}")
+    return lines
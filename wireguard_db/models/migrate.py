@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+"""
+Copies the wireguard tables from one database to another, e.g. a sqlite
+file to postgresql:
+
+    python -m wireguard_db.models.migrate --source-adapter sqlite3 --target-adapter postgresql
+"""
+__version__ = "0.1.0"
+__license__ = "GPLv3"
+__docformat__ = "reStructuredText"
+
+import argparse
+import hashlib
+import json
+import sys
+from pathlib import Path
+from peewee import PostgresqlDatabase
+from .bulk import insert_rows  # pylint: disable=E0402
+from .config import DBConfig  # pylint: disable=E0402
+from .database import DBConnect  # pylint: disable=E0402
+from .export import write_atomic  # pylint: disable=E0402
+from .reader import row_converter  # pylint: disable=E0402
+from .tables import database, WGData, WGKeyPool, WGRelation  # pylint: disable=E0402
+
+# tables copied, parents first; peer state, traffic and the change log are runtime data
+TABLES = (WGData, WGRelation, WGKeyPool)
+# rows read, written and verified per transaction
+CHUNK = 5000
+
+
+def checksum(rows: list) -> str:
+    """
+    Checksum of converted rows, equal on all adapters for equal content
+    :param rows: list of python value tuples, the same type on both sides
+    :returns: hex digest
+    :rtype: str
+    """
+    return hashlib.sha256(repr(rows).encode("utf8")).hexdigest()
+
+
+class WGMigrate:
+    """
+    Streams the tables of a source database into the target bound by
+    DBConnect. Rows are read by keyset pagination on the id, inserted with
+    their ids in chunks, one transaction per chunk, and each chunk is read
+    back and compared by checksum before it is committed. The last id of
+    each table is kept in a checkpoint file, an interrupted run resumes
+    there; rows written already are skipped.
+    """
+
+    def __init__(self, source: tuple, target: tuple, *, chunk: int = CHUNK, checkpoint: str = None):
+        """
+        :param source: tuple: setup as returned from DBConfig.read()
+        :param target: tuple: setup as returned from DBConfig.read(), tables are created
+        :param chunk: int: rows per transaction
+        :param checkpoint: str: optional, JSON file with the progress
+        ivar _source: peewee.Database: not bound to the models
+        ivar _connect: DBConnect: the target, bound to the models
+        ivar _positions: dict: table name -> last id copied
+        """
+        if not isinstance(chunk, int) or chunk < 1:
+            raise ValueError('"chunk" must be a positive integer')
+
+        self._chunk = chunk
+        self._checkpoint = Path(checkpoint) if checkpoint else None
+        self._positions = {}
+        if self._checkpoint is not None and self._checkpoint.exists():
+            self._positions = json.loads(self._checkpoint.read_text(encoding="utf8"))
+
+        self._source = DBConnect.create_database(source)
+        self._connect = DBConnect(target)
+
+    def close(self) -> None:
+        """
+        Closes source and target
+        :returns: None
+        """
+        self._source.close()
+        self._connect.close()
+
+    def run(self) -> dict:
+        """
+        Copies all tables
+        :returns: table name -> rows copied by this run
+        :rtype: dict
+        """
+        copied = {}
+        self._connect.get()
+        self._source.connect(reuse_if_open=True)
+
+        for model in TABLES:
+            copied[model.__name__] = self.copy(model)
+
+        return copied
+
+    def copy(self, model) -> int:
+        """
+        Copies one table from the checkpoint on
+        :param model: Model: table to copy, tables it refers to copied before
+        :returns: rows copied
+        :rtype: int
+        """
+        fields = tuple(model._meta.sorted_fields)  # pylint: disable=protected-access
+        convert = row_converter(fields)
+        primary_key = model._meta.primary_key  # pylint: disable=protected-access
+        name = model.__name__
+        copied = 0
+
+        while True:
+            last = self._positions.get(name, 0)
+            query = model.select(*fields).where(primary_key > last).order_by(primary_key).limit(self._chunk)
+            rows = list(self._source.execute(query))
+            if not rows:
+                break
+            if convert is not None:
+                rows = [convert(row) for row in rows]
+
+            with database.atomic():
+                # python values are taken by all drivers as they are
+                insert_rows(model, fields, rows, ignore=True, convert=False)
+                self._verify(model, fields, convert, rows)
+
+            self._positions[name] = rows[-1][0]
+            self._save()
+            copied += len(rows)
+
+        self._reset_sequence(model)
+        return copied
+
+    @staticmethod
+    def _verify(model, fields: tuple, convert, rows: list) -> None:
+        """
+        Reads a chunk back from the target, raises LookupError if it differs
+        """
+        primary_key = model._meta.primary_key  # pylint: disable=protected-access
+        query = (
+            model.select(*fields)
+            .where((primary_key >= rows[0][0]) & (primary_key <= rows[-1][0]))
+            .order_by(primary_key)
+        )
+        written = list(database.execute(query))
+        if convert is not None:
+            written = [convert(row) for row in written]
+
+        if checksum(rows) != checksum(written):
+            raise LookupError(
+                f'"{model.__name__}" ids {rows[0][0]} to {rows[-1][0]} differ in the target'
+            )
+
+    def _save(self) -> None:
+        """
+        Writes the checkpoint, if any
+        """
+        if self._checkpoint is not None:
+            write_atomic(self._checkpoint, json.dumps(self._positions, sort_keys=True), 0o644)
+
+    @staticmethod
+    def _reset_sequence(model) -> None:
+        """
+        Moves the id sequence of a postgresql target past the copied ids,
+        the other adapters follow explicit ids on their own
+        """
+        if not isinstance(database.obj, PostgresqlDatabase):
+            return
+
+        table = model._meta.table_name  # pylint: disable=protected-access
+        column = model._meta.primary_key.column_name  # pylint: disable=protected-access
+        database.execute_sql(
+            f"SELECT setval(pg_get_serial_sequence(%s, %s), COALESCE(MAX(\"{column}\"), 0) + 1, false) FROM \"{table}\"",
+            (f'"{table}"', column),
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--source", default="default", help="config file of the source")
+    parser.add_argument("--source-adapter", required=True)
+    parser.add_argument("--target", default="default", help="config file of the target")
+    parser.add_argument("--target-adapter", required=True)
+    parser.add_argument("--chunk", type=int, default=CHUNK)
+    parser.add_argument("--checkpoint", help="JSON file to resume an interrupted run from")
+    args = parser.parse_args(argv)
+
+    source = DBConfig().read(config_adapter=args.source_adapter, config_file=args.source)
+    target = DBConfig().read(config_adapter=args.target_adapter, config_file=args.target)
+
+    with WGMigrate(source, target, chunk=args.chunk, checkpoint=args.checkpoint) as migrate:
+        for table, rows in migrate.run().items():
+            print(f"{table:<12} {rows:>10}")
+
+    return 0
+
+
+if "__main__" == __name__:
+    sys.exit(main())
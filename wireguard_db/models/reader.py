@@ -0,0 +1,297 @@
+# -*- coding: utf-8 -*-
+__version__ = "0.1.0"
+__license__ = "GPLv3"
+__docformat__ = "reStructuredText"
+
+from collections import namedtuple
+from datetime import datetime
+from functools import lru_cache
+from itertools import count
+from peewee import BooleanField, DateTimeField, MySQLDatabase, PostgresqlDatabase
+from ..utils.dicts import compile_wgdata2wireguard  # pylint: disable=E0402
+from .tables import database, WGData  # pylint: disable=E0402
+
+# rows taken from the cursor at once
+FETCH_SIZE = 2000
+# orders of the rows: field name -> keyset, unique in this order
+ORDERS = {"id": ("id",), "updated": ("updated", "id")}
+# names of server-side cursors, unique per process
+_cursor_names = count(1)
+
+
+def _converter(field):
+    """
+    Gets a fast converter for the values of a field, or None if the
+    driver returns them as python values already
+    """
+    if isinstance(field, BooleanField):
+        return lambda value: value if value is None else bool(value)
+
+    if isinstance(field, DateTimeField):
+        python_value = field.python_value
+
+        def to_datetime(value):
+            # the stored format is ISO, other formats take the field's way
+            if isinstance(value, str):
+                try:
+                    return datetime.fromisoformat(value)
+                except ValueError:
+                    pass
+            return python_value(value)
+
+        return to_datetime
+
+    return None
+
+
+def row_converter(fields: tuple):
+    """
+    Gets one function converting a raw row of a query shape, the fields
+    that need no conversion are passed through as they are
+    :param fields: tuple: peewee fields in row order
+    :returns: callable(row: tuple) -> tuple, None if no field needs conversion
+    :rtype: callable
+    """
+    converters = tuple(
+        (index, converter)
+        for index, converter in enumerate(_converter(field) for field in fields)
+        if converter is not None
+    )
+    if not converters:
+        return None
+
+    def convert(row: tuple) -> tuple:
+        row = list(row)
+        for index, converter in converters:
+            row[index] = converter(row[index])
+        return tuple(row)
+
+    return convert
+
+
+@lru_cache(maxsize=64)
+def row_type(columns: tuple) -> type:
+    """
+    Gets the row class of a query shape, one per column tuple
+    :param columns: tuple: column names in row order
+    :returns: namedtuple class "WGRow"
+    :rtype: type
+    """
+    return namedtuple("WGRow", columns)
+
+
+def _stream_cursor(sql: str, params: list, fetch_size: int) -> tuple:
+    """
+    Executes a query without the driver buffering the whole result: a
+    named (server-side) cursor on postgresql, an unbuffered one on mysql;
+    sqlite steps through the result anyway.
+    Postgresql and mysql read through a connection of their own: a named
+    cursor needs a transaction, which is not held open on the connection
+    of the thread, and mysql runs no other statement on a connection while
+    an unbuffered result is unread. Uncommitted writes of the thread are
+    not seen by them.
+    :returns: (cursor, connection to close or None)
+    :rtype: tuple
+    """
+    obj = database.obj
+    if isinstance(obj, PostgresqlDatabase):
+        connection = obj._connect()  # pylint: disable=protected-access
+        connection.autocommit = False
+        cursor = connection.cursor(name=f"wgreader_{next(_cursor_names)}")
+        cursor.itersize = fetch_size
+
+    elif isinstance(obj, MySQLDatabase):
+        from pymysql.cursors import SSCursor  # pylint: disable=import-outside-toplevel
+
+        connection = obj._connect()  # pylint: disable=protected-access
+        cursor = connection.cursor(SSCursor)
+
+    else:
+        return database.execute_sql(sql, params), None
+
+    try:
+        cursor.execute(sql, params)
+    except Exception:
+        connection.close()
+        raise
+
+    return cursor, connection
+
+
+class WGReader:
+    """
+    Lightweight read path for bulk exports: plain tuples are taken from the
+    cursor and turned into namedtuple rows, no model instances are built.
+    Only values the driver does not return as python already (booleans,
+    timestamps) pass through their field.
+    Memory stays flat with any table size: without chunk one query is read
+    through a server-side (postgresql) or unbuffered (mysql) cursor, with
+    chunk one query per chunk continues after the last row read (keyset
+    pagination), so no transaction or cursor is held open between chunks.
+    A cursor left unread is closed by close(), or at the end of a with
+    block: with WGReader() as reader: ...
+    """
+
+    def __init__(self, *fields, where=None, fetch_size: int = FETCH_SIZE, order: str = "id", chunk: int = None):
+        """
+        :param fields: WGData fields to read (default: all)
+        :param where: peewee expression, optional
+        :param fetch_size: int: rows taken from the cursor at once
+        :param order: str: "id" or "updated" (ties by id)
+        :param chunk: int: rows per query, None reads all by one query
+        ivar _columns: tuple: field names, the query shape
+        ivar _select: tuple: fields and the keyset fields not among them
+        ivar _keys: tuple: positions of the keyset fields within _select
+        ivar _convert: callable: converts a raw row tuple, None if not needed
+        ivar _streams: list: (cursor, connection or None) of the unread queries
+        """
+        if not isinstance(fetch_size, int) or fetch_size < 1:
+            raise ValueError('"fetch_size" must be a positive integer')
+
+        if order not in ORDERS:
+            raise ValueError(f'"{order}" is not any of {tuple(ORDERS)}')
+
+        if chunk is not None and (not isinstance(chunk, int) or chunk < 1):
+            raise ValueError('"chunk" must be a positive integer')
+
+        self._fields = fields or tuple(WGData._meta.sorted_fields)  # pylint: disable=protected-access
+        self._where = where
+        self._fetch_size = fetch_size
+        self._chunk = chunk
+        self._columns = tuple(field.name for field in self._fields)
+        self._order = tuple(WGData._meta.fields[name] for name in ORDERS[order])  # pylint: disable=protected-access
+        self._select = self._fields + tuple(field for field in self._order if field.name not in self._columns)
+        names = [field.name for field in self._select]
+        self._keys = tuple(names.index(field.name) for field in self._order)
+        self._convert = row_converter(self._select)
+        self._streams = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def close(self) -> None:
+        """
+        Closes the cursors and connections of queries not read to the end
+        :returns: None
+        """
+        for stream in list(self._streams):
+            self._release(stream)
+
+    def _release(self, stream: tuple) -> None:
+        """
+        Closes the cursor and the connection of a query once
+        """
+        if stream not in self._streams:
+            return
+
+        self._streams.remove(stream)
+        cursor, connection = stream
+        try:
+            cursor.close()
+        finally:
+            if connection is not None:
+                connection.close()
+
+    @property
+    def columns(self) -> tuple:
+        """
+        Gets the column names in row order
+        :returns: field names
+        :rtype: tuple
+        """
+        return self._columns
+
+    def _query(self, after: tuple = None):
+        """
+        Builds the query, continuing after the raw keyset values of a row
+        """
+        query = WGData.select(*self._select).order_by(*self._order)
+        if self._where is not None:
+            query = query.where(self._where)
+
+        if after is not None:
+            if 1 == len(self._order):
+                query = query.where(self._order[0] > after[0])
+            else:
+                first, second = self._order
+                query = query.where((first > after[0]) | ((first == after[0]) & (second > after[1])))
+
+        return query
+
+    def _output(self, rows):
+        """
+        Converts raw rows and drops the keyset fields not asked for
+        """
+        if self._convert is not None:
+            rows = map(self._convert, rows)
+
+        if len(self._select) > len(self._fields):
+            width = len(self._fields)
+            rows = (row[:width] for row in rows)
+
+        return rows
+
+    def _cursor_rows(self):
+        """
+        Streams the rows of one query
+        """
+        sql, params = self._query().sql()
+        stream = _stream_cursor(sql, params, self._fetch_size)
+        self._streams.append(stream)
+        cursor = stream[0]
+
+        try:
+            while True:
+                rows = cursor.fetchmany(self._fetch_size)
+                if not rows:
+                    break
+
+                yield from self._output(rows)
+        finally:
+            self._release(stream)
+
+    def _chunk_rows(self):
+        """
+        Streams the rows by one query per chunk
+        """
+        after = None
+        while True:
+            rows = database.execute(self._query(after).limit(self._chunk)).fetchall()
+            if not rows:
+                break
+
+            # raw values, compared as the database stores them
+            after = tuple(rows[-1][index] for index in self._keys)
+            yield from self._output(rows)
+
+            if len(rows) < self._chunk:
+                break
+
+    def tuples(self):
+        """
+        Streams the rows as plain tuples
+        :returns: generator of tuple
+        :rtype: generator
+        """
+        if self._chunk is None:
+            return self._cursor_rows()
+
+        return self._chunk_rows()
+
+    def __iter__(self):
+        """
+        Streams the rows as namedtuples, e.g. row.wg_address
+        """
+        make = row_type(self._columns)._make
+        return map(make, self.tuples())
+
+    def wireguard(self):
+        """
+        Streams the rows translated as wgdata2wireguard() does
+        :returns: generator of dict
+        :rtype: generator
+        """
+        return map(compile_wgdata2wireguard(self._columns), self.tuples())
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+__version__ = "0.1.0"
+__license__ = "GPLv3"
+__docformat__ = "reStructuredText"
+
+from ..utils.dicts import wgdata2section  # pylint: disable=E0402
+from .tables import WGData, WGRelation  # pylint: disable=E0402
+
+
+class WGRender:
+    """
+    Renders the wg-quick configs of a server and all its peers.
+    The server row is read once, the peers are streamed by one
+    joined query per output, independent of the number of peers.
+    """
+
+    def __init__(self, server, *, enabled_only: bool = True):
+        """
+        :param server: int or str: WGData id or wg_interface of the server
+        :param enabled_only: bool: skip peers with is_enabled = False
+        ivar _server: dict: the server row, read on first use
+        """
+        if not isinstance(server, (int, str)) or isinstance(server, bool):
+            raise ValueError('"server" must be an id (int) or an interface name (str)')
+
+        self._key = server
+        self._enabled_only = enabled_only
+        self._server = None
+
+    @property
+    def server_row(self) -> dict:
+        """
+        Gets the server row
+        :returns: server row as dict
+        :rtype: dict
+        """
+        if self._server is None:
+            if isinstance(self._key, int):
+                where = WGData.id == self._key
+            else:
+                where = WGData.wg_interface == self._key
+
+            row = WGData.select().where(where).dicts().first()
+            if row is None:
+                raise LookupError(f'Server "{self._key}" not found')
+
+            self._server = row
+
+        return self._server
+
+    def peer_rows(self):
+        """
+        Streams the peer rows of the server in relation order (one query)
+        :returns: generator of row dicts
+        :rtype: generator
+        """
+        query = (
+            WGData.select()
+            .join(WGRelation, on=(WGRelation.WGPeer == WGData.id))
+            .where(WGRelation.WGParent == self.server_row["id"])
+            .order_by(WGRelation.id)
+        )
+        if self._enabled_only:
+            query = query.where(WGData.is_enabled == True)  # noqa: E712 pylint: disable=C0121
+
+        return query.dicts().iterator()
+
+    def server(self):
+        """
+        Streams the server config: its [Interface] and one [Peer] per peer
+        :returns: generator of config text chunks
+        :rtype: generator
+        """
+        server = self.server_row
+        yield wgdata2section(server, "Interface")
+
+        for peer in self.peer_rows():
+            # the server reaches a peer on its own addresses
+            if peer["wg_allowedips"] is None:
+                peer["wg_allowedips"] = peer["wg_address"]
+
+            yield wgdata2section(peer, "Peer")
+
+    def peers(self):
+        """
+        Streams the configs of all peers: their [Interface] and the server as [Peer]
+        :returns: generator of (peer id: int, config text: str)
+        :rtype: generator
+        """
+        server = self.server_row
+        remote = {
+            "wg_publickey": server["wg_publickey"],
+            "wg_endpoint": server["wg_endpoint"],
+            # a peer routes the whole server subnet through the tunnel
+            "wg_allowedips": server["wg_allowedips"] or server["wg_address"],
+        }
+
+        for peer in self.peer_rows():
+            remote["wg_presharedkey"] = peer["wg_presharedkey"]
+            remote["wg_persistentkeepalive"] = peer["wg_persistentkeepalive"]
+
+            yield peer["id"], (
+                wgdata2section(peer, "Interface") + wgdata2section(remote, "Peer")
+            )
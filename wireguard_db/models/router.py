@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+__version__ = "0.1.0"
+__license__ = "GPLv3"
+__docformat__ = "reStructuredText"
+
+import threading
+import time
+from contextlib import contextmanager
+from peewee import OperationalError
+from .constants import ROUTING_POLICIES  # pylint: disable=E0402
+
+
+class DBRouter:
+    """
+    Sends SELECTs of the primary database to read replicas.
+    Writes, transactions and SELECT ... FOR UPDATE stay on the primary, and
+    so do all reads of a thread while it is pinned (read-your-writes).
+    Installed by wrapping execute_sql of the primary database instance.
+    A replica that cannot be reached is skipped, the read goes to the primary.
+    """
+
+    def __init__(self, primary, replicas: list, *, routing: str = "round_robin", sticky: float = 0.0):
+        """
+        :param primary: peewee.Database: the database the models are bound to
+        :param replicas: list of peewee.Database: read replicas
+        :param routing: str: "round_robin" or "least_loaded"
+        :param sticky: float: seconds a thread reads from the primary after its own write
+        ivar _load: list: SELECTs running per replica, for least_loaded
+        ivar _local: threading.local: pin depth and time of the last write per thread
+        """
+        if routing not in ROUTING_POLICIES:
+            raise ValueError(f'"routing" "{routing}" is not any of {ROUTING_POLICIES}')
+
+        self._primary = primary
+        self._replicas = list(replicas)
+        self._routing = routing
+        self._sticky = sticky
+        self._lock = threading.Lock()
+        self._next = 0
+        self._load = [0] * len(self._replicas)
+        self._local = threading.local()
+        self._stats = {"primary": 0, "replicas": [0] * len(self._replicas), "fallbacks": 0}
+        self._execute_sql = None
+
+    @property
+    def replicas(self) -> list:
+        """
+        Gets the replica databases
+        :returns: peewee databases
+        :rtype: list
+        """
+        return list(self._replicas)
+
+    @property
+    def stats(self) -> dict:
+        """
+        Gets the statement counters
+        :returns: primary, replicas (list, per replica) and fallbacks
+        :rtype: dict
+        """
+        with self._lock:
+            return {
+                "primary": self._stats["primary"],
+                "replicas": list(self._stats["replicas"]),
+                "fallbacks": self._stats["fallbacks"],
+            }
+
+    def install(self) -> None:
+        """
+        Starts routing the SELECTs of the primary
+        :returns: None
+        """
+        if self._execute_sql is not None or not self._replicas:
+            return
+
+        self._execute_sql = self._primary.execute_sql
+        self._primary.execute_sql = self._route
+
+    def uninstall(self) -> None:
+        """
+        Stops routing and closes the replicas
+        :returns: None
+        """
+        if self._execute_sql is None:
+            return
+
+        self._primary.__dict__.pop("execute_sql", None)
+        self._execute_sql = None
+        for replica in self._replicas:
+            replica.close()
+
+    @contextmanager
+    def pinned(self):
+        """
+        Context within which the current thread reads from the primary only
+        """
+        self._local.depth = getattr(self._local, "depth", 0) + 1
+        try:
+            yield self
+        finally:
+            self._local.depth -= 1
+
+    def _reads_primary(self) -> bool:
+        """
+        Tells whether the current thread has to read from the primary
+        """
+        if getattr(self._local, "depth", 0) or self._primary.in_transaction():
+            return True
+
+        written = getattr(self._local, "written", None)
+        return written is not None and time.monotonic() - written < self._sticky
+
+    def _pick(self) -> int:
+        """
+        Chooses a replica by the routing policy
+        """
+        with self._lock:
+            if "least_loaded" == self._routing:
+                index = min(range(len(self._load)), key=self._load.__getitem__)
+            else:
+                index = self._next
+                self._next = (self._next + 1) % len(self._replicas)
+
+            self._load[index] += 1
+            self._stats["replicas"][index] += 1
+            return index
+
+    def _route(self, sql, params=None, *args, **kwargs):
+        """
+        execute_sql of the primary, SELECTs are sent to a replica
+        """
+        head = sql.lstrip()[:6].upper()
+        if "SELECT" != head or "FOR UPDATE" in sql.upper() or self._reads_primary():
+            if "SELECT" != head:
+                self._local.written = time.monotonic()
+            with self._lock:
+                self._stats["primary"] += 1
+            return self._execute_sql(sql, params, *args, **kwargs)
+
+        index = self._pick()
+        try:
+            return self._replicas[index].execute_sql(sql, params)
+        except OperationalError:
+            with self._lock:
+                self._stats["fallbacks"] += 1
+            return self._execute_sql(sql, params, *args, **kwargs)
+        finally:
+            with self._lock:
+                self._load[index] -= 1
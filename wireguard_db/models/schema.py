@@ -0,0 +1,234 @@
+# -*- coding: utf-8 -*-
+__version__ = "0.1.0"
+__license__ = "GPLv3"
+__docformat__ = "reStructuredText"
+
+import hashlib
+from datetime import datetime
+from peewee import DatabaseError, SqliteDatabase
+from playhouse.migrate import migrate as run_migrations, SchemaMigrator
+from .tables import BaseModel, database, MODELS, WGChange, WGData, WGKeyPool, WGPeerState, WGRelation, WGSchema, WGShardMap, WGTraffic  # pylint: disable=E0402
+
+# raise with every change of MODELS and add the step to MIGRATIONS
+SCHEMA_VERSION = 9
+
+
+def _add_index(field) -> None:
+    """
+    Creates the index of a field as create_table() names it, unless it
+    exists: a migration stopped halfway can run again, mysql knows no
+    CREATE INDEX IF NOT EXISTS. Names are compared in lower case, add_column()
+    of the migrator names the index of an indexed field after the table.
+    """
+    table = field.model._meta.table_name  # pylint: disable=protected-access
+    index = field.model.index(field, safe=database.obj.safe_create_index)
+
+    names = {meta.name.lower() for meta in database.get_indexes(table)}
+    if index._name.lower() not in names:  # pylint: disable=protected-access
+        database.execute(index)
+
+
+def _add_column(migrator: SchemaMigrator, field) -> None:
+    """
+    Adds the column of a field unless it exists, see _add_index()
+    """
+    table = field.model._meta.table_name  # pylint: disable=protected-access
+
+    if field.column_name not in {meta.name for meta in database.get_columns(table)}:
+        run_migrations(migrator.add_column(table, field.column_name, field))
+
+
+def _add_key_pool(_migrator: SchemaMigrator) -> None:
+    WGKeyPool.create_table(safe=True)
+
+
+def _add_change_feed(_migrator: SchemaMigrator) -> None:
+    # timestamps read by the change feed, named as create_table() does
+    _add_index(WGData.updated)
+    _add_index(WGRelation.created)
+    # the WGTombstone table of this version is replaced by _add_change_log()
+
+
+def _add_peer_state(_migrator: SchemaMigrator) -> None:
+    # peers reported by 'wg show' are matched by their public key
+    _add_index(WGData.wg_publickey)
+    WGPeerState.create_table(safe=True)
+
+
+def _add_traffic(_migrator: SchemaMigrator) -> None:
+    WGTraffic.create_table(safe=True)
+
+
+def _add_shard_map(_migrator: SchemaMigrator) -> None:
+    WGShardMap.create_table(safe=True)
+
+
+def _widen_traffic_times(migrator: SchemaMigrator) -> None:
+    # sqlite integers are 64 bit already
+    if isinstance(database.obj, SqliteDatabase):
+        return
+
+    run_migrations(
+        migrator.alter_column_type("WGTraffic", "bucket", WGTraffic.bucket),
+        migrator.alter_column_type("WGTraffic", "handshake", WGTraffic.handshake),
+    )
+
+
+def _add_import_batch(migrator: SchemaMigrator) -> None:
+    _add_column(migrator, WGData.import_batch)
+    _add_index(WGData.import_batch)
+
+
+def _add_change_log(_migrator: SchemaMigrator) -> None:
+    WGChange.create_table(safe=True)
+
+    class WGTombstone(BaseModel):  # pylint: disable=too-few-public-methods
+        """
+        Deletions read by the change feed of versions 3 to 8
+        """
+
+        class Meta:  # pylint: disable=too-few-public-methods
+            table_name = "WGTombstone"
+
+    WGTombstone.drop_table(safe=True)
+
+
+# version: callable(migrator: SchemaMigrator), upgrades from version - 1
+MIGRATIONS = {
+    2: _add_key_pool,
+    3: _add_change_feed,
+    4: _add_peer_state,
+    5: _add_traffic,
+    6: _add_shard_map,
+    7: _widen_traffic_times,
+    8: _add_import_batch,
+    9: _add_change_log,
+}
+
+# databases checked by this process: see _database_key()
+_checked = set()
+
+
+def schema_hash(models: tuple = MODELS) -> str:
+    """
+    Hashes the table definitions of the models
+    :param models: tuple: peewee models
+    :returns: sha256 hex digest
+    :rtype: str
+    """
+    definition = []
+    for model in models:
+        meta = model._meta  # pylint: disable=protected-access
+        definition.append(meta.table_name)
+        definition.extend(
+            (field.column_name, field.field_type, field.null, field.unique, field.index)
+            for field in meta.sorted_fields
+        )
+        definition.append(meta.indexes)
+
+    return hashlib.sha256(repr(definition).encode("utf8")).hexdigest()
+
+
+def _marker() -> WGSchema:
+    """
+    Reads the schema marker
+    :returns: latest marker or None if there is none
+    :rtype: WGSchema
+    """
+    try:
+        return WGSchema.select().order_by(WGSchema.id.desc()).first()
+    except DatabaseError:
+        # no marker table yet
+        if database.in_transaction():
+            database.rollback()
+        return None
+
+
+def _write_marker(version: int, current_hash: str) -> None:
+    """
+    Stores the schema marker
+    :returns: None
+    """
+    WGSchema.create(
+        version=version,
+        schema_hash=current_hash,
+        updated=datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+    )
+
+
+def migrate(from_version: int) -> None:
+    """
+    Upgrades the tables step by step to SCHEMA_VERSION
+    :param from_version: int: version found in the database
+    :returns: None
+    """
+    migrator = SchemaMigrator.from_database(database.obj)
+    for version in range(from_version + 1, SCHEMA_VERSION + 1):
+        if version not in MIGRATIONS:
+            raise LookupError(f"No migration to schema version {version}")
+        MIGRATIONS[version](migrator)
+
+
+def _database_key():
+    """
+    Identifies the database in use: equal names on other hosts are others
+    :returns: (database class, database name, host, port), None for sqlite memory
+    :rtype: tuple
+    """
+    obj = database.obj
+    if ":memory:" == obj.database:
+        # every sqlite memory connection is a new database
+        return None
+
+    params = obj.connect_params
+    return (type(obj).__name__, obj.database, params.get("host"), params.get("port"))
+
+
+def check_schema(*, force: bool = False) -> bool:
+    """
+    Makes sure the tables match the models.
+    Costs one SELECT if the stored marker matches, no DDL is run then.
+    :param force: bool: check again, even if checked before by this process
+    :returns: True if tables were created or migrated
+    :rtype: bool
+    """
+    key = _database_key()
+
+    if not force and key in _checked:
+        return False
+
+    current_hash = schema_hash()
+    marker = _marker()
+
+    if marker is not None and current_hash == marker.schema_hash:
+        if key is not None:
+            _checked.add(key)
+        return False
+
+    if marker is not None and marker.version > SCHEMA_VERSION:
+        raise RuntimeError(
+            f"Database schema version {marker.version} is newer than {SCHEMA_VERSION}"
+        )
+
+    if marker is not None and marker.version == SCHEMA_VERSION:
+        raise RuntimeError(
+            f"Models changed without a migration: raise SCHEMA_VERSION ({SCHEMA_VERSION})"
+        )
+
+    with database.atomic():
+        if marker is None and not database.table_exists(MODELS[0]._meta.table_name):
+            # empty database
+            for dbtable in MODELS + (WGSchema,):
+                dbtable.validate_model()
+                dbtable.create_table(safe=True)
+
+        else:
+            # tables from before the marker are version 1
+            WGSchema.create_table(safe=True)
+            migrate(marker.version if marker is not None else 1)
+
+        _write_marker(SCHEMA_VERSION, current_hash)
+
+    if key is not None:
+        _checked.add(key)
+    return True
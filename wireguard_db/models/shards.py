@@ -0,0 +1,305 @@
+# -*- coding: utf-8 -*-
+__version__ = "0.1.0"
+__license__ = "GPLv3"
+__docformat__ = "reStructuredText"
+
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from .bulk import chunk_size, insert_rows, log_changes  # pylint: disable=E0402
+from .database import DBConnect  # pylint: disable=E0402
+from .schema import check_schema  # pylint: disable=E0402
+from .tables import database, MODELS, WGData, WGPeerState, WGRelation, WGShardMap, WGTraffic  # pylint: disable=E0402
+
+# WGData rows copied per transaction while moving
+MOVE_CHUNK = 500
+
+
+class DBShards:
+    """
+    Spreads WGData over several databases by a shard key, host_id by
+    default. The shard of each key value is kept in WGShardMap of the first
+    shard; new values are placed by a hash of the value. Relations live in
+    the shard of their parent, so a parent and its peers share a key value.
+    The models run against a shard within use() or host(), per thread;
+    outside of them they use the first shard.
+    """
+
+    def __init__(self, shards: dict, *, key: str = "host_id", workers: int = None):
+        """
+        :param shards: dict: name -> setup, as returned from DBConfig.read_shards()
+        :param key: str: WGData field choosing the shard
+        :param workers: int: threads for fan_out() (default: one per shard)
+        ivar _connect: DBConnect: the first shard, bound to the models
+        ivar _databases: dict: name -> peewee.Database
+        ivar _placed: dict: str(key value) -> shard name, as read from WGShardMap
+        """
+        if not shards:
+            raise ValueError('"shards" needs at least one database')
+        if key not in WGData._meta.fields:  # pylint: disable=protected-access
+            raise ValueError(f'"{key}" is not a WGData field')
+
+        self._key = WGData._meta.fields[key]  # pylint: disable=protected-access
+        self._names = tuple(shards)
+        self._catalog = self._names[0]
+        self._connect = DBConnect(shards[self._catalog])
+        self._databases = {self._catalog: database.obj}
+        # DBConnect binds the models to its database, they follow the proxy again
+        for model in MODELS:
+            model.bind(database)
+        self._lock = threading.Lock()
+        self._placed = {}
+
+        for name in self._names[1:]:
+            self._databases[name] = DBConnect.create_database(shards[name])
+            with self.use(name):
+                check_schema()
+
+        self._pool = ThreadPoolExecutor(max_workers=workers or len(self._names), thread_name_prefix="wireguard_db-shard")
+
+    @property
+    def names(self) -> tuple:
+        """
+        Gets the shard names, the first keeps the shard map
+        :returns: names
+        :rtype: tuple
+        """
+        return self._names
+
+    def close(self) -> None:
+        """
+        Stops the fan-out threads and closes all shards
+        :returns: None
+        """
+        self._pool.shutdown()
+        for name in self._names[1:]:
+            self._databases[name].close()
+        self._connect.close()
+
+    @contextmanager
+    def use(self, name: str):
+        """
+        Context within which the models of this thread run against a shard
+        :param name: str: shard name
+        """
+        if name not in self._databases:
+            raise LookupError(f'Shard "{name}" not configured')
+
+        previous = database.override(self._databases[name])
+        try:
+            yield self._databases[name]
+        finally:
+            database.override(previous)
+
+    def shard_of(self, value) -> str:
+        """
+        Gets the shard of a key value, a new value is placed and recorded
+        :param value: key value, e.g. a host_id; None is the first shard
+        :returns: shard name
+        :rtype: str
+        """
+        if value is None:
+            return self._catalog
+
+        value = str(value)
+        with self._lock:
+            name = self._placed.get(value)
+        if name is not None:
+            return name
+
+        with self.use(self._catalog):
+            row = WGShardMap.get_or_none(WGShardMap.key == value)
+            if row is None:
+                placed = self._names[zlib.crc32(value.encode("utf8")) % len(self._names)]
+                WGShardMap.insert(key=value, shard=placed).on_conflict_ignore().execute()
+                # a concurrent placement wins
+                row = WGShardMap.get(WGShardMap.key == value)
+
+        with self._lock:
+            self._placed[value] = row.shard
+        return row.shard
+
+    def refresh(self) -> None:
+        """
+        Forgets the shard map read so far, e.g. after another process moved a value
+        :returns: None
+        """
+        with self._lock:
+            self._placed.clear()
+
+    def host(self, value):
+        """
+        Context within which the models of this thread run against the
+        shard of a key value
+        :param value: key value, e.g. a host_id
+        """
+        return self.use(self.shard_of(value))
+
+    def relate(self, parent: WGData, peer: WGData) -> WGRelation:
+        """
+        Creates a relation in the shard of its parent
+        :param parent: WGData: server row
+        :param peer: WGData: peer row, of the same shard
+        :returns: the new relation
+        :rtype: WGRelation
+        """
+        name = self.shard_of(getattr(parent, self._key.name))
+        if self.shard_of(getattr(peer, self._key.name)) != name:
+            raise ValueError(f'Peer "{peer.id}" is not in shard "{name}" of its parent "{parent.id}"')
+
+        with self.use(name):
+            return WGRelation.create(WGParent=parent, WGPeer=peer)
+
+    def fan_out(self, function, *args, **kwargs) -> dict:
+        """
+        Runs a function against every shard in parallel
+        :param function: callable: uses the models as usual
+        :returns: shard name -> result
+        :rtype: dict
+        """
+        def run(name):
+            with self.use(name):
+                with database.connection_context():
+                    return function(*args, **kwargs)
+
+        futures = {name: self._pool.submit(run, name) for name in self._names}
+        return {name: future.result() for name, future in futures.items()}
+
+    def rows(self, query) -> list:
+        """
+        Reads a query from every shard in parallel
+        :param query: peewee query, e.g. WGData.select().where(...)
+        :returns: rows of all shards, in shard order
+        :rtype: list
+        """
+        results = self.fan_out(lambda: list(query.clone()))
+        return [row for name in self._names for row in results[name]]
+
+    def move(self, value, target: str, *, chunk: int = MOVE_CHUNK) -> int:
+        """
+        Moves the rows of a key value to another shard in chunks; the shard
+        map is switched once all rows are copied, then the source rows are
+        deleted. Writes for the value should pause meanwhile. Rows get new
+        ids in the target, runtime rows (peer state, traffic) are dropped.
+        An interrupted move is finished by running it again.
+        :param value: key value, e.g. a host_id
+        :param target: str: shard name
+        :param chunk: int: rows per transaction
+        :returns: WGData rows moved
+        :rtype: int
+        """
+        if value is None:
+            raise ValueError("Rows without a key value stay in the first shard")
+        if target not in self._databases:
+            raise LookupError(f'Shard "{target}" not configured')
+
+        moved = 0
+        source = self.shard_of(value)
+        if source != target:
+            with self.use(source):
+                self._check_edges(value)
+            with self.use(target):
+                # left over by an interrupted move
+                self._purge(value, chunk)
+
+            moved = self._copy(value, source, target, chunk)
+
+            with self.use(self._catalog):
+                WGShardMap.update(shard=target).where(WGShardMap.key == str(value)).execute()
+            with self._lock:
+                self._placed[str(value)] = target
+
+        for name in self._names:
+            if name != target:
+                with self.use(name):
+                    self._purge(value, chunk)
+
+        return moved
+
+    def _check_edges(self, value) -> None:
+        """
+        Raises ValueError if relations connect rows of the value with others
+        """
+        parent, peer = WGData.alias(), WGData.alias()
+        parent_key, peer_key = getattr(parent, self._key.name), getattr(peer, self._key.name)
+
+        crossing = (
+            WGRelation.select()
+            .join(parent, on=(WGRelation.WGParent == parent.id))
+            .switch(WGRelation)
+            .join(peer, on=(WGRelation.WGPeer == peer.id))
+            .where(
+                ((parent_key == value) & ((peer_key != value) | peer_key.is_null()))
+                | ((peer_key == value) & ((parent_key != value) | parent_key.is_null()))
+            )
+            .count()
+        )
+        if crossing:
+            raise ValueError(f'{crossing} relations connect "{value}" with rows of other {self._key.name} values')
+
+    def _copy(self, value, source: str, target: str, chunk: int) -> int:
+        """
+        Copies the WGData rows and relations of a value, with new ids
+        """
+        fields = [field for field in WGData._meta.sorted_fields if field is not WGData.id]  # pylint: disable=protected-access
+        ids, last = {}, 0
+
+        while True:
+            with self.use(source):
+                rows = list(
+                    WGData.select(WGData.id, *fields)
+                    .where((self._key == value) & (WGData.id > last))
+                    .order_by(WGData.id)
+                    .limit(chunk)
+                    .tuples()
+                )
+            if not rows:
+                break
+
+            with self.use(target):
+                with database.atomic():
+                    for row in rows:
+                        ids[row[0]] = WGData.insert(dict(zip(fields, row[1:]))).execute()
+                    log_changes("created", [("WGData", ids[row[0]], None) for row in rows])
+            last = rows[-1][0]
+
+        old = list(ids)
+        size = chunk_size(1)
+        for start in range(0, len(old), size):
+            with self.use(source):
+                relations = [
+                    (ids[parent_id], ids[peer_id], created)
+                    for parent_id, peer_id, created in WGRelation.select(
+                        WGRelation.WGParent, WGRelation.WGPeer, WGRelation.created
+                    ).where(WGRelation.WGParent.in_(old[start:start + size])).tuples()
+                ]
+            with self.use(target):
+                with database.atomic():
+                    insert_rows(WGRelation, (WGRelation.WGParent, WGRelation.WGPeer, WGRelation.created), relations)
+
+        return len(ids)
+
+    def _purge(self, value, chunk: int) -> None:
+        """
+        Deletes the rows of a value and what refers to them from the shard in use
+        """
+        # the relations are deleted by parent and peer, two parameters per id
+        chunk = min(chunk, chunk_size(2))
+        while True:
+            ids = [row[0] for row in WGData.select(WGData.id).where(self._key == value).limit(chunk).tuples()]
+            if not ids:
+                break
+
+            with database.atomic():
+                WGRelation.delete().where(WGRelation.WGParent.in_(ids) | WGRelation.WGPeer.in_(ids)).execute()
+                WGPeerState.delete().where(WGPeerState.peer.in_(ids)).execute()
+                WGTraffic.delete().where(WGTraffic.peer_id.in_(ids)).execute()
+                WGData.delete().where(WGData.id.in_(ids)).execute()
+                log_changes("deleted", [("WGData", row_id, None) for row_id in ids])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
@@ -3,12 +3,16 @@ __version__ = "0.1.8"
 __license__ = "GPLv3"
 __docformat__ = "reStructuredText"
 
+import threading
+from contextlib import nullcontext
 from datetime import datetime
 from peewee import (
     DatabaseProxy,
+    Proxy,
     Model,
     CharField,
     IntegerField,
+    BigIntegerField,
     BooleanField,
     TextField,
     DateTimeField,
@@ -25,14 +29,140 @@ class UnknownField(object):  # pylint: disable=too-few-public-methods
         pass
 
 
+class _ThreadProxy(DatabaseProxy):
+    """
+    DatabaseProxy whose database can be replaced for the current thread,
+    used by DBShards to run the models against one shard
+    """
+    __slots__ = ("_local",)
+
+    def __init__(self):
+        object.__setattr__(self, "_local", threading.local())
+        super().__init__()
+
+    @property
+    def obj(self):
+        return getattr(self._local, "obj", None) or Proxy.obj.__get__(self)
+
+    @obj.setter
+    def obj(self, value):
+        Proxy.obj.__set__(self, value)
+
+    def __setattr__(self, attr, value):
+        if attr not in ("obj", "_callbacks", "_Model"):
+            raise AttributeError("Cannot set attribute on proxy.")
+        object.__setattr__(self, attr, value)
+
+    def override(self, obj):
+        """
+        Sets the database of the current thread
+        :param obj: peewee.Database: None for the shared one again
+        :returns: the database set for the thread before, or None
+        :rtype: peewee.Database
+        """
+        previous = getattr(self._local, "obj", None)
+        self._local.obj = obj
+        return previous
+
+
 # passed as placeholder to the tables
-database = DatabaseProxy()
+database = _ThreadProxy()
+
+
+def timestamp() -> str:
+    """
+    Gets the current time as stored in the timestamp fields,
+    passed as callable default so it is evaluated per row
+    :returns: local time
+    :rtype: str
+    """
+    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+
+# callables notified of changes made through model instances:
+# listener(model: type, action: str, instance: Model), action is one of
+# 'created', 'updated', 'deleted'. Bulk queries are not reported.
+_listeners = []
+
+
+def add_listener(listener) -> None:
+    """
+    Registers a callable for changes made through model instances
+    :param listener: callable: listener(model, action, instance)
+    :returns: None
+    """
+    if listener not in _listeners:
+        _listeners.append(listener)
+
+
+def remove_listener(listener) -> None:
+    """
+    Removes a callable registered by add_listener()
+    :param listener: callable: as registered
+    :returns: None
+    """
+    if listener in _listeners:
+        _listeners.remove(listener)
+
+
+def notify(model, action: str, instance) -> None:
+    """
+    Tells all listeners about a change
+    :param model: type: model class
+    :param action: str: 'created', 'updated' or 'deleted'
+    :param instance: Model: the row
+    :returns: None
+    """
+    for listener in list(_listeners):
+        listener(model, action, instance)
+
+
+def after_commit(callback) -> None:
+    """
+    Runs a callable once the transaction of the current thread commits,
+    at once outside a transaction. Rolled back transactions drop it.
+    :param callback: callable: called without arguments
+    :returns: None
+    """
+    obj = database.obj
+    if not obj.in_transaction():
+        callback()
+        return
+
+    if hasattr(obj, "after_commit"):
+        # peewee 4
+        try:
+            obj.after_commit(callback)
+        except ValueError:
+            # manual_commit(): the caller commits, nothing to wait for
+            callback()
+        return
+
+    # peewee 3: the outermost transaction of this thread commits
+    transaction = obj._state.transactions[0]  # pylint: disable=protected-access
+    callbacks = transaction.__dict__.get("_after_commit")
+    if callbacks is None:
+        callbacks = transaction.__dict__["_after_commit"] = []
+        commit = transaction.commit
+
+        def commit_then(*args, **kwargs):
+            result = commit(*args, **kwargs)
+            todo, callbacks[:] = list(callbacks), []
+            for pending in todo:
+                pending()
+            return result
+
+        transaction.commit = commit_then
+
+    callbacks.append(callback)
 
 
 class BaseModel(Model):  # pylint: disable=too-few-public-methods
     """
     Basics used for Models
     """
+    # write WGChange rows for the changes of an instance, in its transaction
+    _logged = False
 
     def get_dict(self):
         """
@@ -42,6 +172,63 @@ class BaseModel(Model):  # pylint: disable=too-few-public-methods
         """
         return self.__dict__["__data__"]
 
+    def logged(self) -> tuple:
+        """
+        Change log entry of a change of the row, see WGChange
+        :returns: (table, row id, parent id)
+        :rtype: tuple
+        """
+        return (self._meta.table_name, self.id, None)
+
+    def save(self, force_insert: bool = False, only: list = None):
+        """
+        Saves the row, logs the change and notifies the listeners
+        :param force_insert: bool: Force INSERT query
+        :param only: list/tuple: optional list of fields to be updated/inserted.
+        :returns: Number of rows modified.
+        :rtype: int
+        """
+        created = force_insert or self._pk is None
+        action = "created" if created else "updated"
+
+        if not self._logged:
+            rows = super().save(force_insert=force_insert, only=only)
+        else:
+            # within an open transaction the row and its entry commit together anyway
+            with nullcontext() if database.in_transaction() else database.atomic():
+                rows = super().save(force_insert=force_insert, only=only)
+                if rows:
+                    WGChange.insert_many([self.logged() + (action,)], fields=CHANGE_FIELDS).execute()
+
+        if rows and _listeners:
+            notify(type(self), action, self)
+
+        return rows
+
+    def delete_instance(self, recursive: bool = False, delete_nullable: bool = False):
+        """
+        Deletes the row, logs its tombstones and notifies the listeners
+        :param recursive: bool: delete dependent rows too
+        :param delete_nullable: bool: delete dependent rows with nullable references too
+        :returns: Number of rows deleted.
+        :rtype: int
+        """
+        if not self._logged:
+            rows = super().delete_instance(recursive=recursive, delete_nullable=delete_nullable)
+        else:
+            with database.atomic():
+                tombstones = self.tombstones()
+                rows = super().delete_instance(recursive=recursive, delete_nullable=delete_nullable)
+                if rows:
+                    WGChange.insert_many(
+                        [tombstone + ("deleted",) for tombstone in tombstones], fields=CHANGE_FIELDS
+                    ).execute()
+
+        if rows and _listeners:
+            notify(type(self), "deleted", self)
+
+        return rows
+
     class Meta:  # pylint: disable=too-few-public-methods
         """
         Pull in basics from Model like id field, database
@@ -66,7 +253,7 @@ class WGData(BaseModel):
     wg_address = CharField(index=True)
     wg_saveconfig = BooleanField(null=True)
     wg_dns = CharField(null=True)
-    wg_publickey = CharField(max_length=48, null=True)
+    wg_publickey = CharField(max_length=48, null=True, index=True)
     wg_privatekey = CharField(max_length=48, null=True, unique=True)
     wg_presharedkey = CharField(max_length=48, null=True)
     wg_endpoint = CharField(null=True, index=True)
@@ -84,10 +271,13 @@ class WGData(BaseModel):
     is_connected = BooleanField(default=False)
     # revision part
     is_readonly = BooleanField(default=False)
-    updated = DateTimeField(default=datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
-    created = DateTimeField(default=datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+    updated = DateTimeField(default=timestamp, index=True)
+    created = DateTimeField(default=timestamp)
     # other ref: ref to a host table if you use this
     host_id = IntegerField(index=True, null=True)
+    # WGImport run the row came from
+    import_batch = CharField(max_length=32, null=True, index=True)
+    _logged = True
 
     def save(self, force_insert: bool = False, only: list = None):
         """
@@ -100,10 +290,62 @@ class WGData(BaseModel):
 
         # if this row is new (id=None), default will apply
         if not force_insert:
-            self.updated = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            self.updated = timestamp()
 
         return super().save(force_insert=force_insert, only=only)
 
+    def tombstones(self) -> list:
+        """
+        Tombstones of a deletion: one for the row and one per parent,
+        whose config lists this row as peer
+        :returns: list of (table, row id, parent id)
+        :rtype: list
+        """
+        parents = WGRelation.select(WGRelation.WGParent).where(WGRelation.WGPeer == self.id)
+        return [("WGData", self.id, None)] + [
+            ("WGData", self.id, row[0]) for row in database.execute(parents)
+        ]
+
+    @classmethod
+    def stream(cls, *fields, enabled_only: bool = False, interface: str = None, host_id: int = None,
+               where=None, order: str = "id", chunk: int = 2000):
+        """
+        Streams rows of any table size in keyset-paginated chunks, see WGReader
+        :param fields: fields to read (default: all)
+        :param enabled_only: bool: rows with is_enabled only
+        :param interface: str: a server by its wg_interface and its peers
+        :param host_id: int: rows of a host
+        :param where: peewee expression, optional, and-ed with the filters
+        :param order: str: "id" or "updated" (ties by id)
+        :param chunk: int: rows per query, None reads all through one
+                server-side (postgresql) or unbuffered (mysql) cursor
+        :returns: namedtuple rows
+        :rtype: WGReader
+        """
+        from .reader import WGReader  # pylint: disable=import-outside-toplevel,E0402
+
+        filters = [] if where is None else [where]
+        if enabled_only:
+            filters.append(cls.is_enabled == True)  # pylint: disable=singleton-comparison
+
+        if host_id is not None:
+            filters.append(cls.host_id == host_id)
+
+        if interface is not None:
+            parent = cls.alias()
+            peers = (
+                WGRelation.select(WGRelation.WGPeer)
+                .join(parent, on=(WGRelation.WGParent == parent.id))
+                .where(parent.wg_interface == interface)
+            )
+            filters.append((cls.wg_interface == interface) | cls.id.in_(peers))
+
+        condition = None
+        for expression in filters:
+            condition = expression if condition is None else condition & expression
+
+        return WGReader(*fields, where=condition, order=order, chunk=chunk)
+
     class Meta:  # pylint: disable=too-few-public-methods
         """
         mostly derived from BaseModel
@@ -117,7 +359,24 @@ class WGRelation(BaseModel):
     """
     WGParent = ForeignKeyField(WGData, backref="Parent")
     WGPeer = ForeignKeyField(WGData, backref="Peer")
-    created = DateTimeField(default=datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+    created = DateTimeField(default=timestamp, index=True)
+    _logged = True
+
+    def logged(self) -> tuple:
+        """
+        Change log entry of a change of the edge, the parent's config changes
+        :returns: (table, row id, parent id)
+        :rtype: tuple
+        """
+        return ("WGRelation", self.id, self.WGParent_id)
+
+    def tombstones(self) -> list:
+        """
+        Tombstone of a deletion, the parent's config lost a peer
+        :returns: list of (table, row id, parent id)
+        :rtype: list
+        """
+        return [self.logged()]
 
     class Meta:  # pylint: disable=too-few-public-methods
         """
@@ -127,4 +386,120 @@ class WGRelation(BaseModel):
         indexes = ((("WGParent", "WGPeer"), True),)
 
 
-MODELS = (WGData, WGRelation)
+class WGKeyPool(BaseModel):
+    """
+    Pre-generated key pairs, handed out once by the key service
+    """
+    privatekey = CharField(max_length=48, unique=True)
+    publickey = CharField(max_length=48)
+    created = DateTimeField(default=timestamp)
+
+    class Meta:  # pylint: disable=too-few-public-methods
+        """
+        mostly derived from BaseModel
+        """
+        table_name = "WGKeyPool"
+
+
+class WGSchema(BaseModel):
+    """
+    Schema marker: version and hash of the model definitions in use
+    """
+    version = IntegerField()
+    schema_hash = CharField(max_length=64)
+    updated = DateTimeField(default=timestamp)
+
+    class Meta:  # pylint: disable=too-few-public-methods
+        """
+        mostly derived from BaseModel
+        """
+        table_name = "WGSchema"
+
+
+class WGPeerState(BaseModel):
+    """
+    Runtime state of a peer as reported by 'wg show', one row per peer
+    """
+    peer = ForeignKeyField(WGData, backref="State", unique=True)
+    interface = CharField(max_length=16)
+    endpoint = CharField(null=True)
+    handshake = DateTimeField(null=True)
+    rx = BigIntegerField(default=0)
+    tx = BigIntegerField(default=0)
+    is_connected = BooleanField(default=False)
+    updated = DateTimeField(default=timestamp)
+
+    class Meta:  # pylint: disable=too-few-public-methods
+        """
+        mostly derived from BaseModel
+        """
+        table_name = "WGPeerState"
+
+
+class WGTraffic(BaseModel):
+    """
+    Peer traffic history: bytes transferred per bucket and resolution
+    (0 = raw samples, 60, 3600, 86400 seconds), times as epoch seconds
+    """
+    peer_id = IntegerField()
+    resolution = IntegerField()
+    # 64 bit, a mysql INT ends in 2038
+    bucket = BigIntegerField()
+    rx = BigIntegerField(default=0)
+    tx = BigIntegerField(default=0)
+    handshake = BigIntegerField(null=True)
+    samples = IntegerField(default=1)
+
+    class Meta:  # pylint: disable=too-few-public-methods
+        """
+        mostly derived from BaseModel
+        """
+        table_name = "WGTraffic"
+        indexes = (
+            (("resolution", "peer_id", "bucket"), True),
+            (("resolution", "bucket"), False),
+        )
+
+
+class WGChange(BaseModel):
+    """
+    Change log read by the change feed, written in the transaction of the
+    change: by model instances of WGData and WGRelation, by bulk writers
+    through bulk.log_changes(). The autoincrement id orders the changes.
+    A row id of None stands for rows not known by id, e.g. the edges
+    of a parent inserted in bulk.
+    """
+    row_table = CharField(max_length=24)
+    row_id = IntegerField(null=True)
+    parent_id = IntegerField(null=True)
+    # 'created', 'updated' or 'deleted'
+    action = CharField(max_length=8)
+    changed = DateTimeField(default=timestamp, index=True)
+
+    class Meta:  # pylint: disable=too-few-public-methods
+        """
+        mostly derived from BaseModel
+        """
+        table_name = "WGChange"
+
+
+# WGChange fields written per change, in the order of logged() plus the action
+CHANGE_FIELDS = (WGChange.row_table, WGChange.row_id, WGChange.parent_id, WGChange.action)
+
+
+class WGShardMap(BaseModel):
+    """
+    Shard of each shard key value (e.g. host_id), kept in the first shard
+    """
+    key = CharField(max_length=80, unique=True)
+    shard = CharField(max_length=24)
+    updated = DateTimeField(default=timestamp)
+
+    class Meta:  # pylint: disable=too-few-public-methods
+        """
+        mostly derived from BaseModel
+        """
+        table_name = "WGShardMap"
+
+
+MODELS = (WGData, WGRelation, WGKeyPool, WGChange, WGPeerState, WGTraffic, WGShardMap)
@@ -0,0 +1,223 @@
+# -*- coding: utf-8 -*-
+__version__ = "0.1.0"
+__license__ = "GPLv3"
+__docformat__ = "reStructuredText"
+
+import threading
+from array import array
+from bisect import bisect_left
+from collections import deque
+from .tables import add_listener, remove_listener, WGData, WGRelation  # pylint: disable=E0402
+
+EMPTY = array("q")
+
+
+class WGTopology:
+    """
+    In-memory graph of WGRelation: parent -> peers and peer -> parents
+    as compact integer arrays, sorted so an edge is found by bisection. Loaded with one query, afterwards kept up
+    to date by changes made through model instances.
+    Bulk queries and rolled back transactions are not seen, load() again then.
+    """
+
+    def __init__(self, *, watch: bool = True):
+        """
+        :param watch: bool: follow changes made through the models
+        ivar _peers: dict: parent id -> sorted array of peer ids
+        ivar _parents: dict: peer id -> sorted array of parent ids
+        """
+        self._lock = threading.RLock()
+        self._peers = {}
+        self._parents = {}
+        self._watching = False
+        self.load()
+
+        if watch:
+            add_listener(self._changed)
+            self._watching = True
+
+    def load(self) -> int:
+        """
+        Reads all relations
+        :returns: number of relations
+        :rtype: int
+        """
+        peers, parents = {}, {}
+        # sorted by parent, then peer: both kinds of arrays are built sorted
+        query = WGRelation.select(WGRelation.WGParent, WGRelation.WGPeer).order_by(
+            WGRelation.WGParent, WGRelation.WGPeer
+        ).tuples()
+
+        count = 0
+        for parent, peer in query.iterator():
+            peers.setdefault(parent, array("q")).append(peer)
+            parents.setdefault(peer, array("q")).append(parent)
+            count += 1
+
+        with self._lock:
+            self._peers, self._parents = peers, parents
+
+        return count
+
+    def close(self) -> None:
+        """
+        Stops following changes
+        :returns: None
+        """
+        if self._watching:
+            remove_listener(self._changed)
+            self._watching = False
+
+    def _add(self, parent: int, peer: int) -> None:
+        with self._lock:
+            peers = self._peers.setdefault(parent, array("q"))
+            position = bisect_left(peers, peer)
+            if position == len(peers) or peers[position] != peer:
+                # mostly appended, ids grow
+                peers.insert(position, peer)
+                parents = self._parents.setdefault(peer, array("q"))
+                parents.insert(bisect_left(parents, parent), parent)
+
+    def _remove(self, parent: int, peer: int) -> None:
+        with self._lock:
+            for index, key, value in ((self._peers, parent, peer), (self._parents, peer, parent)):
+                values = index.get(key)
+                if values is None:
+                    continue
+
+                position = bisect_left(values, value)
+                if position < len(values) and values[position] == value:
+                    del values[position]
+                    if not values:
+                        del index[key]
+
+    def _drop(self, node: int) -> None:
+        with self._lock:
+            for peer in tuple(self._peers.get(node, EMPTY)):
+                self._remove(node, peer)
+            for parent in tuple(self._parents.get(node, EMPTY)):
+                self._remove(parent, node)
+
+    def _changed(self, model, action: str, instance) -> None:
+        """
+        Listener for model changes
+        """
+        if model is WGRelation:
+            if "created" == action:
+                self._add(instance.WGParent_id, instance.WGPeer_id)
+            elif "deleted" == action:
+                self._remove(instance.WGParent_id, instance.WGPeer_id)
+            else:
+                # an update may have moved the edge, the old one is unknown
+                self.load()
+
+        elif model is WGData and "deleted" == action:
+            self._drop(instance.id)
+
+    def add(self, parent: int, peer: int) -> None:
+        """
+        Adds edges written by bulk queries, e.g. insert_many
+        :param parent: int: WGData id of the parent
+        :param peer: int: WGData id of the peer
+        :returns: None
+        """
+        self._add(parent, peer)
+
+    def peers(self, node: int) -> tuple:
+        """
+        Gets the peers of a node ("who are the peers of hub X")
+        :param node: int: WGData id
+        :returns: peer ids
+        :rtype: tuple
+        """
+        with self._lock:
+            return tuple(self._peers.get(node, EMPTY))
+
+    def parents(self, node: int) -> tuple:
+        """
+        Gets the parents of a node ("which hubs does this peer connect to")
+        :param node: int: WGData id
+        :returns: parent ids
+        :rtype: tuple
+        """
+        with self._lock:
+            return tuple(self._parents.get(node, EMPTY))
+
+    def neighbours(self, node: int) -> set:
+        """
+        Gets the nodes connected to a node in either direction
+        :param node: int: WGData id
+        :returns: ids
+        :rtype: set
+        """
+        with self._lock:
+            return set(self._peers.get(node, EMPTY)) | set(self._parents.get(node, EMPTY))
+
+    def degree(self, node: int) -> int:
+        """
+        Gets the number of edges of a node in either direction
+        :param node: int: WGData id
+        :returns: degree
+        :rtype: int
+        """
+        with self._lock:
+            return len(self._peers.get(node, EMPTY)) + len(self._parents.get(node, EMPTY))
+
+    def reachable(self, node: int, hops: int = 2) -> set:
+        """
+        Gets the nodes within a number of hops, the node itself excluded
+        :param node: int: WGData id
+        :param hops: int: maximum distance
+        :returns: ids
+        :rtype: set
+        """
+        seen = {node}
+        frontier = [node]
+
+        with self._lock:
+            for _ in range(hops):
+                following = []
+                for current in frontier:
+                    for neighbour in self.neighbours(current) - seen:
+                        seen.add(neighbour)
+                        following.append(neighbour)
+                frontier = following
+
+        seen.discard(node)
+        return seen
+
+    def path(self, source: int, target: int) -> list:
+        """
+        Gets a shortest path between two nodes in either direction
+        :param source: int: WGData id
+        :param target: int: WGData id
+        :returns: ids from source to target, or None if not connected
+        :rtype: list
+        """
+        previous = {source: None}
+        queue = deque([source])
+
+        with self._lock:
+            while queue:
+                current = queue.popleft()
+                if current == target:
+                    path = []
+                    while current is not None:
+                        path.append(current)
+                        current = previous[current]
+                    return path[::-1]
+
+                for neighbour in self.neighbours(current):
+                    if neighbour not in previous:
+                        previous[neighbour] = current
+                        queue.append(neighbour)
+
+        return None
+
+    def __len__(self) -> int:
+        """
+        Returns the number of edges
+        """
+        with self._lock:
+            return sum(len(peers) for peers in self._peers.values())
+
@@ -0,0 +1,244 @@
+# -*- coding: utf-8 -*-
+__version__ = "0.1.0"
+__license__ = "GPLv3"
+__docformat__ = "reStructuredText"
+
+import threading
+import time
+from peewee import fn, MySQLDatabase, NodeList, SQL, Value
+from .bulk import insert_rows  # pylint: disable=E0402
+from .tables import database, WGTraffic  # pylint: disable=E0402
+
+# resolutions in seconds, 0 = raw samples, each rolled up from the one before
+RESOLUTIONS = (0, 60, 3600, 86400)
+# seconds each resolution is kept, None keeps it forever
+RETENTION = {0: 2 * 86400, 60: 14 * 86400, 3600: 90 * 86400, 86400: None}
+# rows deleted per statement while pruning
+PRUNE_CHUNK = 5000
+
+
+def _floor(resolution: int):
+    """
+    SQL expression of WGTraffic.bucket rounded down to a resolution,
+    by integer division ('%' is a LIKE in peewee, '/' a decimal in MySQL)
+    """
+    if isinstance(database.obj, MySQLDatabase):
+        return NodeList((WGTraffic.bucket, SQL("DIV"), Value(resolution))) * resolution
+
+    return WGTraffic.bucket / resolution * resolution
+
+
+class WGTrafficStore:
+    """
+    Time series of peer traffic in WGTraffic, keyed by WGData.id.
+    Samples are the byte counters of 'wg show', stored as the bytes
+    transferred since the previous sample, so rollups are plain sums and
+    a counter reset (interface restart) does not produce negative traffic.
+    Raw samples are appended in batches; completed minutes, hours and days
+    are rolled up as their time passes, samples arriving later for a
+    bucket rolled up already are kept raw only.
+    """
+
+    def __init__(self, *, retention: dict = None):
+        """
+        :param retention: dict: resolution -> seconds kept, see RETENTION
+        ivar _counters: dict: peer id -> (rx, tx) of the previous sample
+        ivar _rolled: int: epoch minute the rollups were run for
+        """
+        self._retention = dict(RETENTION if retention is None else retention)
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._rolled = None
+
+    def append(self, samples, now: float = None) -> int:
+        """
+        Stores one scrape of counters and rolls up finished buckets
+        :param samples: iterable of (peer id, rx, tx, handshake epoch or None)
+        :param now: float: epoch seconds of the scrape (default: now)
+        :returns: rows written
+        :rtype: int
+        """
+        now = int(time.time() if now is None else now)
+        rows = []
+
+        with self._lock:
+            for peer_id, rx, tx, handshake in samples:
+                previous = self._counters.get(peer_id)
+                self._counters[peer_id] = (rx, tx)
+                if previous is None:
+                    # the first sample only sets the baseline
+                    continue
+
+                rows.append((
+                    peer_id, 0, now,
+                    rx - previous[0] if rx >= previous[0] else rx,
+                    tx - previous[1] if tx >= previous[1] else tx,
+                    handshake or None,
+                ))
+
+        fields = (
+            WGTraffic.peer_id, WGTraffic.resolution, WGTraffic.bucket,
+            WGTraffic.rx, WGTraffic.tx, WGTraffic.handshake,
+        )
+        with database.atomic():
+            written = insert_rows(WGTraffic, fields, rows, ignore=True)
+
+        if self._rolled != now // 60:
+            self.rollup(now)
+
+        return written
+
+    def rollup(self, now: float = None) -> int:
+        """
+        Aggregates the completed buckets of each resolution from the finer one
+        :param now: float: epoch seconds (default: now)
+        :returns: rows written
+        :rtype: int
+        """
+        now = int(time.time() if now is None else now)
+        written = 0
+
+        with database.atomic():
+            for source, resolution in zip(RESOLUTIONS, RESOLUTIONS[1:]):
+                written += self._rollup(source, resolution, now - now % resolution)
+
+        self._rolled = now // 60
+        return written
+
+    @staticmethod
+    def _rollup(source: int, resolution: int, end: int) -> int:
+        """
+        Aggregates the source rows of buckets from the last rollup until end
+        """
+        latest = (
+            WGTraffic.select(fn.MAX(WGTraffic.bucket))
+            .where(WGTraffic.resolution == resolution)
+            .scalar()
+        )
+        if latest is None:
+            start = (
+                WGTraffic.select(fn.MIN(WGTraffic.bucket))
+                .where(WGTraffic.resolution == source)
+                .scalar()
+            )
+            if start is None:
+                return 0
+            start -= start % resolution
+        else:
+            start = latest + resolution
+
+        if start >= end:
+            return 0
+
+        bucket = _floor(resolution)
+        query = (
+            WGTraffic.select(
+                WGTraffic.peer_id,
+                Value(resolution),
+                bucket,
+                fn.SUM(WGTraffic.rx),
+                fn.SUM(WGTraffic.tx),
+                fn.MAX(WGTraffic.handshake),
+                fn.SUM(WGTraffic.samples),
+            )
+            .where(
+                (WGTraffic.resolution == source)
+                & (WGTraffic.bucket >= start)
+                & (WGTraffic.bucket < end)
+            )
+            .group_by(WGTraffic.peer_id, bucket)
+        )
+        fields = [
+            WGTraffic.peer_id, WGTraffic.resolution, WGTraffic.bucket, WGTraffic.rx,
+            WGTraffic.tx, WGTraffic.handshake, WGTraffic.samples,
+        ]
+        return database.execute(WGTraffic.insert_from(query, fields).on_conflict_ignore()).rowcount
+
+    def prune(self, now: float = None, max_chunks: int = None) -> int:
+        """
+        Deletes rows older than their retention, in chunks of PRUNE_CHUNK
+        rows, each in its own transaction, so writers are never blocked long
+        :param now: float: epoch seconds (default: now)
+        :param max_chunks: int: stop after this many chunks, None until done
+        :returns: rows deleted
+        :rtype: int
+        """
+        now = int(time.time() if now is None else now)
+        deleted = chunks = 0
+
+        for resolution, seconds in sorted(self._retention.items()):
+            if seconds is None:
+                continue
+
+            while max_chunks is None or chunks < max_chunks:
+                ids = [
+                    row[0] for row in database.execute(
+                        WGTraffic.select(WGTraffic.id)
+                        .where((WGTraffic.resolution == resolution) & (WGTraffic.bucket < now - seconds))
+                        .limit(PRUNE_CHUNK)
+                    )
+                ]
+                if not ids:
+                    break
+
+                with database.atomic():
+                    deleted += WGTraffic.delete().where(WGTraffic.id.in_(ids)).execute()
+                chunks += 1
+
+        return deleted
+
+    def resolution(self, start: float, end: float, points: int = 300, now: float = None) -> int:
+        """
+        Picks the coarsest resolution that still gives the number of points
+        for the range and is kept long enough to cover its start
+        :param start: float: epoch seconds
+        :param end: float: epoch seconds
+        :param points: int: data points wanted at least
+        :param now: float: epoch seconds (default: now)
+        :returns: resolution in seconds, 0 for raw samples
+        :rtype: int
+        """
+        now = time.time() if now is None else now
+        step = (end - start) / max(1, points)
+
+        fits = [
+            resolution for resolution in RESOLUTIONS
+            if resolution <= step or 0 == resolution
+        ]
+        for resolution in reversed(fits):
+            seconds = self._retention.get(resolution)
+            if seconds is None or start >= now - seconds:
+                return resolution
+
+        # nothing kept long enough at the needed detail, take the longest kept
+        for resolution in RESOLUTIONS[len(fits):]:
+            seconds = self._retention.get(resolution)
+            if seconds is None or start >= now - seconds:
+                return resolution
+
+        return RESOLUTIONS[-1]
+
+    def series(self, peer_id: int, start: float, end: float, points: int = 300, now: float = None) -> dict:
+        """
+        Reads the traffic of a peer within a range at a fitting resolution
+        :param peer_id: int: WGData id
+        :param start: float: epoch seconds, included
+        :param end: float: epoch seconds, excluded
+        :param points: int: data points wanted at least, see resolution()
+        :param now: float: epoch seconds (default: now)
+        :returns: dict with resolution and points: list of (bucket, rx, tx, handshake)
+        :rtype: dict
+        """
+        resolution = self.resolution(start, end, points, now)
+        query = (
+            WGTraffic.select(WGTraffic.bucket, WGTraffic.rx, WGTraffic.tx, WGTraffic.handshake)
+            .where(
+                (WGTraffic.resolution == resolution)
+                & (WGTraffic.peer_id == peer_id)
+                & (WGTraffic.bucket >= int(start))
+                & (WGTraffic.bucket < int(end))
+            )
+            .order_by(WGTraffic.bucket)
+        )
+
+        return {"resolution": resolution, "points": list(database.execute(query))}
@@ -0,0 +1,405 @@
+# -*- coding: utf-8 -*-
+__version__ = "0.1.0"
+__license__ = "GPLv3"
+__docformat__ = "reStructuredText"
+
+import os
+import queue
+import socket
+import threading
+import time
+from concurrent.futures import Future
+from multiprocessing.connection import Client, Listener
+from peewee import SqliteDatabase
+from .constants import WRITER_SOCKET_PATH  # pylint: disable=E0402
+from .tables import database  # pylint: disable=E0402
+
+# writes grouped into one transaction at most
+BATCH_SIZE = 100
+# seconds the first write of a batch waits for more
+MAX_LATENCY = 0.005
+
+# put on the queue by stop()
+_STOP = object()
+
+
+class WGWriteQueue:
+    """
+    Single writer for sqlite: writes of all threads are queued and run by
+    one thread, grouped into one transaction per batch. Each write runs in
+    its own savepoint, a failing write does not roll back the others.
+    Callers get a Future, resolved once the batch is committed.
+    Writes are grouped within this process only; other processes hand
+    theirs to a WGWriteServer by a WGWriteClient instead of writing the
+    file themselves.
+    """
+
+    def __init__(self, *, batch_size: int = BATCH_SIZE, max_latency: float = MAX_LATENCY):
+        """
+        :param batch_size: int: writes per transaction at most
+        :param max_latency: float: seconds a batch waits for more writes
+        ivar _queue: queue.Queue: (future, function, args, kwargs)
+        ivar _stats: dict: writes, batches and failed counters
+        """
+        if not isinstance(batch_size, int) or batch_size < 1:
+            raise ValueError('"batch_size" must be a positive integer')
+
+        self._batch_size = batch_size
+        self._max_latency = max_latency
+        self._queue = queue.Queue()
+        self._stats = {"writes": 0, "batches": 0, "failed": 0}
+        self._worker = None
+
+    @property
+    def stats(self) -> dict:
+        """
+        Gets the counters since start
+        :returns: writes, batches and failed writes
+        :rtype: dict
+        """
+        return dict(self._stats)
+
+    def start(self) -> None:
+        """
+        Starts the writer thread
+        :returns: None
+        """
+        if self._worker is None:
+            self._worker = threading.Thread(target=self._run, name="wireguard_db-writer", daemon=True)
+            self._worker.start()
+
+    def stop(self) -> None:
+        """
+        Writes everything queued so far and stops the writer thread
+        :returns: None
+        """
+        if self._worker is not None:
+            self._queue.put(_STOP)
+            self._worker.join()
+            self._worker = None
+
+    def submit(self, function, *args, **kwargs) -> Future:
+        """
+        Queues a write
+        :param function: callable: run within the writer's transaction
+        :returns: Future of the function's result
+        :rtype: Future
+        """
+        if self._worker is None:
+            raise RuntimeError("The write queue is not started")
+
+        future = Future()
+        self._queue.put((future, function, args, kwargs))
+        return future
+
+    def save(self, instance, **kwargs) -> Future:
+        """
+        Queues instance.save()
+        :param instance: Model: row to save
+        :returns: Future of the rows modified
+        :rtype: Future
+        """
+        return self.submit(instance.save, **kwargs)
+
+    def delete(self, instance, **kwargs) -> Future:
+        """
+        Queues instance.delete_instance()
+        :param instance: Model: row to delete
+        :returns: Future of the rows deleted
+        :rtype: Future
+        """
+        return self.submit(instance.delete_instance, **kwargs)
+
+    def execute(self, query) -> Future:
+        """
+        Queues a query, e.g. WGData.update(...).where(...)
+        :param query: peewee query
+        :returns: Future of query.execute()
+        :rtype: Future
+        """
+        return self.submit(query.execute)
+
+    def _collect(self, first) -> tuple:
+        """
+        Takes writes from the queue until the batch is full or its time is up
+        :returns: (batch, stop requested)
+        """
+        batch = [first]
+        deadline = time.monotonic() + self._max_latency
+
+        while len(batch) < self._batch_size:
+            timeout = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+
+            if item is _STOP:
+                return batch, True
+            batch.append(item)
+
+        return batch, False
+
+    def _write(self, batch: list) -> None:
+        """
+        Runs a batch in one transaction and resolves its futures after commit
+        """
+        results = []
+        # a write transaction right away, no upgrade from a read lock
+        transaction = database.atomic("IMMEDIATE") if isinstance(database.obj, SqliteDatabase) else database.atomic()
+
+        try:
+            with transaction:
+                for future, function, args, kwargs in batch:
+                    if not future.set_running_or_notify_cancel():
+                        continue
+                    try:
+                        with database.atomic():
+                            results.append((future, function(*args, **kwargs), None))
+                    except Exception as error:  # pylint: disable=broad-except
+                        results.append((future, None, error))
+        except Exception as error:  # pylint: disable=broad-except
+            # BEGIN or COMMIT failed, e.g. locked by another process:
+            # nothing of the batch was written
+            for future, *_ in batch:
+                if not future.done():
+                    future.set_exception(error)
+                    self._stats["failed"] += 1
+            return
+
+        for future, result, error in results:
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+                self._stats["failed"] += 1
+
+        self._stats["writes"] += len(results)
+        self._stats["batches"] += 1
+
+    def _run(self) -> None:
+        """
+        The writer thread
+        """
+        with database.connection_context():
+            stop = False
+            while not stop:
+                first = self._queue.get()
+                if first is _STOP:
+                    break
+
+                batch, stop = self._collect(first)
+                self._write(batch)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *_):
+        self.stop()
+
+
+class WGWriteServer:
+    """
+    Process-level front end of a WGWriteQueue: the one process writing a
+    sqlite file. Other processes send their writes by WGWriteClient over a
+    Unix socket and get each result or error back once its batch is
+    committed. Writes of all clients are batched together, so no process
+    waits for the file lock.
+    Requests are pickled: model instances and module level functions
+    with picklable arguments can be sent. The socket is made accessible to
+    its owner only, authkey adds a challenge on connect.
+    """
+
+    def __init__(self, path: str = WRITER_SOCKET_PATH, *, authkey: bytes = None, **options):
+        """
+        :param path: str: socket file, replaced if it exists
+        :param authkey: bytes: shared secret of server and clients, optional
+        :param options: batch_size and max_latency of the WGWriteQueue
+        ivar _queue: WGWriteQueue: runs the writes of all clients
+        ivar _listener: multiprocessing.connection.Listener: while started
+        """
+        self._path = path
+        self._authkey = authkey
+        self._queue = WGWriteQueue(**options)
+        self._listener = None
+        self._acceptor = None
+        self._stopping = False
+
+    @property
+    def stats(self) -> dict:
+        """
+        Gets the counters of the write queue
+        :returns: writes, batches and failed writes
+        :rtype: dict
+        """
+        return self._queue.stats
+
+    def start(self) -> None:
+        """
+        Starts the write queue and takes connections
+        :returns: None
+        """
+        if self._listener is not None:
+            return
+
+        self._queue.start()
+        self._stopping = False
+        if os.path.exists(self._path):
+            os.unlink(self._path)
+        self._listener = Listener(self._path, family="AF_UNIX", authkey=self._authkey)
+        os.chmod(self._path, 0o600)
+
+        self._acceptor = threading.Thread(target=self._accept, name="wireguard_db-writer-accept", daemon=True)
+        self._acceptor.start()
+
+    def stop(self) -> None:
+        """
+        Takes no more connections, writes everything queued so far
+        :returns: None
+        """
+        if self._listener is None:
+            return
+
+        # a closed socket does not wake accept(), a connection does
+        self._stopping = True
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as wake:
+            wake.connect(self._path)
+        self._acceptor.join()
+        self._listener.close()
+        self._listener = self._acceptor = None
+        self._queue.stop()
+
+    def _accept(self) -> None:
+        """
+        Takes connections, one thread each, until stop()
+        """
+        while not self._stopping:
+            try:
+                connection = self._listener.accept()
+            except Exception:  # pylint: disable=broad-except
+                # failed authentication or handshake of one client
+                continue
+
+            if self._stopping:
+                connection.close()
+                break
+            threading.Thread(target=self._serve, args=(connection,), daemon=True).start()
+
+    def _serve(self, connection) -> None:
+        """
+        Answers the requests of one client, one at a time
+        """
+        with connection:
+            while True:
+                try:
+                    action, target, args, kwargs = connection.recv()
+                except (EOFError, OSError):
+                    break
+
+                try:
+                    if "save" == action:
+                        rows = self._queue.save(target, **kwargs).result()
+                        answer = (True, (rows, target._pk))  # pylint: disable=protected-access
+                    elif "delete" == action:
+                        answer = (True, self._queue.delete(target, **kwargs).result())
+                    else:
+                        answer = (True, self._queue.submit(target, *args, **kwargs).result())
+                except Exception as error:  # pylint: disable=broad-except
+                    answer = (False, error)
+
+                try:
+                    connection.send(answer)
+                except (OSError, ValueError):
+                    break
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *_):
+        self.stop()
+
+
+class WGWriteClient:
+    """
+    Client of WGWriteServer, one connection for any number of writes.
+    Calls block until the write is committed by the server.
+    """
+
+    def __init__(self, path: str = WRITER_SOCKET_PATH, *, authkey: bytes = None):
+        """
+        :param path: str: socket file of the server
+        :param authkey: bytes: as given to the server
+        ivar _connection: multiprocessing.connection.Connection: on first write
+        """
+        self._path = path
+        self._authkey = authkey
+        self._lock = threading.Lock()
+        self._connection = None
+
+    def close(self) -> None:
+        """
+        Closes the connection
+        :returns: None
+        """
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+    def _request(self, action: str, target, args: tuple = (), kwargs: dict = None):
+        """
+        Sends one write and waits for its result
+        """
+        with self._lock:
+            if self._connection is None:
+                self._connection = Client(self._path, family="AF_UNIX", authkey=self._authkey)
+
+            try:
+                self._connection.send((action, target, args, kwargs or {}))
+                ok, result = self._connection.recv()
+            except (EOFError, OSError):
+                self._connection.close()
+                self._connection = None
+                raise ConnectionError("The write server closed the connection") from None
+
+        if not ok:
+            raise result
+        return result
+
+    def save(self, instance, **kwargs) -> int:
+        """
+        Saves a row by the server, a new row gets its id
+        :param instance: Model: row to save
+        :returns: Number of rows modified.
+        :rtype: int
+        """
+        rows, pk = self._request("save", instance, kwargs=kwargs)
+        if rows:
+            instance._pk = pk  # pylint: disable=protected-access
+            instance._dirty.clear()  # pylint: disable=protected-access
+        return rows
+
+    def delete(self, instance, **kwargs) -> int:
+        """
+        Deletes a row by the server
+        :param instance: Model: row to delete
+        :returns: Number of rows deleted.
+        :rtype: int
+        """
+        return self._request("delete", instance, kwargs=kwargs)
+
+    def submit(self, function, *args, **kwargs):
+        """
+        Runs a module level function within the server's transaction
+        :param function: callable: picklable, e.g. a function of a module
+        :returns: the function's result
+        """
+        return self._request("call", function, args, kwargs)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
@@ -1,4 +1,11 @@
 # -*- coding: utf-8 -*-
 
 from .constants import DB_WIREGUARD_PARAMS_MAP
-from .dicts import wgdata2wireguard, MultiDict
+from .dicts import (
+    wgdata2wireguard,
+    compile_wgdata2wireguard,
+    wgdata2section,
+    config2wgdata,
+    MultiDict,
+)
+from .parser import iter_config_sources, parse_config, parse_dump
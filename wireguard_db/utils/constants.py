@@ -17,3 +17,27 @@ DB_WIREGUARD_PARAMS_MAP = {
     "wg_predown": "pre_down",
     "wg_persistentkeepalive": "keepalive",
 }
+
+WGQUICK_INTERFACE_PARAMS = {
+    # DB field : wg-quick [Interface] key
+    "wg_address": "Address",
+    "wg_listenport": "ListenPort",
+    "wg_privatekey": "PrivateKey",
+    "wg_dns": "DNS",
+    "wg_mtu": "MTU",
+    "wg_table": "Table",
+    "wg_preup": "PreUp",
+    "wg_postup": "PostUp",
+    "wg_predown": "PreDown",
+    "wg_postdown": "PostDown",
+    "wg_saveconfig": "SaveConfig",
+}
+
+WGQUICK_PEER_PARAMS = {
+    # DB field : wg-quick [Peer] key
+    "wg_publickey": "PublicKey",
+    "wg_presharedkey": "PresharedKey",
+    "wg_allowedips": "AllowedIPs",
+    "wg_endpoint": "Endpoint",
+    "wg_persistentkeepalive": "PersistentKeepalive",
+}
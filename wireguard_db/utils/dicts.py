@@ -4,7 +4,12 @@ __license__ = "GPLv3"
 __docformat__ = "reStructuredText"
 
 from collections import OrderedDict
-from .constants import DB_WIREGUARD_PARAMS_MAP
+from functools import lru_cache
+from .constants import (
+    DB_WIREGUARD_PARAMS_MAP,
+    WGQUICK_INTERFACE_PARAMS,
+    WGQUICK_PEER_PARAMS,
+)
 
 
 # idea taken from: https://stackoverflow.com/questions/9876059/parsing-configure-file-with-same-section-name-in-python
@@ -13,7 +18,13 @@ class MultiDict(OrderedDict):
     Used within configparser for multiple occurrences of a key.
     Adds unique (incremented) integer to the key
     """
-    _keys = {}
+
+    def __init__(self, *args, **kwargs):
+        """
+        ivar _keys: dict: counter per key group, lives as long as this instance
+        """
+        self._keys = {}
+        super().__init__(*args, **kwargs)
 
     def __setitem__(self, key, val):
         """
@@ -52,6 +63,49 @@ def wgdata2wireguard(row: dict) -> dict:
             if val is not None and 'wg_' == key[0:3]
         }
 
+
+@lru_cache(maxsize=64)
+def compile_wgdata2wireguard(columns: tuple):
+    """
+    Precompiles wgdata2wireguard() for rows of one query shape:
+    the column selection and translation is done once, not per row.
+    :param columns: tuple: column names in row order
+    :returns: callable(row: tuple) -> dict, same result as wgdata2wireguard()
+    :rtype: function
+    """
+    plan = tuple(
+        (index, DB_WIREGUARD_PARAMS_MAP.get(key, key[3:]))
+        for index, key in enumerate(columns)
+        if 'wg_' == key[0:3]
+    )
+
+    def translate(row: tuple) -> dict:
+        return {param: row[index] for index, param in plan if row[index] is not None}
+
+    return translate
+
+
+def wgdata2section(row: dict, section: str) -> str:
+    """
+    Renders one db record as a wg-quick config section.
+    :param row: dict: One DB row dict
+    :param section: str: 'Interface' or 'Peer'
+    :returns: the section text, ends with an empty line
+    :rtype: str
+    """
+    params = WGQUICK_INTERFACE_PARAMS if 'Interface' == section else WGQUICK_PEER_PARAMS
+
+    lines = [f'[{section}]']
+    lines.extend(
+        f'{key} = {str(row[field]).lower() if isinstance(row[field], bool) else row[field]}'
+        for field, key in params.items()
+        if row.get(field) is not None
+    )
+    lines.append('')
+
+    return '\n'.join(lines) + '\n'
+
+
 def config2wgdata(config: dict) -> dict:
     """
     Returns a dict to be witten to database.
@@ -63,10 +117,13 @@ def config2wgdata(config: dict) -> dict:
     if isinstance(config, dict):
 
         # comprehension to get comments only
+        # (keys are collected first, popping while iterating is not allowed)
         comment = ' '.join([
-            str(config.pop(key)).replace('#', '').strip()
-            for key, val in config.items()
-            if '#' == key[0:1]
+            str(key if val is None else val).replace('#', '').strip()
+            for key, val in [
+                (key, config.pop(key))
+                for key in [key for key in config if '#' == key[0:1]]
+            ]
         ])
 
         # comprehension to prefix fields with 'wg_'
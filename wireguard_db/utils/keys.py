@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+__version__ = "0.1.0"
+__license__ = "GPLv3"
+__docformat__ = "reStructuredText"
+
+import base64
+import os
+import shutil
+import subprocess
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    from cryptography.hazmat.primitives.asymmetric.x25519 import X25519PrivateKey
+    from cryptography.hazmat.primitives.serialization import Encoding, PublicFormat
+
+    HAS_CRYPTOGRAPHY = True
+except ImportError:
+    HAS_CRYPTOGRAPHY = False
+
+KEY_SIZE = 32
+# keys generated per task of a process pool
+TASK_SIZE = 500
+
+
+def _wg_pubkey(private_key: str) -> str:
+    """
+    Derives the public key by 'wg pubkey' of wireguard-tools, used if the
+    module cryptography is not installed
+    :param private_key: str: base64 encoded, clamped private key
+    :returns: base64 encoded public key
+    :rtype: str
+    """
+    wg_tool = shutil.which("wg")
+    if wg_tool is None:
+        raise ImportError(
+            'Deriving public keys needs the module "cryptography" (pip install cryptography) '
+            'or the "wg" tool of wireguard-tools'
+        )
+
+    result = subprocess.run(
+        [wg_tool, "pubkey"], input=private_key, capture_output=True, text=True, check=True
+    )
+    return result.stdout.strip()
+
+
+def _clamp(raw: bytes) -> bytes:
+    """
+    Clamps 32 random bytes to a Curve25519 private key
+    """
+    key = bytearray(raw)
+    key[0] &= 248
+    key[31] &= 127
+    key[31] |= 64
+    return bytes(key)
+
+
+def generate_private_key() -> str:
+    """
+    Generates a private key as 'wg genkey' does
+    :returns: base64 encoded key
+    :rtype: str
+    """
+    return base64.b64encode(_clamp(os.urandom(KEY_SIZE))).decode("ascii")
+
+
+def public_key(private_key: str) -> str:
+    """
+    Derives the public key as 'wg pubkey' does
+    :param private_key: str: base64 encoded private key
+    :returns: base64 encoded public key
+    :rtype: str
+    """
+    raw = _clamp(base64.b64decode(private_key))
+
+    if not HAS_CRYPTOGRAPHY:
+        return _wg_pubkey(base64.b64encode(raw).decode("ascii"))
+
+    public = (
+        X25519PrivateKey.from_private_bytes(raw)
+        .public_key()
+        .public_bytes(Encoding.Raw, PublicFormat.Raw)
+    )
+    return base64.b64encode(public).decode("ascii")
+
+
+def generate_keypair() -> tuple:
+    """
+    Generates a key pair
+    :returns: (private key, public key), base64 encoded
+    :rtype: tuple
+    """
+    private_key = generate_private_key()
+    return private_key, public_key(private_key)
+
+
+def generate_preshared_key() -> str:
+    """
+    Generates a preshared key as 'wg genpsk' does
+    :returns: base64 encoded key
+    :rtype: str
+    """
+    return base64.b64encode(os.urandom(KEY_SIZE)).decode("ascii")
+
+
+def _generate_task(count: int) -> list:
+    """
+    One process pool task
+    """
+    return [generate_keypair() for _ in range(count)]
+
+
+def generate_keypairs(count: int, *, processes: int = None) -> list:
+    """
+    Generates key pairs in batches across a process pool
+    :param count: int: number of key pairs
+    :param processes: int: worker processes (default: cpu count), 1 runs inline
+    :returns: list of (private key, public key)
+    :rtype: list
+    """
+    if not isinstance(count, int) or count < 0:
+        raise ValueError('"count" must be a non negative integer')
+
+    if 1 == processes or count <= TASK_SIZE:
+        return _generate_task(count)
+
+    tasks = [TASK_SIZE] * (count // TASK_SIZE)
+    if count % TASK_SIZE:
+        tasks.append(count % TASK_SIZE)
+
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        return [pair for pairs in executor.map(_generate_task, tasks) for pair in pairs]
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+__version__ = "0.1.0"
+__license__ = "GPLv3"
+__docformat__ = "reStructuredText"
+
+import configparser
+import tarfile
+from pathlib import Path
+from .dicts import MultiDict
+
+CONFIG_SUFFIX = ".conf"
+
+
+def iter_config_sources(path: str):
+    """
+    Streams wg-quick config files from a file, a directory or a tarball.
+    Only one file is held in memory at a time.
+    :param path: str: a .conf file, a directory of .conf files or a tarball
+    :returns: generator of (name: str, text: str), name is the file stem
+    :rtype: generator
+    """
+    source = Path(path)
+
+    if source.is_dir():
+        for configfile in sorted(source.glob("*" + CONFIG_SUFFIX)):
+            if configfile.is_file():
+                yield configfile.stem, configfile.read_text(encoding="utf8")
+
+    elif source.is_file() and tarfile.is_tarfile(str(source)):
+        with tarfile.open(str(source), "r:*") as tarball:
+            for member in tarball:
+                if not (member.isfile() and member.name.endswith(CONFIG_SUFFIX)):
+                    continue
+
+                with tarball.extractfile(member) as configfile:
+                    yield Path(member.name).stem, configfile.read().decode("utf8")
+
+    elif source.is_file():
+        yield source.stem, source.read_text(encoding="utf8")
+
+    else:
+        raise ValueError(f'"{path}" does not exist.')
+
+
+def parse_config(text: str) -> list:
+    """
+    Parses one wg-quick config into its sections.
+    Comments inside a section are kept as keys starting with '#'
+    (see config2wgdata), anything before the first section is dropped.
+    :param text: str: content of a wg-quick config file
+    :returns: list of (section: str, options: dict), section is 'Interface' or 'Peer'
+    :rtype: list
+    """
+    start = text.find("[")
+    if start < 0:
+        return []
+
+    # a fresh parser (and MultiDict counters) per config,
+    # nothing is kept once the sections are handed out
+    parser = configparser.ConfigParser(
+        dict_type=MultiDict,
+        strict=False,
+        interpolation=None,
+        comment_prefixes=(),
+        allow_no_value=True,
+    )
+    parser.read_string(text[start:])
+
+    # MultiDict numbered the section names: Interface1, Peer1, Peer2, ...
+    # pylint: disable=protected-access
+    return [
+        (section.rstrip("0123456789"), dict(options))
+        for section, options in parser._sections.items()
+    ]
+
+
+def _none(value: str):
+    """
+    'wg show' prints "(none)" or "off" for unset values
+    """
+    return None if value in ("(none)", "off") else value
+
+
+def parse_dump(source):
+    """
+    Parses the output of 'wg show all dump' into its peers.
+    Interface lines (5 columns) are skipped, peer lines have 9 columns.
+    :param source: str or iterable of lines, e.g. a file object or sys.stdin
+    :returns: generator of dict: interface, public_key, endpoint, allowed_ips,
+            handshake (epoch seconds, 0 = never), rx, tx, keepalive
+    :rtype: generator
+    """
+    lines = source.splitlines() if isinstance(source, str) else source
+
+    for line in lines:
+        columns = line.rstrip("\n").split("\t")
+        if 9 != len(columns):
+            continue
+
+        interface, public_key, _, endpoint, allowed_ips, handshake, rx, tx, keepalive = columns
+        yield {
+            "interface": interface,
+            "public_key": public_key,
+            "endpoint": _none(endpoint),
+            "allowed_ips": _none(allowed_ips),
+            "handshake": int(handshake),
+            "rx": int(rx),
+            "tx": int(tx),
+            "keepalive": None if _none(keepalive) is None else int(keepalive),
+        }